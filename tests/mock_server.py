@@ -0,0 +1,146 @@
+"""
+Local stand-in for the WINTER API server, for tests without network access
+"""
+
+import json
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from wintertoo.models import Program
+
+from winterapi import WinterAPI
+
+TEST_PROGRAM_NAME = "2024A999"
+
+TEST_PROGRAM = Program(
+    progname=TEST_PROGRAM_NAME,
+    prog_key="secret_key",
+    pi_name="Stein",
+    pi_email="someone@institute.com",
+    startdate=date(2024, 1, 1),
+    enddate=date(2099, 12, 31),
+    hours_allocated=100.0,
+)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    Request handler which dispatches to the routes of the server.
+
+    Routes return a status code and response, and optionally extra headers.
+    """
+
+    def _handle(self):
+        url = urlparse(self.path)
+        params = {key: val[0] for key, val in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode() if length > 0 else None
+
+        self.server.record(self.command, url.path, params)
+
+        route = self.server.routes.get((self.command, url.path))
+        headers = {}
+        if route is None:
+            status, response = 404, {"msg": f"Unknown path {url.path}", "body": None}
+        else:
+            status, response, *extra = route(params, body)
+            if len(extra) > 0:
+                headers = extra[0]
+
+        if isinstance(response, bytes):
+            content = response
+            content_type = "application/octet-stream"
+        else:
+            content = json.dumps(response).encode()
+            content_type = "application/json"
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for key, val in headers.items():
+            self.send_header(key, val)
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = _handle
+    do_POST = _handle
+    do_DELETE = _handle
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Threaded local server with configurable routes
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.routes = {
+            ("GET", "/ping"): lambda params, body: (200, {"msg": "pong"}),
+            ("GET", "/validation/version"): lambda params, body: (
+                200,
+                {"msg": "version", "body": "0.0.0"},
+            ),
+        }
+        self.requests = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        """
+        Base URL of the server
+
+        :return: URL
+        """
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def record(self, method: str, path: str, params: dict):
+        """
+        Record a request made to the server
+
+        :param method: HTTP method
+        :param path: Path requested
+        :param params: Request parameters
+        :return: None
+        """
+        with self._lock:
+            self.requests.append((method, path, params))
+
+    def count(self, path: str) -> int:
+        """
+        Count the requests made to a path
+
+        :param path: Path requested
+        :return: Number of requests
+        """
+        with self._lock:
+            return len([x for x in self.requests if x[1] == path])
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+def get_test_api(server: MockServer) -> WinterAPI:
+    """
+    Get a WinterAPI instance for the mock server, with in-memory credentials
+
+    :param server: Mock server
+    :return: WinterAPI instance
+    """
+    winter = WinterAPI(base_urls=server.base_url)
+    winter.fidelius.credentials.user = "user"
+    winter.fidelius.credentials.password = "password"
+    winter.fidelius.credentials.programs[TEST_PROGRAM_NAME] = TEST_PROGRAM
+    return winter
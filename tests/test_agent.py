@@ -0,0 +1,84 @@
+"""
+Tests for the credential agent
+"""
+
+import stat
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from mock_server import TEST_PROGRAM, TEST_PROGRAM_NAME, MockServer
+
+from winterapi import WinterAPI
+from winterapi.agent import (
+    AgentError,
+    AgentFidelius,
+    CredentialAgent,
+    get_fidelius,
+    is_agent_running,
+)
+from winterapi.fidelius import Fidelius
+
+
+class TestAgent(unittest.TestCase):
+    """
+    Class for testing the credential agent
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+        self.socket_path = Path(self.temp_dir.name).joinpath("agent.sock")
+
+        fidelius = Fidelius()
+        fidelius.credentials.user = "user"
+        fidelius.credentials.password = "password"
+        fidelius.credentials.programs[TEST_PROGRAM_NAME] = TEST_PROGRAM
+
+        self.agent = CredentialAgent(socket_path=self.socket_path, fidelius=fidelius)
+        self.thread = threading.Thread(target=self.agent.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.agent.shutdown()
+        self.agent.server_close()
+        self.temp_dir.cleanup()
+
+    def test_agent(self):
+        """
+        Test loading credentials from the agent
+
+        :return: None
+        """
+        self.assertTrue(is_agent_running(self.socket_path))
+        mode = stat.S_IMODE(self.socket_path.stat().st_mode)
+        self.assertEqual(mode, 0o600)
+
+        fidelius = AgentFidelius(socket_path=self.socket_path)
+        self.assertEqual(fidelius.get_user(), "user")
+        self.assertEqual(fidelius.get_password(), "password")
+        self.assertEqual(
+            fidelius.get_program_details(TEST_PROGRAM_NAME).prog_key,
+            TEST_PROGRAM.prog_key,
+        )
+
+        with MockServer() as server:
+            winter = WinterAPI(
+                base_urls=server.base_url, credential_agent=self.socket_path
+            )
+            self.assertIsInstance(winter.fidelius, AgentFidelius)
+            self.assertEqual(winter.get_auth(), ("user", "password"))
+
+        with self.assertRaises(AgentError):
+            CredentialAgent(socket_path=self.socket_path)
+
+    def test_fallback(self):
+        """
+        Test falling back to direct loading without an agent
+
+        :return: None
+        """
+        missing_path = Path(self.temp_dir.name).joinpath("missing.sock")
+        self.assertFalse(is_agent_running(missing_path))
+        fidelius = get_fidelius(socket_path=missing_path)
+        self.assertNotIsInstance(fidelius, AgentFidelius)
@@ -0,0 +1,145 @@
+"""
+Test for replaying API interactions from a cassette
+"""
+
+import json
+import logging
+import tempfile
+import unittest
+import zipfile
+from datetime import date
+from pathlib import Path
+
+from mock_server import TEST_PROGRAM_NAME, MockServer, get_test_api
+from test_image_store import IMAGE_TYPE, download_list
+from wintertoo.models import Program, ProgramImageQuery
+
+from winterapi import WinterAPI
+from winterapi.base_api import BaseAPI
+from winterapi.cassette import Cassette, CassetteMissError, build_response
+from winterapi.endpoints import DOWNLOAD_LIST_PATH, IMAGE_QUERY_PATH, PING_PATH
+
+logger = logging.getLogger(__name__)
+
+TEST_PROGRAM_KEY = "secret_key"
+
+TEST_PROGRAM = Program(
+    progname="2024A999",
+    prog_key=TEST_PROGRAM_KEY,
+    pi_name="Stein",
+    pi_email="someone@institute.com",
+    startdate=date(2024, 1, 1),
+    enddate=date(2024, 12, 31),
+)
+
+TEST_IMAGES = [
+    {"progname": "2024A999", "ra": 150.95, "dec": 17.82, "savepath": "/a.fits"},
+    {"progname": "2024A999", "ra": 150.96, "dec": 17.83, "savepath": "/b.fits"},
+]
+
+
+class TestCassette(unittest.TestCase):
+    """
+    Class for testing cassettes
+    """
+
+    def test_replay(self):
+        """
+        Test that recorded interactions are replayed without network access
+
+        :return: None
+        """
+        logger.info("Testing cassette replay")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cassette_path = Path(temp_dir).joinpath("cassette.json.gz")
+
+            recorder = Cassette(cassette_path, mode="record")
+            recorder.record_program(TEST_PROGRAM)
+            assert not cassette_path.exists()
+
+            query = ProgramImageQuery(
+                program_name=TEST_PROGRAM.progname,
+                start_date="20240101",
+                end_date="20240301",
+                kind="exposure",
+            )
+
+            recorder.record(
+                "GET",
+                IMAGE_QUERY_PATH,
+                build_response(
+                    200,
+                    json.dumps({"msg": "Found 2 images", "body": TEST_IMAGES}).encode(),
+                ),
+                params={
+                    "program_name": TEST_PROGRAM.progname,
+                    "program_api_key": TEST_PROGRAM_KEY,
+                },
+                data=BaseAPI.clean_data([query]),
+            )
+            recorder.record("GET", PING_PATH, build_response(200, b"pong"))
+            recorder.close()
+
+            with open(cassette_path, "rb") as in_f:
+                assert TEST_PROGRAM_KEY.encode() not in in_f.read()
+
+            winter = WinterAPI(cassette=Cassette(cassette_path, mode="replay"))
+
+            assert winter.ping()
+
+            res, images = winter.query_images_by_program(
+                TEST_PROGRAM.progname,
+                start_date="20240101",
+                end_date="20240301",
+                image_type="exposure",
+            )
+
+            assert res.status_code == 200
+            assert images["savepath"].tolist() == ["/a.fits", "/b.fits"]
+
+            with self.assertRaises(CassetteMissError):
+                winter.get_observatory_queue(program_name=TEST_PROGRAM.progname)
+
+    def test_replay_download(self):
+        """
+        Test that streamed downloads are recorded from file, and replayed
+
+        :return: None
+        """
+        logger.info("Testing cassette replay of downloads")
+
+        paths = ["/data/a.fits", "/data/b.fits"]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cassette_path = Path(temp_dir).joinpath("cassette.json.gz")
+
+            with MockServer() as server:
+                server.routes[("GET", DOWNLOAD_LIST_PATH)] = download_list
+                winter = get_test_api(server)
+                with Cassette(cassette_path, mode="record") as recorder:
+                    winter.cassette = recorder
+                    _, recorded_path = winter.download_image_list(
+                        TEST_PROGRAM_NAME,
+                        paths=paths,
+                        image_type=IMAGE_TYPE,
+                        output_dir=Path(temp_dir),
+                    )
+                    assert not cassette_path.exists()
+
+            entries = Cassette(cassette_path).interactions.values()
+            entry = [x for x in entries if x["url"] == DOWNLOAD_LIST_PATH][0]
+            assert "content" not in entry
+
+            output_dir = Path(temp_dir).joinpath("replay")
+            output_dir.mkdir()
+            winter = WinterAPI(cassette=Cassette(cassette_path, mode="replay"))
+            _, output_path = winter.download_image_list(
+                TEST_PROGRAM_NAME,
+                paths=paths,
+                image_type=IMAGE_TYPE,
+                output_dir=output_dir,
+            )
+            assert output_path.read_bytes() == recorded_path.read_bytes()
+            with zipfile.ZipFile(output_path) as archive:
+                assert sorted(archive.namelist()) == ["a.fits", "b.fits"]
@@ -0,0 +1,238 @@
+"""
+Tests for the command line interface
+"""
+
+import contextlib
+import io
+import logging
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pandas as pd
+import requests
+from mock_server import TEST_PROGRAM_NAME, MockServer, get_test_api
+from test_dry_run import too_route
+from test_image_store import IMAGE_TYPE, download_list
+from test_query import TEST_IMAGES, query_images
+from test_queue import SCHEDULE_NAMES, MockQueue
+
+from winterapi.cli import main
+from winterapi.endpoints import (
+    DOWNLOAD_LIST_PATH,
+    IMAGE_QUERY_PATH,
+    SCHEDULE_DELETE_PATH,
+    WINTER_TOO_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TestCli(unittest.TestCase):
+    """
+    Class for testing the command line interface
+    """
+
+    def setUp(self):
+        stack = contextlib.ExitStack()
+        self.addCleanup(stack.close)
+        self.server = stack.enter_context(MockServer())
+        self.server.routes[("POST", WINTER_TOO_PATH)] = too_route
+        self.server.routes[("GET", IMAGE_QUERY_PATH)] = query_images
+        self.server.routes[("GET", DOWNLOAD_LIST_PATH)] = download_list
+        MockQueue().add_routes(self.server)
+        self.winter = get_test_api(self.server)
+        self.root = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+
+    def run_main(self, *argv: str) -> tuple[int, str]:
+        """
+        Run the command line interface against the mock server
+
+        :param argv: Command line arguments
+        :return: Exit code and printed output
+        """
+        output = io.StringIO()
+        with (
+            patch("winterapi.cli.WinterAPI", return_value=self.winter),
+            contextlib.redirect_stdout(output),
+        ):
+            code = main(["--base-url", self.server.base_url, *argv])
+        return code, output.getvalue()
+
+    def test_submit(self):
+        """
+        Test submitting ToOs from a table
+
+        :return: None
+        """
+        logger.info("Testing the submit command")
+
+        table = self.root.joinpath("plan.csv")
+        pd.DataFrame(
+            {
+                "target_name": ["cli_a", "cli_b", "cli_c"],
+                "ra_deg": [210.9, 211.0, 211.1],
+                "dec_deg": [54.3, 54.4, 54.5],
+                "start_time_mjd": 62721.1894969287,
+                "end_time_mjd": 62722.1894969452,
+            }
+        ).to_csv(table, index=False)
+
+        code, output = self.run_main(
+            "submit", str(table), "-p", TEST_PROGRAM_NAME, "--batch-size", "2"
+        )
+        self.assertEqual(code, 0)
+        self.assertIn("Submitted 3 of 3 ToO requests in 2 of 2 batches", output)
+        self.assertEqual(self.server.count(WINTER_TOO_PATH), 2)
+
+        # A failed batch is reported, without hiding the batches which succeeded
+        def failing_route(params, body):
+            if "cli_c" in body:
+                return 400, {"msg": "Invalid request", "body": None}
+            return too_route(params, body)
+
+        self.server.routes[("POST", WINTER_TOO_PATH)] = failing_route
+        output_path = self.root.joinpath("schedules.csv")
+        code, output = self.run_main(
+            "submit",
+            str(table),
+            "-p",
+            TEST_PROGRAM_NAME,
+            "--batch-size",
+            "2",
+            "-o",
+            str(output_path),
+        )
+        self.assertEqual(code, 1)
+        self.assertIn("batch_0\trows 0-1\tsubmitted", output)
+        self.assertIn("batch_1\trows 2-2\tfailed", output)
+        self.assertIn("Submitted 2 of 3 ToO requests in 1 of 2 batches", output)
+        self.assertTrue(output_path.exists())
+
+    def test_query(self):
+        """
+        Test running image queries from a manifest, including an empty one
+
+        :return: None
+        """
+        logger.info("Testing the query command")
+
+        manifest = self.root.joinpath("queries.csv")
+        output_path = self.root.joinpath("images.csv")
+        pd.DataFrame(
+            {
+                "program_name": [TEST_PROGRAM_NAME] * 2,
+                "start_date": [20240101, 20240101],
+                "end_date": [20240201, 20240201],
+                "image_type": [IMAGE_TYPE] * 2,
+            }
+        ).to_csv(manifest, index=False)
+
+        code, _ = self.run_main("query", str(manifest), "-o", str(output_path))
+        self.assertEqual(code, 0)
+        images = pd.read_csv(output_path)
+        self.assertEqual(len(images), 2 * len(TEST_IMAGES))
+        self.assertEqual(sorted(images["query_index"].unique()), [0, 1])
+
+        manifest.write_text(
+            "program_name,start_date,end_date,image_type\n", encoding="utf-8"
+        )
+        code, output = self.run_main("query", str(manifest))
+        self.assertEqual(code, 0)
+        self.assertIn("Found 0 images for 0 queries", output)
+
+    def test_download(self):
+        """
+        Test that concurrent download batches do not overwrite each other
+
+        :return: None
+        """
+        logger.info("Testing the download command")
+
+        manifest = self.root.joinpath("paths.txt")
+        paths = [x["savepath"] for x in TEST_IMAGES[:5]]
+        manifest.write_text("\n".join(paths) + "\n", encoding="utf-8")
+        output_dir = self.root.joinpath("data")
+
+        code, output = self.run_main(
+            "download",
+            str(manifest),
+            "-p",
+            TEST_PROGRAM_NAME,
+            "-t",
+            IMAGE_TYPE,
+            "-o",
+            str(output_dir),
+            "--batch-size",
+            "2",
+        )
+        self.assertEqual(code, 0)
+        zip_paths = output.split()
+        self.assertEqual(len(zip_paths), 3)
+        self.assertEqual(len(set(zip_paths)), 3)
+
+        names = []
+        for zip_path in zip_paths:
+            with zipfile.ZipFile(zip_path) as archive:
+                names += archive.namelist()
+        self.assertEqual(sorted(names), sorted(Path(x).name for x in paths))
+
+        # The zips of the batches which succeeded are still reported
+        download_image_list = self.winter.download_image_list
+
+        def failing_download(**kwargs):
+            if paths[-1] in kwargs["paths"]:
+                raise requests.exceptions.ConnectionError("Connection lost")
+            return download_image_list(**kwargs)
+
+        errors = io.StringIO()
+        with (
+            patch.object(
+                self.winter, "download_image_list", side_effect=failing_download
+            ),
+            contextlib.redirect_stderr(errors),
+        ):
+            code, output = self.run_main(
+                "download",
+                str(manifest),
+                "-p",
+                TEST_PROGRAM_NAME,
+                "-t",
+                IMAGE_TYPE,
+                "-o",
+                str(output_dir),
+                "--batch-size",
+                "2",
+            )
+        self.assertEqual(code, 1)
+        self.assertEqual(len(output.split()), 2)
+        self.assertIn(f"batch_2\t1 paths from {paths[-1]}\tfailed", errors.getvalue())
+
+    def test_delete(self):
+        """
+        Test deleting queued ToO schedules
+
+        :return: None
+        """
+        logger.info("Testing the delete command")
+
+        schedule_file = self.root.joinpath("schedules.txt")
+        schedule_file.write_text(f"{SCHEDULE_NAMES[1]}\n", encoding="utf-8")
+
+        code, output = self.run_main(
+            "delete",
+            SCHEDULE_NAMES[0],
+            "-p",
+            TEST_PROGRAM_NAME,
+            "-f",
+            str(schedule_file),
+        )
+        self.assertEqual(code, 0)
+        self.assertEqual(self.server.count(SCHEDULE_DELETE_PATH), 2)
+        self.assertIn(f"{SCHEDULE_NAMES[1]}\tdeleted", output)
+
+        code, output = self.run_main("delete", "missing", "-p", TEST_PROGRAM_NAME)
+        self.assertEqual(code, 1)
+        self.assertIn("missing\tfailed", output)
@@ -0,0 +1,69 @@
+"""
+Stress test for sharing one WinterAPI instance between many threads
+"""
+
+import logging
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_server import TEST_PROGRAM_NAME, MockServer, get_test_api
+
+logger = logging.getLogger(__name__)
+
+N_THREADS = 16
+N_REQUESTS = 400
+
+
+def echo(params, _):
+    """
+    Mock route which echoes its parameters
+
+    :param params: Request parameters
+    :return: Status code and response
+    """
+    return 200, {"msg": "echo", "body": params}
+
+
+class TestConcurrency(unittest.TestCase):
+    """
+    Class for testing concurrent use of one WinterAPI instance
+    """
+
+    def test_shared_instance(self):
+        """
+        Test many concurrent requests, while the credentials are replaced
+
+        :return: None
+        """
+        logger.info("Testing concurrent requests")
+
+        with MockServer() as server:
+            server.routes[("GET", "/echo")] = echo
+            winter = get_test_api(server)
+            stop = threading.Event()
+
+            def swap_credentials():
+                while not stop.is_set():
+                    winter.fidelius.credentials = (
+                        winter.fidelius.credentials.model_copy(deep=True)
+                    )
+
+            def request(i):
+                program = winter.get_program_details(TEST_PROGRAM_NAME)
+                res = winter.get("/echo", index=str(i), program=program.progname)
+                return res.json()["body"]
+
+            swapper = threading.Thread(target=swap_credentials, daemon=True)
+            swapper.start()
+            try:
+                with ThreadPoolExecutor(max_workers=N_THREADS) as executor:
+                    bodies = list(executor.map(request, range(N_REQUESTS)))
+            finally:
+                stop.set()
+                swapper.join()
+
+            self.assertEqual([int(x["index"]) for x in bodies], list(range(N_REQUESTS)))
+            self.assertTrue(all(x["program"] == TEST_PROGRAM_NAME for x in bodies))
+            self.assertEqual(server.count("/echo"), N_REQUESTS)
+            self.assertEqual(winter.get_auth(), ("user", "password"))
@@ -0,0 +1,168 @@
+"""
+Tests for writing credentials
+"""
+
+import logging
+import tempfile
+import threading
+import unittest
+from contextlib import ExitStack
+from pathlib import Path
+from unittest.mock import patch
+
+import keyring
+from keyring.backend import KeyringBackend
+from mock_server import TEST_PROGRAM
+
+from winterapi import credentials
+from winterapi.agent import AgentFidelius, CredentialAgent
+from winterapi.credentials import get_secrets, write_secrets
+from winterapi.fidelius import Fidelius
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryKeyring(KeyringBackend):
+    """
+    Keyring which keeps passwords in memory
+    """
+
+    priority = 1
+
+    def __init__(self):
+        super().__init__()
+        self.passwords = {}
+
+    def get_password(self, service, username):
+        return self.passwords.get((service, username))
+
+    def set_password(self, service, username, password):
+        self.passwords[(service, username)] = password
+
+    def delete_password(self, service, username):
+        self.passwords.pop((service, username), None)
+
+
+def get_program_details(program_name: str) -> dict:
+    """
+    Get the details of a test program
+
+    :param program_name: Name of the program
+    :return: Program details
+    """
+    details = TEST_PROGRAM.model_copy(
+        update={"progname": program_name, "progtitle": "Test program"}
+    )
+    return details.model_dump(exclude_none=True)
+
+
+class TestCredentials(unittest.TestCase):
+    """
+    Class for testing transactional writes of credentials
+    """
+
+    def setUp(self):
+        stack = ExitStack()
+        self.addCleanup(stack.close)
+        root = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        self.secret_path = root.joinpath(".winterapi.txt")
+        lock_path = root.joinpath(".winterapi.txt.lock")
+        stack.enter_context(patch.object(credentials, "secret_path", self.secret_path))
+        stack.enter_context(patch("winterapi.fidelius.secrets_lock_path", lock_path))
+
+        previous_keyring = keyring.get_keyring()
+        keyring.set_keyring(MemoryKeyring())
+        stack.callback(keyring.set_keyring, previous_keyring)
+
+    def test_batch_rollback(self):
+        """
+        Test that a batch failing midway leaves the credentials unchanged
+
+        :return: None
+        """
+        logger.info("Testing rollback of credential batches")
+
+        fidelius = Fidelius()
+        fidelius.add_program(get_program_details("2024A001"))
+        contents = self.secret_path.read_bytes()
+
+        with self.assertRaises(RuntimeError):
+            with fidelius.batch() as working:
+                working.programs.pop("2024A001")
+                fidelius.add_program(get_program_details("2024A002"))
+                raise RuntimeError("failed midway")
+
+        self.assertEqual(fidelius.get_programs(), ["2024A001"])
+        self.assertEqual(self.secret_path.read_bytes(), contents)
+        self.assertEqual(list(get_secrets()["programs"]), ["2024A001"])
+
+        # A duplicate program aborts the whole update
+        with self.assertRaises(ValueError):
+            fidelius.add_programs(
+                [get_program_details("2024A003"), get_program_details("2024A001")]
+            )
+        self.assertEqual(fidelius.get_programs(), ["2024A001"])
+        self.assertEqual(self.secret_path.read_bytes(), contents)
+
+    def test_add_programs(self):
+        """
+        Test that adding several programs writes the credentials once
+
+        :return: None
+        """
+        logger.info("Testing batched program additions")
+
+        fidelius = Fidelius()
+        names = [f"2024A00{i}" for i in range(5)]
+        with patch(
+            "winterapi.fidelius.write_secrets", wraps=write_secrets
+        ) as mock_write:
+            fidelius.add_programs([get_program_details(x) for x in names])
+        self.assertEqual(mock_write.call_count, 1)
+        self.assertEqual(sorted(get_secrets()["programs"]), names)
+        self.assertEqual(Fidelius().get_programs(), names)
+
+    def test_write_failure(self):
+        """
+        Test that a failed write leaves the previous secrets file intact
+
+        :return: None
+        """
+        logger.info("Testing failed credential writes")
+
+        write_secrets({"user": "first"})
+        contents = self.secret_path.read_bytes()
+
+        with patch("winterapi.credentials.os.fsync", side_effect=OSError("full")):
+            with self.assertRaises(OSError):
+                write_secrets({"user": "second"})
+
+        self.assertEqual(self.secret_path.read_bytes(), contents)
+        self.assertEqual(get_secrets(), {"user": "first"})
+        self.assertEqual(list(self.secret_path.parent.glob("*.tmp")), [])
+
+    def test_agent_batch(self):
+        """
+        Test that updates made through an agent keep changes made to the
+        secrets file by other processes
+
+        :return: None
+        """
+        logger.info("Testing credential updates through an agent")
+
+        socket_path = self.secret_path.parent.joinpath("agent.sock")
+        agent = CredentialAgent(socket_path=socket_path, fidelius=Fidelius())
+        thread = threading.Thread(target=agent.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(agent.server_close)
+        self.addCleanup(agent.shutdown)
+
+        fidelius = AgentFidelius(socket_path=socket_path)
+
+        # Another process updates the file, which the agent has not reloaded
+        Fidelius().add_program(get_program_details("2024A001"))
+        self.assertEqual(fidelius.load_secrets().programs, {})
+
+        fidelius.add_program(get_program_details("2024A002"))
+        self.assertEqual(sorted(get_secrets()["programs"]), ["2024A001", "2024A002"])
+        self.assertEqual(fidelius.get_programs(), ["2024A001", "2024A002"])
@@ -0,0 +1,163 @@
+"""
+Tests for lazy access to downloaded images
+"""
+
+import logging
+import mmap
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+import numpy as np
+from astropy.io import fits
+
+from winterapi.download import DownloadResult
+
+logger = logging.getLogger(__name__)
+
+
+def write_image(path: Path, value: float, scaled: bool = False):
+    """
+    Write a small FITS image, with a science extension
+
+    :param path: Output path
+    :param value: Value of every pixel
+    :param scaled: Whether to store the data scaled with BZERO/BSCALE
+    :return: None
+    """
+    data = np.full((4, 4), value, dtype=np.float32)
+    primary = fits.PrimaryHDU(data, header=fits.Header({"IMG": path.name}))
+    if scaled:
+        primary.scale("int16", bscale=0.5, bzero=10.0)
+    science = fits.ImageHDU(data, name="SCI")
+    fits.HDUList([primary, science]).writeto(path)
+
+
+def is_memmapped(data: np.ndarray) -> bool:
+    """
+    Check whether an array is backed by a memory map
+
+    :param data: Array
+    :return: boolean
+    """
+    base = data
+    while base is not None:
+        if isinstance(base, (np.memmap, mmap.mmap)):
+            return True
+        base = getattr(base, "base", None)
+    return False
+
+
+class TestDownloadResult(unittest.TestCase):
+    """
+    Class for testing download results
+    """
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(temp_dir.cleanup)
+        self.root = Path(temp_dir.name)
+
+        self.image_paths = []
+        for name, value, scaled in [("a.fits", 1.0, False), ("b.fits", 2.0, True)]:
+            path = self.root.joinpath(name)
+            write_image(path, value, scaled=scaled)
+            self.image_paths.append(path)
+
+        self.zip_path = self.root.joinpath("images.zip")
+        with zipfile.ZipFile(self.zip_path, "w") as archive:
+            for path in self.image_paths:
+                archive.write(path, f"20240101/{path.name}")
+
+    def test_from_zip(self):
+        """
+        Test that zip members are only extracted when their data is needed
+
+        :return: None
+        """
+        logger.info("Testing download results from a zip")
+
+        extract_dir = self.root.joinpath("extracted")
+        result = DownloadResult.from_zip(self.zip_path, extract_dir=extract_dir)
+        self.assertEqual(result.names, ["20240101/a.fits", "20240101/b.fits"])
+        self.assertIn("20240101/a.fits", result)
+        self.assertNotIn("a.fits", result)
+
+        self.assertEqual(result.get_header("20240101/a.fits")["IMG"], "a.fits")
+        self.assertEqual(
+            result.get_header("20240101/b.fits", ext="SCI")["EXTNAME"], "SCI"
+        )
+        self.assertEqual(
+            {x: y["IMG"] for x, y in result.get_headers().items()},
+            {"20240101/a.fits": "a.fits", "20240101/b.fits": "b.fits"},
+        )
+        self.assertFalse(extract_dir.exists())
+
+        data = result.get_data("20240101/a.fits")
+        self.assertTrue(np.all(data == 1.0))
+        self.assertEqual(
+            list(extract_dir.rglob("*.fits")),
+            [extract_dir.joinpath("20240101", "a.fits")],
+        )
+
+        with self.assertRaises(KeyError):
+            result.get_path("c.fits")
+
+    def test_from_paths(self):
+        """
+        Test memory-mapping of data from local images
+
+        :return: None
+        """
+        logger.info("Testing download results from paths")
+
+        result = DownloadResult.from_paths([*self.image_paths, None])
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result["a.fits"], self.image_paths[0])
+        self.assertEqual(result.get_header("a.fits")["IMG"], "a.fits")
+
+        data = result.get_data("a.fits")
+        self.assertTrue(is_memmapped(data))
+        data = result.get_data("a.fits", memmap=False)
+        self.assertFalse(is_memmapped(data))
+        self.assertTrue(np.all(data == 1.0))
+
+        # Scaled data is read into memory, even if memory-mapping is requested
+        for memmap in [None, True]:
+            data = result.get_data("b.fits", memmap=memmap)
+            self.assertFalse(is_memmapped(data))
+            self.assertTrue(np.allclose(data, 2.0))
+
+        data = result.get_data("b.fits", ext="SCI")
+        self.assertTrue(is_memmapped(data))
+
+        with result.open("a.fits") as hdul:
+            self.assertEqual(hdul.index_of("SCI"), 1)
+
+    def test_duplicate_names(self):
+        """
+        Test that images with the same file name are kept apart, or rejected
+
+        :return: None
+        """
+        logger.info("Testing download results with duplicate file names")
+
+        with zipfile.ZipFile(self.zip_path, "a") as archive:
+            archive.write(self.image_paths[1], "20240102/a.fits")
+        result = DownloadResult.from_zip(self.zip_path)
+        self.assertEqual(result.get_header("20240101/a.fits")["IMG"], "a.fits")
+        self.assertEqual(result.get_header("20240102/a.fits")["IMG"], "b.fits")
+        self.assertTrue(np.allclose(result.get_data("20240102/a.fits"), 2.0))
+
+        other_path = self.root.joinpath("other", "a.fits")
+        other_path.parent.mkdir()
+        write_image(other_path, 3.0)
+        with self.assertRaises(ValueError):
+            DownloadResult.from_paths([self.image_paths[0], other_path])
+
+        result = DownloadResult.from_paths(
+            [self.image_paths[0], other_path],
+            names=["/data/20240101/a.fits", "/data/20240102/a.fits"],
+        )
+        self.assertEqual(result["/data/20240102/a.fits"], other_path)
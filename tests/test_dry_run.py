@@ -0,0 +1,97 @@
+"""
+Tests for validating dry runs locally
+"""
+
+import logging
+import unittest
+
+from mock_server import TEST_PROGRAM, TEST_PROGRAM_NAME, MockServer, get_test_api
+from wintertoo.models import WinterRaDecToO
+
+from winterapi.endpoints import VERSION_PATH, WINTER_TOO_PATH
+from winterapi.fields import build_schedule
+
+logger = logging.getLogger(__name__)
+
+
+def too_route(_, __):
+    """
+    Mock route for dry runs of ToO submissions
+
+    :return: Status code and response
+    """
+    return 200, {"msg": "Dry run", "body": []}
+
+
+def get_test_too() -> WinterRaDecToO:
+    """
+    Get a ToO request for tests
+
+    :return: ToO request
+    """
+    return WinterRaDecToO(
+        ra_deg=210.910674637,
+        dec_deg=54.3116510708,
+        start_time_mjd=62721.1894969287,
+        end_time_mjd=62722.1894969452,
+        use_field_grid=False,
+        target_name="dry_run",
+        total_exposure_time=300.0,
+    )
+
+
+class TestDryRun(unittest.TestCase):
+    """
+    Class for testing local dry runs
+    """
+
+    def test_local_dry_run(self):
+        """
+        Test that dry runs only use the server when the local result is uncertain
+
+        :return: None
+        """
+        logger.info("Testing local dry runs")
+
+        with MockServer() as server:
+            server.routes[("POST", WINTER_TOO_PATH)] = too_route
+            winter = get_test_api(server)
+
+            res, schedule = winter.submit_too(
+                TEST_PROGRAM_NAME, data=get_test_too(), local_dry_run=True
+            )
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(server.count(WINTER_TOO_PATH), 0)
+            self.assertTrue(
+                schedule.equals(build_schedule([get_test_too()], program=TEST_PROGRAM))
+            )
+            self.assertEqual(len(res.json()["body"]), len(schedule))
+
+            winter.submit_too(TEST_PROGRAM_NAME, data=get_test_too())
+            self.assertEqual(server.count(WINTER_TOO_PATH), 1)
+
+            # Requests close to the program allocation are checked by the server
+            winter.fidelius.credentials.programs[TEST_PROGRAM_NAME] = (
+                TEST_PROGRAM.model_copy(update={"hours_used": 99.9})
+            )
+            winter.submit_too(
+                TEST_PROGRAM_NAME, data=get_test_too(), local_dry_run=True
+            )
+            self.assertEqual(server.count(WINTER_TOO_PATH), 2)
+            winter.fidelius.credentials.programs[TEST_PROGRAM_NAME] = TEST_PROGRAM
+
+            # A change in the server version is checked by the server
+            server.routes[("GET", VERSION_PATH)] = lambda params, body: (
+                200,
+                {"msg": "version", "body": "0.0.1"},
+            )
+            winter._version_checked = 0.0  # pylint: disable=protected-access
+            winter.submit_too(
+                TEST_PROGRAM_NAME, data=get_test_too(), local_dry_run=True
+            )
+            self.assertEqual(server.count(WINTER_TOO_PATH), 3)
+
+            winter.submit_too(
+                TEST_PROGRAM_NAME, data=get_test_too(), local_dry_run=True
+            )
+            self.assertEqual(server.count(WINTER_TOO_PATH), 3)
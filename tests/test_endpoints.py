@@ -0,0 +1,124 @@
+"""
+Test for per-instance endpoints and host failover
+"""
+
+import logging
+import time
+import unittest
+
+from mock_server import MockServer, get_test_api
+from test_singleflight import slow_route
+
+from winterapi import WinterAPI
+from winterapi.endpoints import HostPool
+from winterapi.timeouts import AdaptiveTimeouts, DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+UNREACHABLE_URL = "http://127.0.0.1:9"
+
+
+class TestEndpoints(unittest.TestCase):
+    """
+    Class for testing endpoints
+    """
+
+    def test_host_order(self):
+        """
+        Test the order in which hosts are tried
+
+        :return: None
+        """
+        logger.info("Testing host order")
+
+        hosts = HostPool(["http://a", "http://b", "http://c"], prefer_fastest=True)
+        hosts.mark_healthy("http://a", latency=0.5)
+        hosts.mark_healthy("http://b", latency=0.1)
+        hosts.mark_unhealthy("http://c")
+
+        assert hosts.get_primary() == "http://a"
+        assert hosts.get_candidates(read=True) == ["http://b", "http://a", "http://c"]
+
+        hosts.mark_unhealthy("http://a")
+        assert hosts.get_candidates() == ["http://b", "http://a", "http://c"]
+
+    def test_failover(self):
+        """
+        Test that requests fail over from an unreachable host
+
+        :return: None
+        """
+        logger.info("Testing failover")
+
+        with MockServer() as server:
+            winter = WinterAPI(base_urls=[UNREACHABLE_URL, server.base_url])
+
+            assert winter.ping(), "Server not reached"
+            assert not winter.hosts.is_healthy(UNREACHABLE_URL)
+            assert winter.hosts.get_primary() == server.base_url
+            assert server.count("/ping") == 2
+
+            server.routes[("GET", "/validation/user")] = lambda params, body: (
+                200,
+                {"msg": "valid"},
+            )
+            winter.hosts.mark_healthy(UNREACHABLE_URL)
+            res = winter.check_user_details(user="user", password="password")
+            assert res.status_code == 200
+            assert not winter.hosts.is_healthy(UNREACHABLE_URL)
+
+    def test_cooldown(self):
+        """
+        Test that unhealthy hosts are tried again after their cooldown
+
+        :return: None
+        """
+        logger.info("Testing host cooldown")
+
+        hosts = HostPool(["http://a", "http://b"], cooldown=0.1)
+        hosts.mark_unhealthy("http://a")
+        assert hosts.get_primary() == "http://b"
+        assert not hosts.is_healthy("http://a")
+
+        time.sleep(0.15)
+        assert hosts.is_healthy("http://a")
+        assert hosts.get_candidates() == ["http://a", "http://b"]
+
+    def test_no_write_failover(self):
+        """
+        Test that writes which may have reached a host do not fail over
+
+        :return: None
+        """
+        logger.info("Testing failover of writes")
+
+        with MockServer() as primary, MockServer() as mirror:
+            for server in [primary, mirror]:
+                server.routes[("GET", "/slow")] = slow_route
+                server.routes[("POST", "/slow")] = slow_route
+            mirror.routes[("POST", "/slow")] = lambda params, body: (
+                200,
+                {"msg": "mirror"},
+            )
+            mirror.routes[("GET", "/slow")] = mirror.routes[("POST", "/slow")]
+
+            winter = get_test_api(primary)
+            winter.hosts = HostPool([primary.base_url, mirror.base_url])
+            winter.timeouts = AdaptiveTimeouts(min_timeout=0.05, min_samples=1)
+            winter.timeouts.record("/slow", 0.01)
+
+            with self.assertRaises(DeadlineExceededError):
+                with winter.deadline(1.0):
+                    winter.post("/slow", data="[]")
+            assert primary.count("/slow") >= 1
+            assert mirror.count("/slow") == 0
+            assert winter.hosts.is_healthy(primary.base_url)
+
+            res = winter.get("/slow")
+            assert res.json()["msg"] == "mirror"
+            assert not winter.hosts.is_healthy(primary.base_url)
+
+            # Writes still fail over from hosts which cannot be reached
+            winter.hosts = HostPool([UNREACHABLE_URL, mirror.base_url])
+            res = winter.post("/slow", data="[]")
+            assert res.json()["msg"] == "mirror"
@@ -0,0 +1,131 @@
+"""
+Tests for the field grid index and local schedule building
+"""
+
+import logging
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from mock_server import TEST_PROGRAM
+from wintertoo.fields import get_best_field, get_fields
+from wintertoo.models import SummerRaDecToO, WinterFieldToO, WinterRaDecToO
+from wintertoo.schedule import concat_toos
+
+from winterapi.fields import FieldGridIndex, build_schedule
+
+logger = logging.getLogger(__name__)
+
+START_TIME_MJD = 62721.1894969287
+END_TIME_MJD = 62722.1894969452
+
+
+def get_test_positions(summer: bool, n_positions: int = 100) -> np.ndarray:
+    """
+    Get random positions near field centres, including the polar caps
+
+    :param summer: boolean whether to use summer field grid
+    :param n_positions: Number of positions
+    :return: Array of (ra, dec) positions
+    """
+    fields = get_fields(summer=summer)
+    fields = fields[(fields["RA"] > 1.0) & (fields["RA"] < 359.0)]
+    rng = np.random.default_rng(42)
+    rows = rng.integers(0, len(fields), n_positions)
+    ras = fields["RA"].to_numpy()[rows] + rng.uniform(-0.1, 0.1, n_positions)
+    decs = fields["Dec"].to_numpy()[rows] + rng.uniform(-0.1, 0.1, n_positions)
+    return np.stack([ras, np.clip(decs, -89.0, 89.0)], axis=1)
+
+
+class TestFields(unittest.TestCase):
+    """
+    Class for testing the field grid index
+    """
+
+    def test_best_fields(self):
+        """
+        Test that the index finds the same fields as get_best_field
+
+        :return: None
+        """
+        logger.info("Testing the field grid index")
+
+        for summer in [False, True]:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                index = FieldGridIndex(summer=summer, cache_dir=cache_dir)
+                cached_index = FieldGridIndex(summer=summer, cache_dir=cache_dir)
+                self.assertTrue(np.array_equal(index.members, cached_index.members))
+
+            positions = get_test_positions(summer=summer)
+            best_fields = index.get_best_fields(positions[:, 0], positions[:, 1])
+
+            expected = [
+                int(get_best_field(ra, dec, summer=summer)["ID"])
+                for ra, dec in positions
+            ]
+            self.assertEqual(best_fields["ID"].astype(int).tolist(), expected)
+
+        self.assertEqual(
+            int(
+                FieldGridIndex.get_index().get_best_fields([210.9107], [54.3117])["ID"][
+                    0
+                ]
+            ),
+            3944,
+        )
+
+        with self.assertRaises(KeyError):
+            FieldGridIndex.get_index().get_fields_by_id([-1])
+
+    def test_build_schedule(self):
+        """
+        Test that building a schedule at once matches concat_toos
+
+        :return: None
+        """
+        logger.info("Testing local schedule building")
+
+        kwargs = {
+            "start_time_mjd": START_TIME_MJD,
+            "end_time_mjd": END_TIME_MJD,
+            "total_exposure_time": 300.0,
+        }
+
+        toos = [
+            WinterFieldToO(field_id=3944, n_dither=9, target_name="field", **kwargs),
+            WinterRaDecToO(
+                ra_deg=210.910674637,
+                dec_deg=54.3116510708,
+                use_field_grid=False,
+                target_name="radec",
+                **kwargs,
+            ),
+        ]
+        for i, (ra_deg, dec_deg) in enumerate(get_test_positions(False, 10)):
+            toos.append(
+                WinterRaDecToO(
+                    ra_deg=ra_deg,
+                    dec_deg=dec_deg,
+                    use_field_grid=True,
+                    use_best_detector=False,
+                    target_name=f"grid_{i}",
+                    **kwargs,
+                )
+            )
+        toos.append(
+            SummerRaDecToO(
+                ra_deg=150.0,
+                dec_deg=20.0,
+                use_field_grid=True,
+                use_best_detector=False,
+                target_name="summer",
+                **kwargs,
+            )
+        )
+
+        schedule = build_schedule(toos, program=TEST_PROGRAM)
+        expected = concat_toos(
+            [x.model_copy(deep=True) for x in toos], program=TEST_PROGRAM
+        )
+        pd.testing.assert_frame_equal(schedule, expected, check_dtype=False)
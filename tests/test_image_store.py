@@ -0,0 +1,264 @@
+"""
+Test for the local image store
+"""
+
+import io
+import json
+import logging
+import tempfile
+import time
+import unittest
+import zipfile
+from pathlib import Path
+
+import numpy as np
+from astropy.io import fits
+from mock_server import TEST_PROGRAM_NAME, MockServer, get_test_api
+from test_query import TEST_IMAGES, query_images
+from wintertoo.models import ProgramImageQuery
+
+from winterapi.image_store import ImageStore
+from winterapi.transfer import Transfer
+
+logger = logging.getLogger(__name__)
+
+IMAGE_TYPE = "stack"
+
+
+def download_list(params, body):
+    """
+    Mock download of a list of images, as a zip file
+
+    :param params: Request parameters
+    :param body: Request body
+    :return: Status code and zip file content
+    """
+    assert params["image_type"] == IMAGE_TYPE
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for entry in json.loads(body):
+            name = Path(entry["path"]).name
+            image = io.BytesIO()
+            hdu = fits.PrimaryHDU(np.zeros((4, 4)), header=fits.Header({"IMG": name}))
+            hdu.writeto(image, checksum=True)
+            archive.writestr(name, image.getvalue())
+    return 200, buffer.getvalue()
+
+
+def slow_query_images(params, body):
+    """
+    Mock image query, which responds slowly
+
+    :param params: Request parameters
+    :param body: Request body
+    :return: Status code and response
+    """
+    time.sleep(0.2)
+    return query_images(params, body)
+
+
+def slow_download_list(params, body):
+    """
+    Mock download of a list of images, which responds slowly
+
+    :param params: Request parameters
+    :param body: Request body
+    :return: Status code and zip file content
+    """
+    time.sleep(0.2)
+    return download_list(params, body)
+
+
+def get_name(path: Path) -> str:
+    """
+    Get the name recorded in the header of a mock image
+
+    :param path: Path of the image
+    :return: Name
+    """
+    return fits.getheader(path)["IMG"]
+
+
+class TestImageStore(unittest.TestCase):
+    """
+    Class for testing the image store
+    """
+
+    def test_incremental_download(self):
+        """
+        Test that only images missing from the store are downloaded
+
+        :return: None
+        """
+        logger.info("Testing incremental downloads")
+
+        with MockServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+            server.routes[("GET", "/images/download_list")] = download_list
+            winter = get_test_api(server)
+            store = ImageStore(temp_dir)
+
+            first = winter.download_images_to_store(
+                TEST_PROGRAM_NAME, ["/a/1.fits", "/a/2.fits"], IMAGE_TYPE, store=store
+            )
+            assert server.count("/images/download_list") == 1
+            assert get_name(first[0]) == "1.fits"
+
+            second = winter.download_images_to_store(
+                TEST_PROGRAM_NAME,
+                ["/a/1.fits", "/a/2.fits", "/a/3.fits"],
+                IMAGE_TYPE,
+                store=store,
+            )
+            assert server.count("/images/download_list") == 2
+            assert second[:2] == first
+            assert get_name(second[2]) == "3.fits"
+
+            third = winter.download_images_to_store(
+                TEST_PROGRAM_NAME, ["/a/3.fits", "/a/1.fits"], IMAGE_TYPE, store=store
+            )
+            assert server.count("/images/download_list") == 2
+            assert third == [second[2], second[0]]
+
+    def test_batched_download(self):
+        """
+        Test that batched downloads are all ingested into the store
+
+        :return: None
+        """
+        logger.info("Testing batched downloads")
+
+        paths = [f"/b/{i}.fits" for i in range(7)]
+
+        with MockServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+            server.routes[("GET", "/images/download_list")] = download_list
+            winter = get_test_api(server)
+
+            local_paths = winter.download_images_to_store(
+                TEST_PROGRAM_NAME,
+                paths,
+                IMAGE_TYPE,
+                store=ImageStore(temp_dir),
+                batch_size=3,
+                verify=True,
+            )
+            assert server.count("/images/download_list") == 3
+            assert [get_name(x) for x in local_paths] == [f"{i}.fits" for i in range(7)]
+
+    def test_query_and_download(self):
+        """
+        Test that downloads start while later query pages are still queried
+
+        :return: None
+        """
+        logger.info("Testing overlapped query and download")
+
+        query = ProgramImageQuery(
+            program_name=TEST_PROGRAM_NAME,
+            start_date="20240101",
+            end_date="20240201",
+            image_type=IMAGE_TYPE,
+        )
+        expected = [
+            x["savepath"] for x in TEST_IMAGES if int(x["nightdate"][-2:]) % 2 == 0
+        ]
+
+        with MockServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+            server.routes[("GET", "/images/query")] = slow_query_images
+            server.routes[("GET", "/images/download_list")] = download_list
+            winter = get_test_api(server)
+
+            images = winter.query_and_download_images(
+                [query, query],
+                store=ImageStore(temp_dir),
+                image_filters=[lambda x: x["nightdate"].str[-2:].astype(int) % 2 == 0],
+                page_size=10,
+                batch_size=4,
+            )
+            assert images["savepath"].tolist() == expected
+            assert [get_name(x) for x in images["local_path"]] == [
+                Path(x).name for x in expected
+            ]
+            assert server.count("/images/query") == 6
+            assert server.count("/images/download_list") == 5
+
+            # The first download is sent before the last page of the first query
+            paths = [x[1] for x in server.requests if x[1] != "/ping"]
+            query_indices = [i for i, x in enumerate(paths) if x == "/images/query"]
+            assert paths.index("/images/download_list") < query_indices[2]
+
+    def test_shared_transfer(self):
+        """
+        Test that concurrent downloads can share one transfer
+
+        :return: None
+        """
+        logger.info("Testing concurrent downloads with a shared transfer")
+
+        query = ProgramImageQuery(
+            program_name=TEST_PROGRAM_NAME,
+            start_date="20240101",
+            end_date="20240201",
+            image_type=IMAGE_TYPE,
+        )
+        updates = []
+        transfer = Transfer(
+            chunk_size=256, progress_callback=updates.append, progress_interval=0.0
+        )
+
+        with MockServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+            server.routes[("GET", "/images/query")] = query_images
+            server.routes[("GET", "/images/download_list")] = slow_download_list
+            winter = get_test_api(server)
+
+            images = winter.query_and_download_images(
+                query,
+                store=ImageStore(temp_dir),
+                batch_size=4,
+                max_workers=4,
+                transfer=transfer,
+            )
+            assert images["local_path"].notna().all()
+
+        finished = [x for x in updates if x.finished]
+        assert len(finished) == server.count("/images/download_list")
+        assert len(finished) > 1
+        assert all(x.bytes_received == x.total_bytes for x in finished)
+        assert transfer.progress.bytes_received == 0
+
+    def test_duplicate_names(self):
+        """
+        Test that images with the same file name in different nights are
+        not confused
+
+        :return: None
+        """
+        logger.info("Testing zip files with duplicate file names")
+
+        paths = ["/data/20240101/image.fits", "/data/20240102/image.fits"]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = ImageStore(temp_dir)
+
+            zip_path = Path(temp_dir).joinpath("nights.zip")
+            with zipfile.ZipFile(zip_path, "w") as archive:
+                for path in paths:
+                    image = io.BytesIO()
+                    hdu = fits.PrimaryHDU(header=fits.Header({"NIGHT": path[6:14]}))
+                    hdu.writeto(image)
+                    archive.writestr(path[6:], image.getvalue())
+
+            files = store.ingest_zip(zip_path, paths, IMAGE_TYPE)
+            assert set(files) == set(paths)
+            for path in paths:
+                assert fits.getheader(files[path])["NIGHT"] == path[6:14]
+
+            # Members named only by file name cannot be told apart, so are
+            # skipped, without losing the other members
+            store = ImageStore(Path(temp_dir).joinpath("store"))
+            zip_path = Path(temp_dir).joinpath("names.zip")
+            with zipfile.ZipFile(zip_path, "w") as archive:
+                archive.writestr("image.fits", b"")
+                archive.writestr("other.fits", b"")
+            files = store.ingest_zip(zip_path, [*paths, "/data/other.fits"], IMAGE_TYPE)
+            self.assertEqual(list(files), ["/data/other.fits"])
+            self.assertEqual(store.get_missing(paths, IMAGE_TYPE), paths)
@@ -0,0 +1,358 @@
+"""
+Tests for image queries
+"""
+
+import json
+import logging
+import unittest
+
+import pandas as pd
+from mock_server import TEST_PROGRAM, TEST_PROGRAM_NAME, MockServer, get_test_api
+from wintertoo.models import ConeImageQuery, ProgramImageQuery, RectangleImageQuery
+
+from winterapi.footprint import FootprintCatalog
+from winterapi.sky import angular_separation
+from winterapi.spill import SpilledResult
+
+logger = logging.getLogger(__name__)
+
+OTHER_PROGRAM_NAME = "2024A998"
+
+TEST_IMAGES = [
+    {
+        "progname": TEST_PROGRAM_NAME,
+        "nightdate": f"2024-01-{1 + i % 28:02d}",
+        "targname": f"target_{i % 3}",
+        "ra": 150.0 + 0.01 * i,
+        "dec": 17.0 + 0.01 * i,
+        "fid": 1,
+        "utctime": "2024-01-01T00:00:00",
+        "fieldid": 1,
+        "image_type": "stack",
+        "savepath": f"/data/{i}.fits",
+    }
+    for i in range(25)
+]
+
+
+def query_images(params, _):
+    """
+    Mock image query, supporting limit and offset
+
+    :param params: Request parameters
+    :return: Status code and response
+    """
+    images = TEST_IMAGES
+    offset = int(params.get("offset", 0))
+    if "limit" in params:
+        images = images[offset : offset + int(params["limit"])]
+    return 200, {"msg": "images", "body": images}
+
+
+def query_images_unpaged(*_):
+    """
+    Mock image query, ignoring limit and offset
+
+    :return: Status code and response
+    """
+    return 200, {"msg": "images", "body": TEST_IMAGES}
+
+
+def filter_images(query: dict) -> list[dict]:
+    """
+    Filter the test images with a query
+
+    :param query: Query, as a dictionary
+    :return: Matching images
+    """
+    images = [
+        x
+        for x in TEST_IMAGES
+        if int(query["start_date"])
+        <= int(x["nightdate"].replace("-", ""))
+        <= int(query["end_date"])
+    ]
+    if "radius_deg" in query:
+        images = [
+            x
+            for x in images
+            if angular_separation(query["ra"], query["dec"], x["ra"], x["dec"])
+            <= query["radius_deg"]
+        ]
+    elif "ra_min" in query:
+        images = [
+            x
+            for x in images
+            if query["ra_min"] <= x["ra"] <= query["ra_max"]
+            and query["dec_min"] <= x["dec"] <= query["dec_max"]
+        ]
+    return images
+
+
+def query_images_filtered(_, body):
+    """
+    Mock image query, filtering by date and position
+
+    :param body: Request body
+    :return: Status code and response
+    """
+    return 200, {"msg": "images", "body": filter_images(json.loads(body)[0])}
+
+
+def get_query() -> ProgramImageQuery:
+    """
+    Get a program query for the test program
+
+    :return: Query
+    """
+    return ProgramImageQuery(
+        program_name=TEST_PROGRAM_NAME, start_date="20240101", end_date="20240201"
+    )
+
+
+class TestQuery(unittest.TestCase):
+    """
+    Class for testing image queries
+    """
+
+    def test_iter_query_images(self):
+        """
+        Test paging through query results
+
+        :return: None
+        """
+        logger.info("Testing paged queries")
+
+        with MockServer() as server:
+            server.routes[("GET", "/images/query")] = query_images
+            winter = get_test_api(server)
+
+            pages = list(winter.iter_query_images(get_query(), page_size=10))
+            self.assertEqual([len(x) for x in pages], [10, 10, 5])
+            self.assertEqual(server.count("/images/query"), 3)
+
+            images = pd.concat(pages, ignore_index=True)
+            self.assertEqual(
+                images["savepath"].tolist(), [x["savepath"] for x in TEST_IMAGES]
+            )
+
+            pages = list(winter.iter_query_images(get_query(), page_size=25))
+            self.assertEqual([len(x) for x in pages], [25])
+
+    def test_iter_query_images_unpaged(self):
+        """
+        Test paging when the server returns all results at once
+
+        :return: None
+        """
+        with MockServer() as server:
+            server.routes[("GET", "/images/query")] = query_images_unpaged
+            winter = get_test_api(server)
+
+            pages = list(winter.iter_query_images(get_query(), page_size=10))
+            self.assertEqual([len(x) for x in pages], [25])
+            self.assertEqual(server.count("/images/query"), 1)
+
+    def test_memory_budget(self):
+        """
+        Test spilling query results which exceed the memory budget to disk
+
+        :return: None
+        """
+        logger.info("Testing memory budget for queries")
+
+        expected = [x["savepath"] for x in TEST_IMAGES]
+
+        for route in [query_images, query_images_unpaged]:
+            with MockServer() as server:
+                server.routes[("GET", "/images/query")] = route
+                winter = get_test_api(server)
+
+                _, images = winter.query_images(get_query(), memory_budget=2**30)
+                self.assertIsInstance(images, pd.DataFrame)
+                self.assertEqual(images["savepath"].tolist(), expected)
+
+                with winter.query_images_with_budget(
+                    get_query(), memory_budget=1000, page_size=10
+                )[1] as spilled:
+                    self.assertIsInstance(spilled, SpilledResult)
+                    self.assertEqual(len(spilled), 25)
+                    self.assertEqual([len(x) for x in spilled], [10, 10, 5])
+                    self.assertEqual(
+                        spilled.to_pandas(columns=["savepath"])["savepath"].tolist(),
+                        expected,
+                    )
+                    directory = spilled.directory
+                self.assertFalse(directory.exists())
+
+    def test_query_images_for_programs(self):
+        """
+        Test running one query for several programs and image types
+
+        :return: None
+        """
+        logger.info("Testing multi-program queries")
+
+        with MockServer() as server:
+            server.routes[("GET", "/images/query")] = query_images_filtered
+            winter = get_test_api(server)
+            winter.fidelius.credentials.programs[OTHER_PROGRAM_NAME] = (
+                TEST_PROGRAM.model_copy(update={"progname": OTHER_PROGRAM_NAME})
+            )
+
+            images = winter.query_images_for_programs(
+                get_query(), image_types=["stack", "diff"]
+            )
+            self.assertEqual(server.count("/images/query"), 4)
+            self.assertEqual(len(images), 4 * len(TEST_IMAGES))
+            self.assertEqual(
+                sorted(set(zip(images["program_name"], images["query_image_type"]))),
+                [
+                    (OTHER_PROGRAM_NAME, "diff"),
+                    (OTHER_PROGRAM_NAME, "stack"),
+                    (TEST_PROGRAM_NAME, "diff"),
+                    (TEST_PROGRAM_NAME, "stack"),
+                ],
+            )
+            # The server's own columns are left untouched
+            self.assertEqual(set(images["image_type"]), {"stack"})
+            self.assertEqual(
+                sorted(
+                    x[2]["program_name"]
+                    for x in server.requests
+                    if x[1] == "/images/query"
+                ),
+                sorted([OTHER_PROGRAM_NAME, TEST_PROGRAM_NAME] * 2),
+            )
+
+            images = winter.query_images_for_programs(
+                get_query(), program_names=[TEST_PROGRAM_NAME]
+            )
+            self.assertEqual(len(images), len(TEST_IMAGES))
+
+    def test_footprint_catalog(self):
+        """
+        Test answering queries from the local footprint catalog
+
+        :return: None
+        """
+        logger.info("Testing footprint catalog")
+
+        with MockServer() as server:
+            server.routes[("GET", "/images/query")] = query_images_filtered
+            winter = get_test_api(server)
+            winter.footprint_catalog = FootprintCatalog()
+
+            rectangle = RectangleImageQuery(
+                program_name=TEST_PROGRAM_NAME,
+                start_date="20240101",
+                end_date="20240201",
+                ra_min=149.0,
+                ra_max=151.0,
+                dec_min=16.5,
+                dec_max=17.5,
+            )
+            _, images = winter.query_images(rectangle)
+            self.assertEqual(len(images), 25)
+            self.assertEqual(server.count("/images/query"), 1)
+
+            for ra, dec, radius in [(150.05, 17.05, 0.05), (150.2, 17.2, 0.1)]:
+                cone = ConeImageQuery(
+                    program_name=TEST_PROGRAM_NAME,
+                    start_date="20240105",
+                    end_date="20240120",
+                    ra=ra,
+                    dec=dec,
+                    radius_deg=radius,
+                )
+                res, images = winter.query_images(cone)
+                expected = filter_images(cone.model_dump())
+                self.assertEqual(
+                    sorted(images["savepath"]), sorted(x["savepath"] for x in expected)
+                )
+                self.assertEqual(len(res.json()["body"]), len(expected))
+            self.assertEqual(server.count("/images/query"), 1)
+
+            # Only the uncovered dates are queried
+            cone = cone.model_copy(update={"end_date": 20240210})
+            winter.query_images(cone)
+            self.assertEqual(server.count("/images/query"), 2)
+            winter.query_images(cone)
+            self.assertEqual(server.count("/images/query"), 2)
+
+            # Regions outside the catalog are queried
+            outside = cone.model_copy(update={"ra": 10.0})
+            _, images = winter.query_images(outside)
+            self.assertEqual(len(images), 0)
+            self.assertEqual(server.count("/images/query"), 3)
+
+    def test_footprint_pages(self):
+        """
+        Test that images added page by page are searched as if added at once
+
+        :return: None
+        """
+        logger.info("Testing footprint catalog pages")
+
+        query = ProgramImageQuery(
+            program_name=TEST_PROGRAM_NAME, start_date="20240101", end_date="20240201"
+        )
+        images = pd.DataFrame(TEST_IMAGES).sample(frac=1.0, random_state=1)
+        cone = ConeImageQuery(
+            program_name=TEST_PROGRAM_NAME,
+            start_date="20240101",
+            end_date="20240201",
+            ra=150.1,
+            dec=17.1,
+            radius_deg=0.05,
+        )
+
+        catalog = FootprintCatalog()
+        catalog.add(query, images)
+        expected = catalog.search(cone)
+
+        catalog = FootprintCatalog()
+        for i in range(0, len(images), 4):
+            catalog.add(query, images.iloc[i : i + 4])
+        catalog.add(query, images.iloc[:4])
+        pd.testing.assert_frame_equal(catalog.search(cone), expected)
+        self.assertEqual(len(catalog.search(query)), len(TEST_IMAGES))
+
+        # Night dates are ISO strings, as returned by the server
+        nights = query.model_copy(update={"start_date": 20240105, "end_date": 20240110})
+        self.assertEqual(
+            catalog.search(nights)["nightdate"].tolist(),
+            [f"2024-01-{x:02d}" for x in range(5, 11)],
+        )
+
+    def test_query_images_by_cones(self):
+        """
+        Test coalescing nearby cone queries
+
+        :return: None
+        """
+        logger.info("Testing coalesced cone queries")
+
+        cones = [
+            ConeImageQuery(
+                program_name=TEST_PROGRAM_NAME,
+                start_date="20240101",
+                end_date="20240201",
+                ra=ra,
+                dec=dec,
+                radius_deg=0.03,
+            )
+            for ra, dec in [(150.0, 17.0), (150.1, 17.1), (150.2, 17.21), (10.0, 5.0)]
+        ]
+
+        with MockServer() as server:
+            server.routes[("GET", "/images/query")] = query_images_filtered
+            winter = get_test_api(server)
+
+            results = winter.query_images_by_cones(cones)
+            self.assertEqual(server.count("/images/query"), 2)
+
+            for cone, images in zip(cones, results):
+                expected = [x["savepath"] for x in filter_images(cone.model_dump())]
+                self.assertEqual(sorted(images.get("savepath", [])), sorted(expected))
+            self.assertGreater(len(results[0]), 0)
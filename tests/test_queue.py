@@ -0,0 +1,217 @@
+"""
+Tests for bulk operations on the observatory queue
+"""
+
+import logging
+import threading
+import time
+import unittest
+
+from mock_server import TEST_PROGRAM_NAME, MockServer, get_test_api
+from test_dry_run import get_test_too, too_route
+
+from winterapi.endpoints import (
+    SCHEDULE_DELETE_PATH,
+    SCHEDULE_DETAILS_PATH,
+    SCHEDULE_SUMMARY_PATH,
+    WINTER_TOO_PATH,
+)
+from winterapi.queue_cache import QueueCache
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_NAMES = [f"campaign_{i}" for i in range(6)] + ["other"]
+
+
+class MockQueue:
+    """
+    Mock queue of TOO schedules
+    """
+
+    def __init__(self):
+        self.schedule_names = list(SCHEDULE_NAMES)
+        self._lock = threading.Lock()
+
+    def summary(self, *_):
+        """
+        Mock queue summary
+
+        :return: Status code and response
+        """
+        with self._lock:
+            body = [
+                {"prog_name": TEST_PROGRAM_NAME, "too_schedule_name": x}
+                for x in self.schedule_names
+            ]
+        return 200, {"msg": "queue", "body": body}
+
+    def details(self, params, _):
+        """
+        Mock details of a schedule
+
+        :param params: Request parameters
+        :return: Status code and response
+        """
+        name = params["schedule_name"]
+        body = [{"obsHistID": i, "targName": f"{name}_{i}"} for i in range(2)]
+        return 200, {"msg": "details", "body": body}
+
+    def delete(self, params, _):
+        """
+        Mock deletion of a schedule
+
+        :param params: Request parameters
+        :return: Status code and response
+        """
+        with self._lock:
+            name = params["schedule_name"]
+            if name not in self.schedule_names:
+                return 404, {"msg": f"{name} not found", "body": None}
+            self.schedule_names.remove(name)
+        return 200, {"msg": f"Deleted {name}", "body": None}
+
+    def add_routes(self, server: MockServer):
+        """
+        Add the routes of the queue to a server
+
+        :param server: Mock server
+        :return: None
+        """
+        server.routes[("GET", SCHEDULE_SUMMARY_PATH)] = self.summary
+        server.routes[("GET", SCHEDULE_DETAILS_PATH)] = self.details
+        server.routes[("DELETE", SCHEDULE_DELETE_PATH)] = self.delete
+
+
+class TestQueue(unittest.TestCase):
+    """
+    Class for testing bulk queue operations
+    """
+
+    def test_bulk_details(self):
+        """
+        Test getting the details of many schedules at once
+
+        :return: None
+        """
+        logger.info("Testing bulk schedule details")
+
+        with MockServer() as server:
+            MockQueue().add_routes(server)
+            winter = get_test_api(server)
+
+            details = winter.get_too_details_bulk(
+                TEST_PROGRAM_NAME,
+                schedule_filter=lambda x: x["too_schedule_name"].str.startswith(
+                    "campaign"
+                ),
+            )
+            self.assertEqual(len(details), 12)
+            self.assertEqual(
+                sorted(details["too_schedule_name"].unique()), SCHEDULE_NAMES[:-1]
+            )
+            self.assertTrue(
+                all(
+                    x.startswith(y)
+                    for x, y in zip(details["targName"], details["too_schedule_name"])
+                )
+            )
+            self.assertEqual(server.count(SCHEDULE_DETAILS_PATH), 6)
+
+            details = winter.get_too_details_bulk(
+                TEST_PROGRAM_NAME, too_schedule_names=["other"]
+            )
+            self.assertEqual(details["too_schedule_name"].tolist(), ["other"] * 2)
+
+    def test_bulk_delete(self):
+        """
+        Test deleting many schedules at once
+
+        :return: None
+        """
+        logger.info("Testing bulk schedule deletion")
+
+        with MockServer() as server:
+            queue = MockQueue()
+            queue.add_routes(server)
+            winter = get_test_api(server)
+
+            summary = winter.delete_too_requests(
+                TEST_PROGRAM_NAME, too_schedule_names=["campaign_0", "missing"]
+            )
+            self.assertEqual(summary["deleted"].tolist(), [True, False])
+
+            summary = winter.delete_too_requests(
+                TEST_PROGRAM_NAME,
+                schedule_filter=lambda x: x["too_schedule_name"] != "other",
+            )
+            self.assertTrue(summary["deleted"].all())
+            self.assertEqual(len(summary), 5)
+            self.assertEqual(queue.schedule_names, ["other"])
+
+    def test_queue_cache(self):
+        """
+        Test that queue reads are cached, and invalidated by writes
+
+        :return: None
+        """
+        logger.info("Testing the queue cache")
+
+        with MockServer() as server:
+            queue = MockQueue()
+            queue.add_routes(server)
+            server.routes[("POST", WINTER_TOO_PATH)] = too_route
+            winter = get_test_api(server)
+            winter.queue_cache = QueueCache(ttl=60.0)
+
+            for _ in range(3):
+                _, summary = winter.get_observatory_queue(TEST_PROGRAM_NAME)
+                summary["modified"] = True
+            self.assertIn("modified", summary.columns)
+            _, summary = winter.get_observatory_queue(TEST_PROGRAM_NAME)
+            self.assertNotIn("modified", summary.columns)
+            self.assertEqual(server.count(SCHEDULE_SUMMARY_PATH), 1)
+
+            for _ in range(2):
+                winter.get_too_details(TEST_PROGRAM_NAME, "other")
+            winter.get_too_details_bulk(TEST_PROGRAM_NAME)
+            self.assertEqual(server.count(SCHEDULE_DETAILS_PATH), 7)
+
+            winter.delete_too_request(TEST_PROGRAM_NAME, "other")
+            names = winter.get_schedule_names(TEST_PROGRAM_NAME)
+            self.assertEqual(names, SCHEDULE_NAMES[:-1])
+            self.assertEqual(server.count(SCHEDULE_SUMMARY_PATH), 2)
+
+            winter.submit_too(TEST_PROGRAM_NAME, data=get_test_too())
+            winter.get_observatory_queue(TEST_PROGRAM_NAME)
+            self.assertEqual(server.count(SCHEDULE_SUMMARY_PATH), 2)
+
+            winter.submit_too(
+                TEST_PROGRAM_NAME, data=get_test_too(), submit_trigger=True
+            )
+            winter.get_observatory_queue(TEST_PROGRAM_NAME)
+            self.assertEqual(server.count(SCHEDULE_SUMMARY_PATH), 3)
+
+            winter.queue_cache.ttl = 0.05
+            winter.invalidate_queue_cache()
+            winter.get_observatory_queue(TEST_PROGRAM_NAME)
+            time.sleep(0.1)
+            winter.get_observatory_queue(TEST_PROGRAM_NAME)
+            self.assertEqual(server.count(SCHEDULE_SUMMARY_PATH), 5)
+
+    def test_queue_cache_generation(self):
+        """
+        Test that reads which began before an invalidation are not cached
+
+        :return: None
+        """
+        cache = QueueCache(ttl=60.0)
+        generation = cache.get_generation(TEST_PROGRAM_NAME)
+        cache.invalidate(TEST_PROGRAM_NAME)
+        cache.put(TEST_PROGRAM_NAME, "summary", "stale", generation)
+        self.assertIsNone(cache.get(TEST_PROGRAM_NAME, "summary"))
+
+        generation = cache.get_generation(TEST_PROGRAM_NAME)
+        cache.put(TEST_PROGRAM_NAME, "summary", "fresh", generation)
+        self.assertEqual(cache.get(TEST_PROGRAM_NAME, "summary"), "fresh")
+        cache.invalidate()
+        self.assertIsNone(cache.get(TEST_PROGRAM_NAME, "summary"))
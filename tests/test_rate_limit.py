@@ -0,0 +1,100 @@
+"""
+Tests for client-side rate limiting
+"""
+
+import logging
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from mock_server import MockServer, get_test_api
+
+from winterapi.rate_limit import RateLimiter, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class TestRateLimit(unittest.TestCase):
+    """
+    Class for testing rate limiting
+    """
+
+    def test_token_bucket(self):
+        """
+        Test that a token bucket paces requests
+
+        :return: None
+        """
+        bucket = TokenBucket(rate=20.0, burst=1.0)
+        start = time.perf_counter()
+        for _ in range(11):
+            bucket.acquire()
+        self.assertGreater(time.perf_counter() - start, 0.45)
+
+    def test_adaptive_rate(self):
+        """
+        Test that throttled requests reduce the rate and are retried
+
+        :return: None
+        """
+        logger.info("Testing adaptive rate limiting")
+
+        n_calls = []
+
+        def throttled(*_):
+            n_calls.append(1)
+            if len(n_calls) <= 2:
+                return 429, {"msg": "slow down", "body": None}, {"Retry-After": "0.1"}
+            return 200, {"msg": "ok", "body": None}
+
+        with MockServer() as server:
+            server.routes[("GET", "/throttled")] = throttled
+            winter = get_test_api(server)
+            winter.rate_limiter = RateLimiter(rate=40.0)
+
+            res = winter.get("/throttled")
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(server.count("/throttled"), 3)
+
+            bucket = winter.rate_limiter.get_bucket("/throttled")
+            self.assertLess(bucket.rate, 40.0)
+            self.assertEqual(winter.rate_limiter.get_bucket("/other").rate, 40.0)
+
+    def test_shared_state(self):
+        """
+        Test that rate limiters can share their state through a file
+
+        :return: None
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            state_path = Path(temp_dir).joinpath("rate_limit.json")
+            first = RateLimiter(rate=10.0, state_path=state_path)
+            second = RateLimiter(rate=10.0, state_path=state_path)
+
+            first.update("/images/query", 429)
+            second.acquire("/images/query")
+            self.assertEqual(second.get_bucket("/images/query").rate, 5.0)
+
+            # A failed write leaves the previous state intact
+            saved = state_path.read_text(encoding="utf-8")
+            with patch("winterapi.rate_limit.os.replace", side_effect=OSError):
+                with self.assertRaises(OSError):
+                    first.update("/images/query", 429)
+            self.assertEqual(state_path.read_text(encoding="utf-8"), saved)
+            self.assertEqual(list(Path(temp_dir).glob("*.tmp")), [])
+
+            # The state is only written when it changes
+            third = RateLimiter(
+                rate=10.0,
+                max_rate_factor=1.0,
+                state_path=Path(temp_dir).joinpath("other.json"),
+            )
+            third.update("/images/query", 200)
+            with patch("winterapi.rate_limit.os.replace", wraps=os.replace) as replace:
+                third.update("/images/query", 200)
+                self.assertEqual(replace.call_count, 0)
+                third.update("/images/query", 429)
+                self.assertEqual(replace.call_count, 1)
@@ -0,0 +1,117 @@
+"""
+Tests for de-duplicating identical in-flight requests
+"""
+
+import logging
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from mock_server import MockServer, get_test_api
+
+from winterapi.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+N_THREADS = 8
+
+
+def slow_route(params, _):
+    """
+    Mock route which responds slowly
+
+    :param params: Request parameters
+    :return: Status code and response
+    """
+    time.sleep(0.5)
+    return 200, {"msg": "slow", "body": params.get("name")}
+
+
+class TestSingleFlight(unittest.TestCase):
+    """
+    Class for testing single-flight requests
+    """
+
+    def test_shared_error(self):
+        """
+        Test that waiting callers receive the error of the shared call
+
+        :return: None
+        """
+        single_flight = SingleFlight()
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.2)
+            raise ValueError("failed")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(single_flight.do, "key", fail)
+            started.wait()
+            second = executor.submit(single_flight.do, "key", fail)
+            for future in [first, second]:
+                with self.assertRaises(ValueError):
+                    future.result()
+
+        self.assertEqual(single_flight.do("key", lambda: 1), 1)
+
+    def test_identical_requests(self):
+        """
+        Test that identical concurrent requests are only sent once
+
+        :return: None
+        """
+        logger.info("Testing single-flight requests")
+
+        with MockServer() as server:
+            server.routes[("GET", "/slow")] = slow_route
+            winter = get_test_api(server)
+
+            with ThreadPoolExecutor(max_workers=N_THREADS) as executor:
+                futures = [
+                    executor.submit(winter.get, "/slow", name="a")
+                    for _ in range(N_THREADS)
+                ]
+                futures.append(executor.submit(winter.get, "/slow", name="b"))
+                bodies = [x.result().json()["body"] for x in futures]
+
+            self.assertEqual(bodies, ["a"] * N_THREADS + ["b"])
+            self.assertEqual(server.count("/slow"), 2)
+
+    def test_shared_parsing(self):
+        """
+        Test that identical concurrent requests are only parsed once, and that
+        each caller receives its own copy of the result
+
+        :return: None
+        """
+        logger.info("Testing single-flight parsing")
+
+        parsed = []
+
+        def parse(res):
+            parsed.append(res)
+            return pd.DataFrame({"name": [res.json()["body"]]})
+
+        with MockServer() as server:
+            server.routes[("GET", "/slow")] = slow_route
+            winter = get_test_api(server)
+
+            with ThreadPoolExecutor(max_workers=N_THREADS) as executor:
+                futures = [
+                    executor.submit(winter.get_parsed, "/slow", parse, name="a")
+                    for _ in range(N_THREADS)
+                ]
+                tables = [x.result()[1] for x in futures]
+
+            self.assertEqual(server.count("/slow"), 1)
+            self.assertEqual(len(parsed), 1)
+            tables[0]["name"] = "changed"
+            self.assertTrue(all((x["name"] == "a").all() for x in tables[1:]))
+
+            # Other parsers receive their own result
+            _, body = winter.get_parsed("/slow", lambda x: x.json()["body"], name="a")
+            self.assertEqual(body, "a")
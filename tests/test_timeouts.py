@@ -0,0 +1,164 @@
+"""
+Tests for adaptive timeouts and deadlines
+"""
+
+import logging
+import threading
+import time
+import unittest
+
+from mock_server import MockServer, get_test_api
+from test_singleflight import slow_route
+
+from winterapi.rate_limit import RateLimiter
+from winterapi.singleflight import SingleFlight
+from winterapi.timeouts import (
+    AdaptiveTimeouts,
+    ContextThreadPoolExecutor,
+    DeadlineExceededError,
+    deadline,
+    get_remaining_time,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TestTimeouts(unittest.TestCase):
+    """
+    Class for testing timeouts and deadlines
+    """
+
+    def test_adaptive_timeouts(self):
+        """
+        Test that timeouts follow the observed latency of each endpoint
+
+        :return: None
+        """
+        logger.info("Testing adaptive timeouts")
+
+        timeouts = AdaptiveTimeouts(min_timeout=0.1, max_timeout=10.0, min_samples=5)
+        for _ in range(4):
+            timeouts.record("/fast", 0.1)
+        self.assertEqual(timeouts.get_timeout("/fast", default=30.0), 30.0)
+
+        timeouts.record("http://host/fast?x=1", 0.1)
+        self.assertAlmostEqual(timeouts.get_timeout("/fast", default=30.0), 0.3)
+        self.assertEqual(timeouts.get_timeout("/other", default=30.0), 30.0)
+
+        for _ in range(5):
+            timeouts.record("/slow", 100.0)
+        self.assertEqual(timeouts.get_timeout("/slow", default=30.0), 10.0)
+
+    def test_timeout_grows(self):
+        """
+        Test that requests timing out increase the timeout of an endpoint
+
+        :return: None
+        """
+        with MockServer() as server:
+            server.routes[("GET", "/slow")] = slow_route
+            winter = get_test_api(server)
+            winter.timeouts = AdaptiveTimeouts(
+                min_timeout=0.05, max_timeout=5.0, min_samples=1
+            )
+            winter.timeouts.record("/slow", 0.01)
+
+            res = winter.get("/slow", name="a")
+            self.assertEqual(res.json()["body"], "a")
+            self.assertGreater(server.count("/slow"), 1)
+            self.assertGreater(winter.get_timeout("/slow"), 0.5)
+
+    def test_deadline(self):
+        """
+        Test that a deadline is shared by retries, and by worker threads
+
+        :return: None
+        """
+        logger.info("Testing deadlines")
+
+        self.assertIsNone(get_remaining_time())
+
+        with deadline(10.0):
+            with deadline(20.0):
+                self.assertLess(get_remaining_time(), 10.0)
+            with ContextThreadPoolExecutor(max_workers=1) as executor:
+                remaining = executor.submit(get_remaining_time).result()
+                self.assertIsNotNone(remaining)
+                self.assertLess(remaining, 10.0)
+
+        with MockServer() as server:
+            server.routes[("GET", "/slow")] = slow_route
+            winter = get_test_api(server)
+
+            start = time.perf_counter()
+            with self.assertRaises(DeadlineExceededError):
+                with winter.deadline(0.2):
+                    winter.get("/slow", name="a")
+            self.assertLess(time.perf_counter() - start, 0.5)
+            self.assertEqual(server.count("/slow"), 1)
+
+            with winter.deadline(5.0):
+                self.assertEqual(winter.get("/slow", name="b").json()["body"], "b")
+
+    def test_deadline_shared_calls(self):
+        """
+        Test that callers sharing a call are only bound by their own deadline
+
+        :return: None
+        """
+        logger.info("Testing deadlines of shared calls")
+
+        single_flight = SingleFlight()
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            time.sleep(0.5)
+            return 1
+
+        with ContextThreadPoolExecutor(max_workers=1) as executor:
+            leader = executor.submit(single_flight.do, "key", slow)
+            started.wait()
+            start = time.perf_counter()
+            with self.assertRaises(DeadlineExceededError):
+                with deadline(0.1):
+                    single_flight.do("key", slow)
+            self.assertLess(time.perf_counter() - start, 0.4)
+            self.assertEqual(leader.result(), 1)
+
+        with MockServer() as server:
+            server.routes[("GET", "/slow")] = slow_route
+            winter = get_test_api(server)
+
+            def get_with_deadline():
+                with winter.deadline(0.2):
+                    return winter.get("/slow", name="a")
+
+            with ContextThreadPoolExecutor(max_workers=2) as executor:
+                first = executor.submit(get_with_deadline)
+                time.sleep(0.05)
+                second = executor.submit(winter.get, "/slow", name="a")
+                with self.assertRaises(DeadlineExceededError):
+                    first.result()
+                self.assertEqual(second.result().json()["body"], "a")
+
+    def test_deadline_rate_limit(self):
+        """
+        Test that waiting for the rate limit is cut short by the deadline
+
+        :return: None
+        """
+        logger.info("Testing deadlines with rate limits")
+
+        with MockServer() as server:
+            winter = get_test_api(server)
+            winter.rate_limiter = RateLimiter(rate=10.0)
+            winter.rate_limiter.get_bucket("/ping").on_throttle(retry_after=10.0)
+
+            self.assertFalse(winter.rate_limiter.acquire("/ping", timeout=0.1))
+
+            start = time.perf_counter()
+            with self.assertRaises(DeadlineExceededError):
+                with winter.deadline(0.2):
+                    winter.get("/ping")
+            self.assertLess(time.perf_counter() - start, 1.0)
@@ -0,0 +1,182 @@
+"""
+Tests for ToO requests given as a table
+"""
+
+import json
+import logging
+import unittest
+
+import pandas as pd
+from mock_server import TEST_PROGRAM, TEST_PROGRAM_NAME, MockServer, get_test_api
+from wintertoo.errors import WinterValidationError
+from wintertoo.models import SummerRaDecToO, WinterFieldToO, WinterRaDecToO
+
+from winterapi.base_api import BaseAPI
+from winterapi.endpoints import SUMMER_TOO_PATH, WINTER_TOO_PATH
+from winterapi.fields import build_schedule
+from winterapi.too_table import build_schedule_table, get_too_payload, get_too_table
+
+logger = logging.getLogger(__name__)
+
+TIMES = {"start_time_mjd": 62721.1894969287, "end_time_mjd": 62722.1894969452}
+
+TEST_ROWS = [
+    {"target_name": "radec", "ra_deg": 210.9107, "dec_deg": 54.3117, "t_exp": 300.0},
+    {"target_name": "field", "field_id": 3944, "filters": "J, Hs", "n_repetitions": 2},
+    {
+        "target_name": "grid",
+        "ra_deg": 230.0,
+        "dec_deg": 40.0,
+        "use_field_grid": True,
+        "use_best_detector": False,
+        "target_priority": 10.0,
+        "n_dither": 4,
+    },
+]
+
+
+def get_test_kwargs() -> list[dict]:
+    """
+    Get the test rows as keyword arguments for the ToO models
+
+    :return: List of keyword arguments
+    """
+    kwargs = []
+    for row in TEST_ROWS:
+        row = {**row, **TIMES}
+        if "t_exp" in row:
+            row["total_exposure_time"] = row.pop("t_exp")
+        if isinstance(row.get("filters"), str):
+            row["filters"] = [x.strip() for x in row["filters"].split(",")]
+        kwargs.append(row)
+    return kwargs
+
+
+def get_test_models() -> list[WinterRaDecToO | WinterFieldToO]:
+    """
+    Get the test rows as ToO models
+
+    :return: List of ToO requests
+    """
+    return [
+        WinterFieldToO(**row) if "field_id" in row else WinterRaDecToO(**row)
+        for row in get_test_kwargs()
+    ]
+
+
+def get_test_table() -> pd.DataFrame:
+    """
+    Get the test rows as a table
+
+    :return: Table of ToO requests
+    """
+    return pd.DataFrame([{**x, **TIMES} for x in TEST_ROWS])
+
+
+class TestTooTable(unittest.TestCase):
+    """
+    Class for testing ToO tables
+    """
+
+    def test_payload(self):
+        """
+        Test that tables are serialised as the equivalent models would be
+
+        :return: None
+        """
+        logger.info("Testing ToO table payloads")
+
+        expected = json.loads(BaseAPI.clean_data(get_test_models()))
+
+        df = get_too_table(get_test_table())
+        self.assertEqual(json.loads(get_too_payload(df)), expected)
+
+        records = get_test_table().drop(columns=["filters"]).to_records(index=False)
+        payload = json.loads(get_too_payload(get_too_table(records)))
+        self.assertEqual(payload[0], expected[0])
+        self.assertEqual(payload[1]["filters"], ["Y", "J", "Hs"])
+
+        summer = get_too_table(get_test_table().iloc[[0]], camera="summer")
+        expected = SummerRaDecToO(**get_test_kwargs()[0]).model_dump(
+            exclude=set(SummerRaDecToO.model_computed_fields)
+        )
+        self.assertEqual(json.loads(get_too_payload(summer)), [expected])
+
+    def test_schedule(self):
+        """
+        Test that schedules built from tables match those built from models
+
+        :return: None
+        """
+        logger.info("Testing ToO table schedules")
+
+        schedule = build_schedule_table(
+            get_too_table(get_test_table()), program=TEST_PROGRAM
+        )
+        expected = build_schedule(get_test_models(), program=TEST_PROGRAM)
+        pd.testing.assert_frame_equal(schedule, expected, check_dtype=False)
+
+    def test_validation(self):
+        """
+        Test that invalid rows are rejected
+
+        :return: None
+        """
+        logger.info("Testing ToO table validation")
+
+        for update in [
+            {"filters": "J, z"},
+            {"ra_deg": None},
+            {"use_best_detector": True},
+            {"start_time_mjd": 62723.0},
+            {"n_dither": 1, "total_exposure_time": 600.0},
+            {"target_name": "x" * 100},
+            {"unknown": 1.0},
+        ]:
+            table = get_test_table()
+            for key, value in update.items():
+                table.loc[2, key] = value
+            with self.assertRaises(WinterValidationError):
+                get_too_table(table)
+
+    def test_submit_table(self):
+        """
+        Test submitting a table of ToO requests
+
+        :return: None
+        """
+        logger.info("Testing ToO table submission")
+
+        bodies = []
+
+        def too_route(_, body):
+            bodies.append(json.loads(body))
+            return 200, {"msg": "Dry run", "body": []}
+
+        with MockServer() as server:
+            server.routes[("POST", WINTER_TOO_PATH)] = too_route
+            server.routes[("POST", SUMMER_TOO_PATH)] = too_route
+            winter = get_test_api(server)
+
+            winter.submit_too_table(TEST_PROGRAM_NAME, get_test_table())
+            self.assertEqual(
+                bodies[-1], json.loads(BaseAPI.clean_data(get_test_models()))
+            )
+
+            winter.submit_too_table(
+                TEST_PROGRAM_NAME, get_test_table().iloc[[0]], camera="summer"
+            )
+            self.assertEqual(server.count(SUMMER_TOO_PATH), 1)
+            self.assertEqual(bodies[-1][0]["camera"], "summer")
+
+            _, schedule = winter.submit_too_table(
+                TEST_PROGRAM_NAME, get_test_table(), local_dry_run=True
+            )
+            self.assertEqual(server.count(WINTER_TOO_PATH), 1)
+            self.assertTrue(
+                schedule.equals(
+                    winter.build_schedule_locally_table(
+                        get_test_table(), TEST_PROGRAM_NAME
+                    )
+                )
+            )
@@ -0,0 +1,148 @@
+"""
+Test for streaming transfers
+"""
+
+import hashlib
+import io
+import logging
+import socket
+import threading
+import time
+import unittest
+
+import requests
+from urllib3 import HTTPResponse
+
+from winterapi.transfer import IntegrityError, StalledTransferError, Transfer
+
+logger = logging.getLogger(__name__)
+
+
+class SlowStream(io.BytesIO):
+    """
+    Stream which sleeps before each read
+    """
+
+    def __init__(self, content: bytes, delay: float):
+        super().__init__(content)
+        self.delay = delay
+
+    def read(self, *args, **kwargs):
+        time.sleep(self.delay)
+        return super().read(*args, **kwargs)
+
+
+def get_response(stream: io.BytesIO, headers: dict | None = None) -> requests.Response:
+    """
+    Get a streamed response for a stream
+
+    :param stream: Stream of the response content
+    :param headers: Headers of the response
+    :return: Response
+    """
+    res = requests.Response()
+    res.status_code = 200
+    res.raw = HTTPResponse(body=stream, headers=headers, preload_content=False)
+    return res
+
+
+def serve_stalled_response(sock: socket.socket, delay: float):
+    """
+    Serve one response, which stops sending before the end of its content
+
+    :param sock: Listening socket
+    :param delay: Time to stall for before closing the connection
+    :return: None
+    """
+    conn, _ = sock.accept()
+    with conn:
+        conn.recv(2**16)
+        conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 1000\r\n\r\n" + b"0" * 100)
+        time.sleep(delay)
+
+
+class TestTransfer(unittest.TestCase):
+    """
+    Class for testing transfers
+    """
+
+    def test_progress(self):
+        """
+        Test progress reporting and adaptive chunk sizes
+
+        :return: None
+        """
+        logger.info("Testing transfer progress")
+
+        content = bytes(range(256)) * 2**14
+        updates = []
+        transfer = Transfer(progress_callback=updates.append, progress_interval=0.0)
+
+        output_f = io.BytesIO()
+        transfer.write(get_response(io.BytesIO(content)), output_f)
+
+        assert output_f.getvalue() == content
+        assert updates[-1].finished
+        assert updates[-1].bytes_received == len(content)
+        assert updates[-1].chunk_size > updates[0].chunk_size
+
+    def test_stall(self):
+        """
+        Test that a slow transfer is aborted
+
+        :return: None
+        """
+        logger.info("Testing stalled transfers")
+
+        transfer = Transfer(chunk_size=16, min_rate=1.0e6, stall_window=0.1)
+
+        with self.assertRaises(StalledTransferError):
+            transfer.write(
+                get_response(SlowStream(b"0" * 2**12, delay=0.02)), io.BytesIO()
+            )
+
+    def test_checksum(self):
+        """
+        Test that the checksum is computed during the transfer, and verified
+
+        :return: None
+        """
+        logger.info("Testing transfer checksums")
+
+        content = b"image data" * 1000
+        transfer = Transfer()
+
+        res = get_response(io.BytesIO(content))
+        res.headers["X-Checksum-Sha256"] = hashlib.sha256(content).hexdigest()
+        transfer.write(res, io.BytesIO())
+        assert transfer.hexdigest == hashlib.sha256(content).hexdigest()
+
+        res = get_response(io.BytesIO(content[:-1]))
+        res.headers["X-Checksum-Sha256"] = hashlib.sha256(content).hexdigest()
+        with self.assertRaises(IntegrityError):
+            transfer.write(res, io.BytesIO())
+
+    def test_read_errors(self):
+        """
+        Test that errors while reading are raised as requests exceptions
+
+        :return: None
+        """
+        logger.info("Testing transfer read errors")
+
+        # The connection closes before the end of the content
+        res = get_response(io.BytesIO(b"0" * 100), headers={"Content-Length": "1000"})
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            Transfer().write(res, io.BytesIO())
+
+        with socket.create_server(("127.0.0.1", 0)) as sock:
+            thread = threading.Thread(target=serve_stalled_response, args=(sock, 2.0))
+            thread.start()
+            url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+            start = time.perf_counter()
+            with requests.get(url, stream=True, timeout=30.0) as res:
+                with self.assertRaises(StalledTransferError):
+                    Transfer(min_rate=1.0, stall_window=0.5).write(res, io.BytesIO())
+            self.assertLess(time.perf_counter() - start, 2.0)
+            thread.join()
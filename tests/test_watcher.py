@@ -0,0 +1,270 @@
+"""
+Tests for watching for and downloading new images
+"""
+
+import json
+import logging
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from astropy import units as u
+from astropy.time import Time
+from mock_server import TEST_PROGRAM_NAME, MockServer, get_test_api
+from test_image_store import IMAGE_TYPE, download_list, get_name
+from wintertoo.models import ProgramImageQuery
+from wintertoo.utils import get_date
+
+from winterapi.endpoints import DOWNLOAD_LIST_PATH, IMAGE_QUERY_PATH
+from winterapi.image_store import ImageStore
+from winterapi.transfer import Transfer
+from winterapi.watcher import ImageWatcher
+
+logger = logging.getLogger(__name__)
+
+TODAY = get_date(Time.now())
+YESTERDAY = get_date(Time.now() - 1.0 * u.day)
+
+
+class MockArchive:
+    """
+    Mock image archive, to which new images can be added
+    """
+
+    def __init__(self):
+        self.images = []
+        self.queries = []
+
+    def add_image(self, name: str, nightdate: int):
+        """
+        Add an image to the archive
+
+        :param name: Name of the image
+        :param nightdate: Night of the image
+        :return: None
+        """
+        self.images.append(
+            {
+                "progname": TEST_PROGRAM_NAME,
+                "nightdate": f"{nightdate // 10000}-{nightdate // 100 % 100:02d}-"
+                f"{nightdate % 100:02d}",
+                "savepath": f"/data/{name}.fits",
+            }
+        )
+
+    def query(self, _, body):
+        """
+        Mock image query, filtering by date
+
+        :param body: Request body
+        :return: Status code and response
+        """
+        query = json.loads(body)[0]
+        self.queries.append(query)
+        images = [
+            x
+            for x in self.images
+            if int(query["start_date"])
+            <= int(x["nightdate"].replace("-", ""))
+            <= int(query["end_date"])
+        ]
+        return 200, {"msg": "images", "body": images}
+
+
+def partial_download_list(params, body):
+    """
+    Mock download of a list of images, in which broken images are missing
+
+    :param params: Request parameters
+    :param body: Request body
+    :return: Status code and zip file content
+    """
+    entries = [x for x in json.loads(body) if "broken" not in x["path"]]
+    return download_list(params, json.dumps(entries))
+
+
+class TestWatcher(unittest.TestCase):
+    """
+    Class for testing the image watcher
+    """
+
+    def test_poll(self):
+        """
+        Test that each poll only downloads new images
+
+        :return: None
+        """
+        logger.info("Testing image watcher polls")
+
+        archive = MockArchive()
+        archive.add_image("a", YESTERDAY)
+        archive.add_image("b", YESTERDAY)
+
+        with MockServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+            server.routes[("GET", IMAGE_QUERY_PATH)] = archive.query
+            server.routes[("GET", DOWNLOAD_LIST_PATH)] = download_list
+            winter = get_test_api(server)
+
+            received = {}
+            query = ProgramImageQuery(
+                program_name=TEST_PROGRAM_NAME,
+                start_date=YESTERDAY - 100,
+                image_type=IMAGE_TYPE,
+            )
+            watcher = ImageWatcher(
+                winter,
+                query,
+                store=ImageStore(temp_dir),
+                callbacks=[lambda x, y: received.update({x["savepath"]: y})],
+            )
+
+            watcher.poll()
+            watcher.wait()
+            self.assertEqual(sorted(received), ["/data/a.fits", "/data/b.fits"])
+            self.assertEqual(get_name(received["/data/a.fits"]), "a.fits")
+            self.assertEqual(server.count(DOWNLOAD_LIST_PATH), 1)
+
+            archive.add_image("c", TODAY)
+            watcher.poll()
+            watcher.wait()
+            self.assertEqual(archive.queries[-1]["start_date"], YESTERDAY)
+            self.assertEqual(len(received), 3)
+            self.assertEqual(server.count(DOWNLOAD_LIST_PATH), 2)
+
+            watcher.poll()
+            watcher.wait()
+            self.assertEqual(archive.queries[-1]["start_date"], TODAY)
+            self.assertEqual(server.count(DOWNLOAD_LIST_PATH), 2)
+
+            # Downloads are deferred while the store is over its budget
+            watcher.max_store_bytes = 1
+            archive.add_image("d", TODAY)
+            watcher.poll()
+            watcher.wait()
+            self.assertEqual(len(received), 3)
+            self.assertEqual(len(watcher.pending), 1)
+
+            watcher.max_store_bytes = None
+            watcher.poll()
+            watcher.stop()
+            self.assertEqual(len(received), 4)
+            self.assertEqual(len(watcher.pending), 0)
+
+    def test_background(self):
+        """
+        Test that callbacks are run for images found by the background thread
+
+        :return: None
+        """
+        logger.info("Testing background image watcher")
+
+        archive = MockArchive()
+        archive.add_image("a", TODAY)
+
+        with MockServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+            server.routes[("GET", IMAGE_QUERY_PATH)] = archive.query
+            server.routes[("GET", DOWNLOAD_LIST_PATH)] = download_list
+            winter = get_test_api(server)
+
+            done = threading.Event()
+            query = ProgramImageQuery(
+                program_name=TEST_PROGRAM_NAME, start_date=TODAY, image_type=IMAGE_TYPE
+            )
+            with ImageWatcher(
+                winter, query, store=ImageStore(temp_dir), poll_interval=0.1
+            ) as watcher:
+                watcher.add_callback(lambda x, y: done.set())
+                archive.add_image("b", TODAY)
+                self.assertTrue(done.wait(timeout=30.0))
+
+    def test_restart(self):
+        """
+        Test that the background thread survives failed polls, and that a
+        stopped watcher can be started again
+
+        :return: None
+        """
+        logger.info("Testing image watcher restarts")
+
+        archive = MockArchive()
+        archive.add_image("a", TODAY)
+
+        with MockServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+            server.routes[("GET", IMAGE_QUERY_PATH)] = archive.query
+            server.routes[("GET", DOWNLOAD_LIST_PATH)] = download_list
+            winter = get_test_api(server)
+
+            received = []
+            done = threading.Event()
+            query = ProgramImageQuery(
+                program_name=TEST_PROGRAM_NAME, start_date=TODAY, image_type=IMAGE_TYPE
+            )
+            watcher = ImageWatcher(
+                winter, query, store=ImageStore(temp_dir), poll_interval=0.1
+            )
+            watcher.add_callback(lambda x, y: (received.append(x), done.set()))
+
+            # The first poll fails unexpectedly
+            failures = [RuntimeError("Disk error")]
+
+            def is_over_budget():
+                if failures:
+                    raise failures.pop()
+                return False
+
+            with patch.object(watcher, "is_over_budget", side_effect=is_over_budget):
+                watcher.start()
+                self.assertTrue(done.wait(timeout=30.0))
+                watcher.stop()
+
+            done.clear()
+            archive.add_image("b", TODAY)
+            with watcher:
+                self.assertTrue(done.wait(timeout=30.0))
+            self.assertEqual(
+                [x["savepath"] for x in received], ["/data/a.fits", "/data/b.fits"]
+            )
+
+    def test_retries(self):
+        """
+        Test that images which cannot be downloaded are eventually given up on
+
+        :return: None
+        """
+        logger.info("Testing image watcher retries")
+
+        archive = MockArchive()
+        archive.add_image("a", TODAY)
+        archive.add_image("broken", TODAY)
+
+        with MockServer() as server, tempfile.TemporaryDirectory() as temp_dir:
+            server.routes[("GET", IMAGE_QUERY_PATH)] = archive.query
+            server.routes[("GET", DOWNLOAD_LIST_PATH)] = partial_download_list
+            winter = get_test_api(server)
+
+            received = []
+            query = ProgramImageQuery(
+                program_name=TEST_PROGRAM_NAME, start_date=TODAY, image_type=IMAGE_TYPE
+            )
+            watcher = ImageWatcher(
+                winter,
+                query,
+                store=ImageStore(temp_dir),
+                callbacks=[lambda x, y: received.append(x["savepath"])],
+                max_retries=2,
+                transfer=Transfer(),
+            )
+
+            for _ in range(5):
+                watcher.poll()
+                watcher.wait()
+
+            self.assertEqual(received, ["/data/a.fits"])
+            self.assertEqual(server.count(DOWNLOAD_LIST_PATH), 3)
+            self.assertEqual(len(watcher.pending), 0)
+            self.assertEqual(
+                [x["savepath"] for x in watcher.failed.values()],
+                ["/data/broken.fits"],
+            )
+            watcher.stop()
@@ -0,0 +1,235 @@
+"""
+Module for a local credential agent.
+
+The agent holds the decrypted credentials in memory, and serves them to other
+processes of the same user over a Unix domain socket, so that each process
+does not need to access the keyring and decrypt the secrets file itself.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+from pathlib import Path
+
+from winterapi.credentials import WinterAPICredentials
+from winterapi.fidelius import Fidelius
+
+logger = logging.getLogger(__name__)
+
+AGENT_SOCKET_ENV = "WINTERAPI_AGENT_SOCKET"
+DEFAULT_AGENT_SOCKET = Path.home().joinpath(".winterapi_agent.sock")
+AGENT_TIMEOUT = 5.0
+
+
+class AgentError(ConnectionError):
+    """Error raised when the credential agent cannot serve a request"""
+
+
+def get_agent_socket_path(socket_path: str | Path | None = None) -> Path:
+    """
+    Get the path of the agent socket, from the environment if not provided.
+
+    :param socket_path: Path of the socket
+    :return: Path of the socket
+    """
+    if socket_path is None:
+        socket_path = os.environ.get(AGENT_SOCKET_ENV, DEFAULT_AGENT_SOCKET)
+    return Path(socket_path)
+
+
+def get_peer_uid(sock: socket.socket) -> int | None:
+    """
+    Get the user id of the process at the other end of a Unix socket.
+
+    :param sock: Connected socket
+    :return: User id, or None if not supported on this platform
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds = sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid
+
+
+class AgentHandler(socketserver.StreamRequestHandler):
+    """
+    Handler for requests to the credential agent, one JSON line per request
+    """
+
+    def handle(self):
+        peer_uid = get_peer_uid(self.request)
+        if peer_uid is not None and peer_uid != os.getuid():
+            logger.warning(f"Rejected credential request from user id {peer_uid}")
+            response = {"status": "error", "msg": "Permission denied"}
+        else:
+            try:
+                request = json.loads(self.rfile.readline())
+                response = self.server.handle_command(request.get("command"))
+            except (ValueError, AttributeError) as exc:
+                response = {"status": "error", "msg": f"Bad request: {exc}"}
+
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class CredentialAgent(socketserver.ThreadingUnixStreamServer):
+    """
+    Agent serving credentials over a Unix domain socket.
+
+    The socket is only accessible by the current user, and on platforms which
+    support it, the user id of each connecting process is also checked.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path: str | Path | None = None,
+        fidelius: Fidelius | None = None,
+    ):
+        self.socket_path = get_agent_socket_path(socket_path)
+        self.fidelius = fidelius if fidelius is not None else Fidelius()
+
+        if self.socket_path.exists():
+            if is_agent_running(self.socket_path):
+                err = f"A credential agent is already running at {self.socket_path}"
+                logger.error(err)
+                raise AgentError(err)
+            self.socket_path.unlink()
+
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(str(self.socket_path), AgentHandler)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.socket_path, 0o600)
+
+    def handle_command(self, command: str) -> dict:
+        """
+        Handle a command sent to the agent.
+
+        :param command: Name of the command
+        :return: Response dictionary
+        """
+        if command == "get_credentials":
+            return {
+                "status": "ok",
+                "body": self.fidelius.credentials.model_dump(
+                    mode="json", exclude_none=True
+                ),
+            }
+        if command == "reload":
+            self.fidelius.reload_secrets()
+            return {"status": "ok", "body": None}
+        if command == "ping":
+            return {"status": "ok", "body": "pong"}
+        return {"status": "error", "msg": f"Unknown command {command}"}
+
+    def server_close(self):
+        super().server_close()
+        self.socket_path.unlink(missing_ok=True)
+
+
+def send_agent_command(
+    command: str,
+    socket_path: str | Path | None = None,
+    timeout: float = AGENT_TIMEOUT,
+):
+    """
+    Send a command to the credential agent.
+
+    :param command: Name of the command
+    :param socket_path: Path of the agent socket
+    :param timeout: Timeout for the request
+    :return: Body of the response
+    """
+    socket_path = get_agent_socket_path(socket_path)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(socket_path))
+            sock.sendall(json.dumps({"command": command}).encode() + b"\n")
+            with sock.makefile("rb") as in_f:
+                response = json.loads(in_f.readline())
+    except (OSError, ValueError) as exc:
+        err = f"Could not reach credential agent at {socket_path}: {exc}"
+        raise AgentError(err) from exc
+
+    if response.get("status") != "ok":
+        err = f"Credential agent returned an error: {response.get('msg')}"
+        logger.error(err)
+        raise AgentError(err)
+
+    return response["body"]
+
+
+def is_agent_running(socket_path: str | Path | None = None) -> bool:
+    """
+    Check whether a credential agent is running.
+
+    :param socket_path: Path of the agent socket
+    :return: boolean
+    """
+    try:
+        send_agent_command("ping", socket_path=socket_path)
+        return True
+    except AgentError:
+        return False
+
+
+class AgentFidelius(Fidelius):
+    """
+    Fidelius which loads the secrets from a credential agent.
+
+    Changes are still made to the secrets file itself, after which the agent
+    is told to reload them.
+    """
+
+    def __init__(self, socket_path: str | Path | None = None):
+        self.socket_path = get_agent_socket_path(socket_path)
+        super().__init__()
+
+    def load_secrets(self) -> WinterAPICredentials:
+        """
+        Load the secrets from the credential agent.
+
+        :return: Credentials
+        """
+        secret_dict = send_agent_command(
+            "get_credentials", socket_path=self.socket_path
+        )
+        return WinterAPICredentials(**secret_dict)
+
+    def export_secrets(self):
+        """
+        Export the secrets to the keyring, and reload them in the agent.
+
+        :return: None
+        """
+        super().export_secrets()
+        send_agent_command("reload", socket_path=self.socket_path)
+
+
+def get_fidelius(socket_path: str | Path | None = None) -> Fidelius:
+    """
+    Get a Fidelius, using the credential agent if one is configured.
+
+    The agent is used if a socket path is provided, or set with the
+    WINTERAPI_AGENT_SOCKET environment variable. If the agent cannot be
+    reached, the secrets are loaded directly instead.
+
+    :param socket_path: Path of the agent socket
+    :return: Fidelius
+    """
+    if socket_path is None and AGENT_SOCKET_ENV not in os.environ:
+        return Fidelius()
+
+    try:
+        return AgentFidelius(socket_path=socket_path)
+    except AgentError as exc:
+        logger.warning(f"{exc}, loading credentials directly instead")
+        return Fidelius()
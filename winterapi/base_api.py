@@ -5,15 +5,56 @@ Module with the base class for generic API interactions
 import json
 import logging
 import re
+import time
 from pathlib import Path
+from typing import Any, Callable
 
 import backoff
 import requests
+import urllib3
 from pydantic import BaseModel
 
+from winterapi.cassette import Cassette
+from winterapi.endpoints import HostPool
+from winterapi.rate_limit import THROTTLE_STATUS_CODES, RateLimiter
+from winterapi.singleflight import SingleFlight, get_flight_key
+from winterapi.timeouts import (
+    AdaptiveTimeouts,
+    DeadlineExceededError,
+    check_deadline,
+    deadline,
+    get_deadline,
+    get_max_time,
+    get_remaining_time,
+    is_deadline_exceeded,
+)
+from winterapi.transfer import Transfer
+
 logger = logging.getLogger(__name__)
 
 MAX_TIMEOUT = 30.0
+DEFAULT_POOL_SIZE = 32
+IDEMPOTENT_METHODS = ["GET", "HEAD", "OPTIONS", "PUT", "DELETE"]
+
+
+class ThrottledError(requests.exceptions.HTTPError):
+    """Error raised when the server throttles a request, so it can be retried"""
+
+
+def is_connect_error(exc: requests.exceptions.RequestException) -> bool:
+    """
+    Check whether a request failed before connecting, so never reached the server.
+
+    :param exc: Error raised by the request
+    :return: boolean
+    """
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(exc, requests.exceptions.ConnectionError):
+        return False
+    reason = exc.args[0] if len(exc.args) > 0 else None
+    reason = getattr(reason, "reason", reason)
+    return isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
 
 
 class BaseAPI:
@@ -21,6 +62,65 @@ class BaseAPI:
     Base class for interacting with the API
     """
 
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        cassette: Cassette | None = None,
+        base_urls: list[str] | str | None = None,
+        prefer_fastest: bool = False,
+        rate_limiter: RateLimiter | None = None,
+        timeouts: AdaptiveTimeouts | None = None,
+    ):
+        self.cassette = cassette
+        self.hosts = HostPool(base_urls=base_urls, prefer_fastest=prefer_fastest)
+        self.rate_limiter = rate_limiter
+        self.timeouts = timeouts
+        self.session = self.get_session()
+        self.single_flight = SingleFlight()
+
+    @staticmethod
+    def get_session(pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+        """
+        Get a session with a connection pool, to be shared by all threads.
+
+        :param pool_size: Maximum number of connections kept open per host
+        :return: Session
+        """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @staticmethod
+    def deadline(seconds: float):
+        """
+        Context manager setting an overall deadline, shared by all requests and
+        retries made within it.
+
+        :param seconds: Time allowed, in seconds
+        :return: Context manager
+        """
+        return deadline(seconds)
+
+    def get_timeout(self, url: str, default: float = MAX_TIMEOUT) -> float:
+        """
+        Get the timeout for a request, adapted to the endpoint if adaptive
+        timeouts are in use, and never beyond the current deadline.
+
+        :param url: URL or endpoint path
+        :param default: Timeout to use without enough latency information
+        :return: Timeout in seconds
+        """
+        timeout = default
+        if self.timeouts is not None:
+            timeout = self.timeouts.get_timeout(url, default=default)
+        remaining = check_deadline(url)
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        return timeout
+
     def get_auth(self):
         """
         Get the authentication details.
@@ -34,11 +134,15 @@ class BaseAPI:
         """
         Clean the data for the API.
 
+        Data which is already serialised (a JSON string) is passed through.
+
         :param data: Data to clean.
         :return: Cleaned data.
         """
 
-        if isinstance(data, list):
+        if isinstance(data, str):
+            convert = data
+        elif isinstance(data, list):
             convert = json.dumps(
                 [
                     x.model_dump(exclude=set(x.model_computed_fields.keys()))
@@ -56,40 +160,241 @@ class BaseAPI:
 
         return convert
 
+    def _handle_timeout(
+        self, url: str, timeout: float, exc: requests.exceptions.Timeout
+    ):
+        """
+        Handle a request which timed out.
+
+        If the deadline has passed, the request was cut short by it, and an
+        error is raised so that it is not retried. Otherwise, the timeout is
+        counted as the latency of the endpoint, so that its timeout grows.
+
+        :param url: URL or endpoint path
+        :param timeout: Timeout of the request
+        :param exc: Timeout error
+        :return: None
+        """
+        remaining = get_remaining_time()
+        if remaining is not None and remaining <= 0.0:
+            err = f"Deadline exceeded during request to {url}"
+            logger.error(err)
+            raise DeadlineExceededError(err) from exc
+        if self.timeouts is not None:
+            self.timeouts.record(url, timeout)
+
+    def _send(  # pylint: disable=too-many-arguments,too-many-locals,too-many-branches
+        self,
+        method: str,
+        url: str,
+        auth=None,
+        data: str | None = None,
+        params: dict | None = None,
+        timeout: float = MAX_TIMEOUT,
+        stream: bool = False,
+    ) -> requests.Response:
+        """
+        Send a request, recording or replaying it if a cassette is in use.
+
+        URLs given as a path (e.g. '/ping') are resolved against the configured
+        hosts, failing over to the next host if one cannot be reached. Requests
+        which are not idempotent (e.g. ToO submissions) only fail over if they
+        could not connect, since otherwise they may have reached the server.
+
+        If a rate limiter is set, the request waits for its endpoint budget.
+        Requests throttled by the server (HTTP 429/503) raise a ThrottledError,
+        so that they are retried.
+
+        The timeout is adapted to the endpoint if adaptive timeouts are in use,
+        and is cut short by any deadline set by the caller.
+
+        :param method: HTTP method
+        :param url: URL or endpoint path for the request
+        :param auth: Authentication details
+        :param data: Serialised body of the request
+        :param params: Parameters for the request
+        :param timeout: Default timeout for the request
+        :param stream: Whether to stream the response
+        :return: API response
+        """
+        if self.cassette is not None and self.cassette.is_replay:
+            return self.cassette.replay(method, url, params=params, data=data)
+
+        if url.startswith("/"):
+            base_urls = self.hosts.get_candidates(read=method.upper() == "GET")
+        else:
+            base_urls = [None]
+
+        for i, base_url in enumerate(base_urls):
+            full_url = url if base_url is None else base_url + url
+            if self.rate_limiter is not None:
+                if not self.rate_limiter.acquire(url, timeout=check_deadline(url)):
+                    err = f"Deadline exceeded waiting for rate limit of {url}"
+                    logger.error(err)
+                    raise DeadlineExceededError(err)
+            request_timeout = self.get_timeout(url, default=timeout)
+            start = time.perf_counter()
+            try:
+                res = self.session.request(
+                    method,
+                    full_url,
+                    data=data,
+                    auth=auth,
+                    params=params,
+                    timeout=request_timeout,
+                    stream=stream,
+                )
+                break
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as exc:
+                if isinstance(exc, requests.exceptions.Timeout):
+                    self._handle_timeout(url, request_timeout, exc)
+                if base_url is None:
+                    raise
+                if method.upper() not in IDEMPOTENT_METHODS and not is_connect_error(
+                    exc
+                ):
+                    raise
+                self.hosts.mark_unhealthy(base_url)
+                if i == len(base_urls) - 1:
+                    raise
+
+        if self.timeouts is not None:
+            self.timeouts.record(url, time.perf_counter() - start)
+
+        # Streamed responses are recorded from the file they are written to
+        if self.cassette is not None and not stream:
+            self.cassette.record(method, url, res, params=params, data=data)
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.update(
+                url, res.status_code, retry_after=res.headers.get("Retry-After")
+            )
+
+        if res.status_code in THROTTLE_STATUS_CODES:
+            err = f"Request to {url} throttled by server with status {res.status_code}"
+            logger.warning(err)
+            res.close()
+            raise ThrottledError(err, response=res)
+
+        return res
+
     @backoff.on_exception(
-        backoff.expo, requests.exceptions.RequestException, max_time=MAX_TIMEOUT
+        backoff.expo,
+        requests.exceptions.RequestException,
+        max_time=lambda: get_max_time(MAX_TIMEOUT),
+        giveup=is_deadline_exceeded,
     )
     def get(self, url, auth=None, data=None, **kwargs) -> requests.Response:
         """
         Run a get request.
 
+        Identical requests made concurrently from several threads share a
+        single call to the server, and all receive the same response.
+
         :param url: URL to get.
         :param auth: Authentication details.
         :param data: Data to get.
         :param kwargs: additional arguments for API.
         :return: API response.
         """
+        res, _ = self._get_shared(url, auth=auth, data=data, params=kwargs)
+        return res
+
+    @backoff.on_exception(
+        backoff.expo,
+        requests.exceptions.RequestException,
+        max_time=lambda: get_max_time(MAX_TIMEOUT),
+        giveup=is_deadline_exceeded,
+    )
+    def get_parsed(
+        self,
+        url,
+        parse: Callable[[requests.Response], Any],
+        auth=None,
+        data=None,
+        **kwargs,
+    ) -> tuple[requests.Response, Any]:
+        """
+        Run a get request, and parse the response.
+
+        Identical requests made concurrently from several threads share both
+        the call to the server and the parsing of the response. Each caller
+        receives its own copy of the parsed result, if it has a copy method.
+
+        :param url: URL to get.
+        :param parse: Function to parse a successful response.
+        :param auth: Authentication details.
+        :param data: Data to get.
+        :param kwargs: additional arguments for API.
+        :return: API response and parsed result.
+        """
+        return self._get_shared(url, auth=auth, data=data, params=kwargs, parse=parse)
+
+    def _get_shared(  # pylint: disable=too-many-arguments
+        self,
+        url,
+        auth=None,
+        data=None,
+        params: dict | None = None,
+        parse: Callable[[requests.Response], Any] | None = None,
+    ) -> tuple[requests.Response, Any]:
+        """
+        Run a get request, sharing it with identical concurrent requests.
+
+        :param url: URL to get.
+        :param auth: Authentication details.
+        :param data: Data to get.
+        :param params: additional arguments for API.
+        :param parse: Function to parse a successful response, if any.
+        :return: API response and parsed result (None without a parser).
+        """
         if auth is None:
             auth = self.get_auth()
 
         if data is not None:
             data = self.clean_data(data)
 
-        res = requests.get(
-            url, data=data, auth=auth, params=kwargs, timeout=MAX_TIMEOUT
+        def call():
+            res = self._send("GET", url, data=data, auth=auth, params=params)
+            if parse is None or res.status_code != 200:
+                return res, None
+            return res, parse(res)
+
+        def copy(result):
+            res, parsed = result
+            return res, parsed.copy() if hasattr(parsed, "copy") else parsed
+
+        res, parsed = self.single_flight.do(
+            get_flight_key(
+                "GET",
+                url,
+                params=params,
+                data=data,
+                auth=auth,
+                deadline=get_deadline(),
+                parser=None if parse is None else parse.__qualname__,
+            ),
+            call,
+            copy=copy,
         )
 
         if res.status_code != 200:
             err = f"API call failed with '{res}: {res.text}'"
             logger.error(err)
             raise ValueError(err)
-        return res
+        return res, parsed
 
     @backoff.on_exception(
-        backoff.expo, requests.exceptions.RequestException, max_time=MAX_TIMEOUT
+        backoff.expo,
+        requests.exceptions.RequestException,
+        max_time=lambda: get_max_time(MAX_TIMEOUT),
+        giveup=is_deadline_exceeded,
     )
     def post(
-        self, url, data: BaseModel | list[BaseModel], auth=None, **kwargs
+        self, url, data: BaseModel | list[BaseModel] | str, auth=None, **kwargs
     ) -> requests.Response:
         """
         Run a post request.
@@ -105,9 +410,7 @@ class BaseAPI:
 
         convert = self.clean_data(data)
 
-        res = requests.post(
-            url, data=convert, auth=auth, params=kwargs, timeout=MAX_TIMEOUT
-        )
+        res = self._send("POST", url, data=convert, auth=auth, params=kwargs)
 
         if res.status_code != 200:
             err = f"API call failed with '{res}: {res.text}'"
@@ -116,7 +419,10 @@ class BaseAPI:
         return res
 
     @backoff.on_exception(
-        backoff.expo, requests.exceptions.RequestException, max_time=MAX_TIMEOUT
+        backoff.expo,
+        requests.exceptions.RequestException,
+        max_time=lambda: get_max_time(MAX_TIMEOUT),
+        giveup=is_deadline_exceeded,
     )
     def delete(self, url, auth=None, **kwargs) -> requests.Response:
         """
@@ -130,7 +436,7 @@ class BaseAPI:
         if auth is None:
             auth = self.get_auth()
 
-        res = requests.delete(url, auth=auth, params=kwargs, timeout=MAX_TIMEOUT)
+        res = self._send("DELETE", url, auth=auth, params=kwargs)
 
         if res.status_code != 200:
             err = f"API call failed with '{res}: {res.text}'"
@@ -139,10 +445,19 @@ class BaseAPI:
         return res
 
     @backoff.on_exception(
-        backoff.expo, requests.exceptions.RequestException, max_time=MAX_TIMEOUT * 4
+        backoff.expo,
+        requests.exceptions.RequestException,
+        max_time=lambda: get_max_time(MAX_TIMEOUT * 4),
+        giveup=is_deadline_exceeded,
     )
-    def get_stream(
-        self, url, output_dir: str | Path | None = None, auth=None, data=None, **kwargs
+    def get_stream(  # pylint: disable=too-many-arguments
+        self,
+        url,
+        output_dir: str | Path | None = None,
+        auth=None,
+        data=None,
+        transfer: Transfer | None = None,
+        **kwargs,
     ) -> tuple[requests.Response, Path]:
         """
         Run a get request.
@@ -150,6 +465,8 @@ class BaseAPI:
         :param url: URL to get.
         :param output_dir: Directory to save the output.
         :param auth: Authentication details.
+        :param data: Data to get.
+        :param transfer: Transfer settings (chunking, progress, stall detection).
         :param kwargs: additional arguments for API.
         :return: API response.
         """
@@ -171,28 +488,32 @@ class BaseAPI:
 
         fname = "winterapi_output.zip"
 
-        with requests.Session() as session:
+        with self._send(
+            "GET",
+            url,
+            data=data,
+            auth=auth,
+            params=kwargs,
+            timeout=4.0 * MAX_TIMEOUT,
+            stream=True,
+        ) as resp:
+            header = resp.headers
 
-            with session.get(
-                url,
-                data=data,
-                auth=auth,
-                params=kwargs,
-                timeout=4.0 * MAX_TIMEOUT,
-                stream=True,
-            ) as resp:
-                header = resp.headers
-
-                if "Content-Disposition" in header.keys():
-                    fname = re.findall("filename=(.+)", header["Content-Disposition"])[
-                        0
-                    ]
-
-                output_path = output_dir.joinpath(fname)
-
-                with open(output_path, "wb") as output_f:
-                    for chunk in resp.iter_content(chunk_size=8192):
-                        output_f.write(chunk)
+            if "Content-Disposition" in header.keys():
+                fname = re.findall("filename=(.+)", header["Content-Disposition"])[0]
+
+            output_path = output_dir.joinpath(fname)
+
+            if transfer is None:
+                transfer = Transfer()
+
+            with open(output_path, "wb") as output_f:
+                transfer.write(resp, output_f)
+
+            if self.cassette is not None and not self.cassette.is_replay:
+                self.cassette.record_file(
+                    "GET", url, resp, output_path, params=kwargs, data=data
+                )
 
         logger.info(f"Downloaded file to {output_path}")
 
@@ -0,0 +1,326 @@
+"""
+Module for recording and replaying API interactions.
+
+A cassette stores request/response pairs on disk, so that the same calls can
+later be served locally without any network access. Recorded interactions are
+kept in memory and saved once, when the cassette is closed. Streamed downloads
+are recorded as copies of the downloaded files, kept next to the cassette.
+"""
+
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Literal, Optional
+
+import requests
+from urllib3 import HTTPResponse
+from wintertoo.models import Program
+
+logger = logging.getLogger(__name__)
+
+CassetteMode = Literal["record", "replay"]
+
+SECRET_PARAMS = ["program_api_key"]
+REDACTED = "redacted"
+
+
+class CassetteMissError(KeyError):
+    """Error raised when a request has no recorded response in the cassette"""
+
+
+def build_response(
+    status_code: int,
+    content: bytes,
+    headers: Optional[dict] = None,
+    url: Optional[str] = None,
+) -> requests.Response:
+    """
+    Build a response object which behaves like one returned by the server.
+
+    :param status_code: HTTP status code
+    :param content: Body of the response
+    :param headers: Response headers
+    :param url: URL of the request
+    :return: Response
+    """
+    res = requests.Response()
+    res.status_code = status_code
+    res._content = content  # pylint: disable=protected-access
+    res._content_consumed = True  # pylint: disable=protected-access
+    res.headers.update(headers if headers is not None else {})
+    res.encoding = "utf-8"
+    res.url = url
+    return res
+
+
+def get_request_key(
+    method: str, url: str, params: Optional[dict] = None, data: Optional[str] = None
+) -> str:
+    """
+    Get a unique key for a request, ignoring any secrets.
+
+    :param method: HTTP method
+    :param url: URL of the request
+    :param params: Parameters of the request
+    :param data: Serialised body of the request
+    :return: Key
+    """
+    params = {
+        key: str(val)
+        for key, val in (params if params is not None else {}).items()
+        if key not in SECRET_PARAMS
+    }
+    encoded = json.dumps([method.upper(), url, params, data], sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Class to record and replay API interactions.
+
+    A recording cassette is saved when closed, either explicitly, on leaving a
+    with block, or at exit.
+    """
+
+    def __init__(self, path: str | Path, mode: CassetteMode = "replay"):
+        if mode not in ["record", "replay"]:
+            err = f"Unrecognised cassette mode '{mode}'"
+            logger.error(err)
+            raise ValueError(err)
+
+        self.path = Path(path)
+        self.mode = mode
+        self._lock = threading.Lock()
+        self.interactions = {}
+        self.programs = {}
+        self._modified = False
+
+        if self.path.exists():
+            self.load()
+        elif mode == "replay":
+            err = f"No cassette found at {self.path}"
+            logger.error(err)
+            raise FileNotFoundError(err)
+
+        if mode == "record":
+            atexit.register(self.close)
+
+    @property
+    def is_replay(self) -> bool:
+        """
+        Check whether the cassette is replaying
+
+        :return: boolean
+        """
+        return self.mode == "replay"
+
+    def load(self):
+        """
+        Load the cassette from disk.
+
+        :return: None
+        """
+        with gzip.open(self.path, "rt", encoding="utf-8") as in_f:
+            contents = json.load(in_f)
+        self.interactions = contents["interactions"]
+        self.programs = contents["programs"]
+        logger.debug(f"Loaded {len(self.interactions)} interactions from {self.path}")
+
+    @property
+    def files_dir(self) -> Path:
+        """
+        Directory holding the files of recorded streamed responses
+
+        :return: Path of the directory
+        """
+        return self.path.with_name(self.path.name + ".files")
+
+    def save(self):
+        """
+        Save the cassette to disk.
+
+        :return: None
+        """
+        if not self.path.parent.exists():
+            self.path.parent.mkdir(parents=True)
+
+        with self._lock:
+            contents = {"interactions": self.interactions, "programs": self.programs}
+            temp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            with gzip.open(temp_path, "wt", encoding="utf-8") as out_f:
+                json.dump(contents, out_f)
+            os.replace(temp_path, self.path)
+            self._modified = False
+
+        logger.debug(f"Saved {len(self.interactions)} interactions to {self.path}")
+
+    def close(self):
+        """
+        Save the cassette, if anything new was recorded.
+
+        :return: None
+        """
+        atexit.unregister(self.close)
+        if self._modified:
+            self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record(  # pylint: disable=too-many-arguments
+        self,
+        method: str,
+        url: str,
+        res: requests.Response,
+        params: Optional[dict] = None,
+        data: Optional[str] = None,
+    ):
+        """
+        Record a response.
+
+        :param method: HTTP method
+        :param url: URL of the request
+        :param res: Response to record
+        :param params: Parameters of the request
+        :param data: Serialised body of the request
+        :return: None
+        """
+        key = get_request_key(method=method, url=url, params=params, data=data)
+        with self._lock:
+            self.interactions[key] = {
+                "method": method.upper(),
+                "url": url,
+                "status_code": res.status_code,
+                "headers": dict(res.headers),
+                "content": base64.b64encode(res.content).decode("ascii"),
+            }
+            self._modified = True
+
+    def record_file(  # pylint: disable=too-many-arguments
+        self,
+        method: str,
+        url: str,
+        res: requests.Response,
+        path: Path,
+        params: Optional[dict] = None,
+        data: Optional[str] = None,
+    ):
+        """
+        Record a streamed response from the file it was written to, without
+        loading it into memory.
+
+        :param method: HTTP method
+        :param url: URL of the request
+        :param res: Streamed response to record
+        :param path: Path of the file the response content was written to
+        :param params: Parameters of the request
+        :param data: Serialised body of the request
+        :return: None
+        """
+        key = get_request_key(method=method, url=url, params=params, data=data)
+        self.files_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, self.files_dir.joinpath(key))
+
+        # The file holds the decoded content
+        headers = {
+            k: v
+            for k, v in res.headers.items()
+            if k.lower()
+            not in ["content-encoding", "content-length", "transfer-encoding"]
+        }
+        headers["Content-Length"] = str(path.stat().st_size)
+
+        with self._lock:
+            self.interactions[key] = {
+                "method": method.upper(),
+                "url": url,
+                "status_code": res.status_code,
+                "headers": headers,
+                "file": key,
+            }
+            self._modified = True
+
+    def replay(
+        self,
+        method: str,
+        url: str,
+        params: Optional[dict] = None,
+        data: Optional[str] = None,
+    ) -> requests.Response:
+        """
+        Replay a recorded response.
+
+        :param method: HTTP method
+        :param url: URL of the request
+        :param params: Parameters of the request
+        :param data: Serialised body of the request
+        :return: Recorded response
+        """
+        key = get_request_key(method=method, url=url, params=params, data=data)
+        with self._lock:
+            if key not in self.interactions:
+                err = f"No recorded response for {method.upper()} {url} in {self.path}"
+                logger.error(err)
+                raise CassetteMissError(err)
+            entry = self.interactions[key]
+
+        if "file" in entry:
+            res = requests.Response()
+            res.status_code = entry["status_code"]
+            res.headers.update(entry["headers"])
+            res.url = url
+            # Closed along with the response
+            # pylint: disable-next=consider-using-with
+            body = open(self.files_dir.joinpath(entry["file"]), "rb")
+            res.raw = HTTPResponse(
+                body=body,
+                headers=entry["headers"],
+                status=entry["status_code"],
+                preload_content=False,
+            )
+            return res
+
+        return build_response(
+            status_code=entry["status_code"],
+            content=base64.b64decode(entry["content"]),
+            headers=entry["headers"],
+            url=url,
+        )
+
+    def record_program(self, program: Program):
+        """
+        Record the details of a program, without its API key.
+
+        :param program: Program to record
+        :return: None
+        """
+        details = program.model_dump(
+            mode="json", exclude={"prog_key"}, exclude_none=True
+        )
+        with self._lock:
+            if self.programs.get(program.progname) != details:
+                self.programs[program.progname] = details
+                self._modified = True
+
+    def get_program(self, program_name: str) -> Program:
+        """
+        Get the recorded details of a program, with a redacted API key.
+
+        :param program_name: Name of the program
+        :return: Program details
+        """
+        if program_name not in self.programs:
+            err = f"Program {program_name} not found in {self.path}"
+            logger.error(err)
+            raise KeyError(err)
+        return Program(prog_key=REDACTED, **self.programs[program_name])
@@ -0,0 +1,406 @@
+"""
+Command line interface for running batches of winterapi operations
+"""
+
+import argparse
+import logging
+import sys
+from concurrent.futures import as_completed
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+from wintertoo.models import (
+    ConeImageQuery,
+    ProgramImageQuery,
+    RectangleImageQuery,
+    TargetImageQuery,
+)
+
+from winterapi.agent import CredentialAgent
+from winterapi.messenger import WinterAPI
+from winterapi.timeouts import ContextThreadPoolExecutor
+from winterapi.utils import get_batches
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_SIZE = 100
+
+
+def read_table(path: str | Path) -> pd.DataFrame:
+    """
+    Read a table from a CSV, JSON or Parquet file.
+
+    :param path: Path to the table
+    :return: Table
+    """
+    path = Path(path)
+    if path.suffix in [".parquet", ".pq"]:
+        return pd.read_parquet(path)
+    if path.suffix == ".jsonl":
+        return pd.read_json(path, lines=True)
+    if path.suffix == ".json":
+        return pd.read_json(path)
+    return pd.read_csv(path)
+
+
+def write_table(df: pd.DataFrame, path: str | Path):
+    """
+    Write a table to a CSV or Parquet file.
+
+    :param df: Table to write
+    :param path: Output path
+    :return: None
+    """
+    path = Path(path)
+    if path.suffix in [".parquet", ".pq"]:
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    logger.info(f"Saved {len(df)} rows to {path}")
+
+
+def get_rows(df: pd.DataFrame) -> list[dict]:
+    """
+    Convert a table to a list of dictionaries, dropping missing values.
+
+    :param df: Table
+    :return: List of rows
+    """
+    rows = []
+    for row in df.to_dict(orient="records"):
+        rows.append(
+            {
+                key: val
+                for key, val in row.items()
+                if not (np.isscalar(val) and pd.isna(val))
+            }
+        )
+    return rows
+
+
+def row_to_query(
+    row: dict,
+) -> ProgramImageQuery | TargetImageQuery | ConeImageQuery | RectangleImageQuery:
+    """
+    Convert a manifest row to an image query.
+
+    :param row: Row of the manifest
+    :return: Image query
+    """
+    for key in ["start_date", "end_date"]:
+        if key in row:
+            row[key] = str(int(row[key]))
+
+    if "ra_min" in row:
+        return RectangleImageQuery(**row)
+    if "ra" in row:
+        return ConeImageQuery(**row)
+    if "target_name" in row:
+        return TargetImageQuery(**row)
+    return ProgramImageQuery(**row)
+
+
+def run_batches(
+    func: Callable[[int], Any], n_batches: int, workers: int
+) -> tuple[dict[int, Any], dict[int, Exception]]:
+    """
+    Run a function for each batch concurrently, collecting the result or
+    error of every batch rather than stopping at the first error.
+
+    :param func: Function called with the index of each batch
+    :param n_batches: Number of batches
+    :param workers: Number of concurrent batches
+    :return: Dictionaries of batch index to result, and to error
+    """
+    results = {}
+    errors = {}
+    with ContextThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(func, i): i for i in range(n_batches)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                logger.error(f"Batch {i} failed: {exc}")
+                errors[i] = exc
+    return results, errors
+
+
+def run_submit(winter: WinterAPI, args) -> bool:
+    """
+    Submit ToO requests from a table.
+
+    The outcome of each batch is printed, and the schedules of the batches
+    which succeeded are saved, so that only the failed rows need resubmitting.
+
+    :param winter: WinterAPI instance
+    :param args: Parsed arguments
+    :return: boolean for success
+    """
+    table = read_table(args.table)
+
+    batches = get_batches(list(range(len(table))), args.batch_size)
+
+    def submit_batch(i):
+        _, schedule = winter.submit_too_table(
+            program_name=args.program,
+            table=table.iloc[batches[i]],
+            camera=args.camera,
+            submit_trigger=args.trigger,
+            local_dry_run=args.local_dry_run,
+        )
+        return schedule
+
+    schedules, errors = run_batches(submit_batch, len(batches), args.workers)
+
+    for i, rows in enumerate(batches):
+        status = "submitted" if i in schedules else f"failed\t{errors[i]}"
+        print(f"batch_{i}\trows {rows[0]}-{rows[-1]}\t{status}")
+
+    n_submitted = sum(len(batches[i]) for i in schedules)
+    print(
+        f"Submitted {n_submitted} of {len(table)} ToO requests in "
+        f"{len(schedules)} of {len(batches)} batches (submit_trigger={args.trigger})"
+    )
+
+    if args.output is not None and len(schedules) > 0:
+        write_table(
+            pd.concat([schedules[i] for i in sorted(schedules)], ignore_index=True),
+            args.output,
+        )
+
+    return len(errors) == 0
+
+
+def run_query(winter: WinterAPI, args) -> bool:
+    """
+    Run image queries from a manifest.
+
+    :param winter: WinterAPI instance
+    :param args: Parsed arguments
+    :return: boolean for success
+    """
+    queries = [row_to_query(x) for x in get_rows(read_table(args.manifest))]
+
+    def query_images(query):
+        _, images = winter.query_images(query=query)
+        return images
+
+    with ContextThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(query_images, queries))
+
+    for i, images in enumerate(results):
+        images["query_index"] = i
+
+    if len(results) == 0:
+        images = pd.DataFrame(columns=["query_index"])
+    else:
+        images = pd.concat(results, ignore_index=True)
+    print(f"Found {len(images)} images for {len(queries)} queries")
+
+    if args.output is not None:
+        write_table(images, args.output)
+
+    return True
+
+
+def run_download(winter: WinterAPI, args) -> bool:
+    """
+    Download images from a manifest of paths.
+
+    The zip file of each batch which succeeded is printed, and failed batches
+    are reported as errors.
+
+    :param winter: WinterAPI instance
+    :param args: Parsed arguments
+    :return: boolean for success
+    """
+    manifest = Path(args.manifest)
+    if manifest.suffix == ".txt":
+        with open(manifest, "r", encoding="utf-8") as in_f:
+            paths = [x.strip() for x in in_f if x.strip() != ""]
+    else:
+        paths = read_table(manifest)["savepath"].tolist()
+
+    output_dir = Path(args.output_dir) if args.output_dir is not None else Path.home()
+    batches = get_batches(paths, args.batch_size)
+
+    def download_batch(i):
+        # Each batch gets its own directory, so that zips with the same name
+        # do not overwrite each other
+        batch_dir = output_dir
+        if len(batches) > 1:
+            batch_dir = output_dir.joinpath(f"batch_{i}")
+        batch_dir.mkdir(parents=True, exist_ok=True)
+        _, output_path = winter.download_image_list(
+            program_name=args.program,
+            paths=batches[i],
+            image_type=args.image_type,
+            output_dir=batch_dir,
+        )
+        return output_path
+
+    output_paths, errors = run_batches(download_batch, len(batches), args.workers)
+
+    for i in sorted(output_paths):
+        print(output_paths[i])
+
+    for i in sorted(errors):
+        print(
+            f"batch_{i}\t{len(batches[i])} paths from {batches[i][0]}\tfailed"
+            f"\t{errors[i]}",
+            file=sys.stderr,
+        )
+
+    return len(errors) == 0
+
+
+def run_delete(winter: WinterAPI, args) -> bool:
+    """
+    Delete queued ToO schedules.
+
+    :param winter: WinterAPI instance
+    :param args: Parsed arguments
+    :return: boolean for success
+    """
+    schedule_names = list(args.schedule_names)
+    if args.from_file is not None:
+        with open(args.from_file, "r", encoding="utf-8") as in_f:
+            schedule_names += [x.strip() for x in in_f if x.strip() != ""]
+
+    summary = winter.delete_too_requests(
+        program_name=args.program,
+        too_schedule_names=schedule_names,
+        max_workers=args.workers,
+    )
+
+    for _, row in summary.iterrows():
+        print(
+            f"{row['too_schedule_name']}\t{'deleted' if row['deleted'] else 'failed'}"
+        )
+
+    return bool(summary["deleted"].all())
+
+
+def run_agent(args) -> bool:
+    """
+    Run a credential agent until interrupted.
+
+    :param args: Parsed arguments
+    :return: boolean for success
+    """
+    with CredentialAgent(socket_path=args.socket) as agent:
+        print(f"Serving credentials at {agent.socket_path}")
+        try:
+            agent.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return True
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """
+    Get the argument parser for the command line interface.
+
+    :return: Argument parser
+    """
+    parser = argparse.ArgumentParser(
+        prog="winterapi", description="Run batches of operations with the WINTER API"
+    )
+    parser.add_argument(
+        "--base-url",
+        action="append",
+        default=None,
+        help="Base URL of the API. Can be given several times for failover.",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Number of concurrent requests",
+    )
+    parser.add_argument("--log-level", default="WARNING", help="Logging level")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    submit = subparsers.add_parser("submit", help="Submit ToOs from a table")
+    submit.add_argument("table", help="CSV/JSON/Parquet table of ToO requests")
+    submit.add_argument("-p", "--program", required=True, help="Program name")
+    submit.add_argument("--camera", choices=["winter", "summer"], default="winter")
+    submit.add_argument("--trigger", action="store_true", help="Really submit the ToOs")
+    submit.add_argument(
+        "--local-dry-run",
+        action="store_true",
+        help="Validate dry runs locally, only asking the server when uncertain",
+    )
+    submit.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    submit.add_argument("-o", "--output", default=None, help="Save schedules here")
+    submit.set_defaults(func=run_submit)
+
+    query = subparsers.add_parser("query", help="Run image queries from a manifest")
+    query.add_argument("manifest", help="CSV/JSON/Parquet table of queries")
+    query.add_argument("-o", "--output", default=None, help="Save results here")
+    query.set_defaults(func=run_query)
+
+    download = subparsers.add_parser("download", help="Download a manifest of paths")
+    download.add_argument(
+        "manifest", help="Text file of paths, or table with a 'savepath' column"
+    )
+    download.add_argument("-p", "--program", required=True, help="Program name")
+    download.add_argument("-t", "--image-type", required=True, help="Image type")
+    download.add_argument(
+        "-o",
+        "--output-dir",
+        default=None,
+        help="Output directory, with a batch_<i> subdirectory per batch if there "
+        "are several batches",
+    )
+    download.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    download.set_defaults(func=run_download)
+
+    delete = subparsers.add_parser("delete", help="Delete queued ToO schedules")
+    delete.add_argument("schedule_names", nargs="*", help="Schedule names")
+    delete.add_argument("-p", "--program", required=True, help="Program name")
+    delete.add_argument(
+        "-f", "--from-file", default=None, help="File with one schedule name per line"
+    )
+    delete.set_defaults(func=run_delete)
+
+    agent = subparsers.add_parser(
+        "agent", help="Serve decrypted credentials to local worker processes"
+    )
+    agent.add_argument(
+        "--socket",
+        default=None,
+        help="Path of the agent socket (default: $WINTERAPI_AGENT_SOCKET "
+        "or ~/.winterapi_agent.sock)",
+    )
+    agent.set_defaults(func=run_agent)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Entry point for the command line interface.
+
+    :param argv: Command line arguments
+    :return: Exit code
+    """
+    args = get_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+
+    if args.command == "agent":
+        return 0 if run_agent(args) else 1
+
+    winter = WinterAPI(base_urls=args.base_url)
+    success = args.func(winter, args)
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
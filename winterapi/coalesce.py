@@ -0,0 +1,126 @@
+"""
+Module for coalescing many nearby cone queries into a few rectangle queries.
+
+Cones with the same program, dates and image type are grouped into cells on
+the sky. Each cell with several cones is queried once with an enclosing
+rectangle, and the results are then split back per cone.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+from wintertoo.models import ConeImageQuery, RectangleImageQuery
+
+from winterapi.sky import angular_separation, get_cone_ra_half_width
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_EXTENT_DEG = 2.0
+
+
+def get_enclosing_rectangle(
+    cones: list[ConeImageQuery],
+) -> RectangleImageQuery | None:
+    """
+    Get a rectangle query enclosing a group of cone queries.
+
+    The cones must share the same program, dates and image type.
+
+    :param cones: Cone queries
+    :return: Rectangle query, or None if the rectangle would contain a pole or
+        wrap around RA=0
+    """
+    ra_min, ra_max, dec_min, dec_max = [], [], [], []
+    for cone in cones:
+        half_width = get_cone_ra_half_width(cone.dec, cone.radius_deg)
+        if half_width is None:
+            return None
+        ra_min.append(cone.ra - half_width)
+        ra_max.append(cone.ra + half_width)
+        dec_min.append(cone.dec - cone.radius_deg)
+        dec_max.append(cone.dec + cone.radius_deg)
+
+    bounds = min(ra_min), max(ra_max), min(dec_min), max(dec_max)
+    if bounds[0] < 0.0 or bounds[1] > 360.0:
+        return None
+    if bounds[1] <= bounds[0] or bounds[3] <= bounds[2]:
+        return None
+
+    return RectangleImageQuery(
+        program_name=cones[0].program_name,
+        start_date=cones[0].start_date,
+        end_date=cones[0].end_date,
+        image_type=cones[0].image_type,
+        ra_min=bounds[0],
+        ra_max=bounds[1],
+        dec_min=bounds[2],
+        dec_max=bounds[3],
+    )
+
+
+def coalesce_cones(
+    cones: list[ConeImageQuery],
+    max_extent_deg: float = DEFAULT_MAX_EXTENT_DEG,
+) -> list[tuple[ConeImageQuery | RectangleImageQuery, list[int]]]:
+    """
+    Group cone queries into as few queries as possible.
+
+    :param cones: Cone queries
+    :param max_extent_deg: Approximate maximum size of each group on the sky
+    :return: List of (query to send, indices of the cones it answers)
+    """
+    ras = np.array([x.ra for x in cones])
+    decs = np.array([x.dec for x in cones])
+    dec_cells = np.floor(decs / max_extent_deg)
+    cos_dec = np.maximum(np.cos(np.radians((dec_cells + 0.5) * max_extent_deg)), 0.01)
+    ra_cells = np.floor(ras * cos_dec / max_extent_deg)
+
+    groups = {}
+    for i, cone in enumerate(cones):
+        key = (
+            cone.program_name,
+            cone.start_date,
+            cone.end_date,
+            str(cone.image_type),
+            dec_cells[i],
+            ra_cells[i],
+        )
+        groups.setdefault(key, []).append(i)
+
+    coalesced = []
+    for indices in groups.values():
+        rectangle = None
+        if len(indices) > 1:
+            rectangle = get_enclosing_rectangle([cones[i] for i in indices])
+
+        if rectangle is None:
+            coalesced += [(cones[i], [i]) for i in indices]
+        else:
+            coalesced.append((rectangle, indices))
+
+    logger.debug(f"Coalesced {len(cones)} cone queries into {len(coalesced)} queries")
+    return coalesced
+
+
+def split_by_cones(
+    images: pd.DataFrame, cones: list[ConeImageQuery]
+) -> list[pd.DataFrame]:
+    """
+    Split the results of an enclosing query back into the results of each cone.
+
+    :param images: Images returned for the enclosing query
+    :param cones: Cone queries
+    :return: Images within each cone
+    """
+    if len(images) == 0:
+        return [images.copy() for _ in cones]
+
+    ras = images["ra"].to_numpy(dtype=float)
+    decs = images["dec"].to_numpy(dtype=float)
+
+    results = []
+    for cone in cones:
+        mask = angular_separation(cone.ra, cone.dec, ras, decs) <= cone.radius_deg
+        results.append(images[mask].reset_index(drop=True))
+    return results
@@ -5,7 +5,9 @@ Module for credentials
 import base64
 import json
 import logging
+import os
 import secrets
+import tempfile
 from pathlib import Path
 from typing import Optional
 
@@ -69,19 +71,32 @@ def write_secrets(
     """
     Function to write secrets to a file.
 
+    The secrets are written to a temporary file which then replaces the
+    secrets file, so a crash can never leave a partially written file.
+
     :param secrets_dict: Secrets dictionary to write.
     :param keyring_service: Keyring service to use.
     :param keyring_user: Keyring user to use.
     :return: None
     """
-    with open(secret_path, "wb") as out_f:
-        out_f.write(
-            encrypt(
-                str(json.dumps(secrets_dict, default=str)),
-                keyring_service=keyring_service,
-                keyring_user=keyring_user,
-            )
-        )
+    ciphertext = encrypt(
+        str(json.dumps(secrets_dict, default=str)),
+        keyring_service=keyring_service,
+        keyring_user=keyring_user,
+    )
+
+    fd, temp_path = tempfile.mkstemp(
+        dir=secret_path.parent, prefix=secret_path.name, suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as out_f:
+            out_f.write(ciphertext)
+            out_f.flush()
+            os.fsync(out_f.fileno())
+        os.replace(temp_path, secret_path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
 
 
 def decrypt(
@@ -0,0 +1,236 @@
+"""
+Module for lazy access to downloaded images.
+
+Images are only read when requested, headers can be read without loading any
+data or extracting any zip member, and uncompressed FITS data is memory-mapped
+rather than read into RAM.
+"""
+
+import logging
+import shutil
+import threading
+import zipfile
+from pathlib import Path
+
+import numpy as np
+from astropy.io import fits
+
+logger = logging.getLogger(__name__)
+
+COMPRESSED_SUFFIXES = [".fz", ".gz", ".bz2", ".zip"]
+SCALING_KEYWORDS = ["BZERO", "BSCALE", "BLANK"]
+
+
+class DownloadResult:
+    """
+    Class for lazy access to a set of downloaded images.
+
+    Images can either be files on disk, or members of a downloaded zip file,
+    which are only extracted when first accessed. Zip members are named by
+    their relative path within the zip, so images with the same file name
+    from different nights are kept apart.
+    """
+
+    def __init__(
+        self,
+        files: dict[str, Path] | None = None,
+        zip_path: str | Path | None = None,
+        extract_dir: str | Path | None = None,
+    ):
+        self.files = {} if files is None else {x: Path(y) for x, y in files.items()}
+        self.zip_path = None if zip_path is None else Path(zip_path)
+        self._members = {}
+        self._lock = threading.Lock()
+
+        if self.zip_path is not None:
+            if extract_dir is None:
+                extract_dir = self.zip_path.with_suffix("")
+            self.extract_dir = Path(extract_dir)
+
+            with zipfile.ZipFile(self.zip_path) as archive:
+                for member in archive.infolist():
+                    if member.is_dir():
+                        continue
+                    name = member.filename.strip("/")
+                    if name in self._members or name in self.files:
+                        err = f"Duplicate image {name} in {self.zip_path}"
+                        logger.error(err)
+                        raise ValueError(err)
+                    self._members[name] = member.filename
+
+    @classmethod
+    def from_paths(
+        cls, paths: list[Path | str | None], names: list[str] | None = None
+    ) -> "DownloadResult":
+        """
+        Create a result from a list of local image paths.
+
+        :param paths: List of local paths, missing images can be None
+        :param names: Name of each image (e.g. its server path), or None to
+            name images by file name
+        :return: DownloadResult
+        """
+        if names is None:
+            names = [None if x is None else Path(x).name for x in paths]
+
+        files = {}
+        for name, path in zip(names, paths):
+            if path is None:
+                continue
+            if name in files:
+                err = f"Duplicate image {name} in {paths}"
+                logger.error(err)
+                raise ValueError(err)
+            files[name] = Path(path)
+        return cls(files=files)
+
+    @classmethod
+    def from_zip(
+        cls, zip_path: str | Path, extract_dir: str | Path | None = None
+    ) -> "DownloadResult":
+        """
+        Create a result from a downloaded zip file.
+
+        :param zip_path: Path of the zip file
+        :param extract_dir: Directory to extract members to, when accessed
+        :return: DownloadResult
+        """
+        return cls(zip_path=zip_path, extract_dir=extract_dir)
+
+    @property
+    def names(self) -> list[str]:
+        """
+        Names of all images in the result
+
+        :return: List of names
+        """
+        return sorted(set(self.files) | set(self._members))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.files or name in self._members
+
+    def get_path(self, name: str) -> Path:
+        """
+        Get the local path of an image, extracting it if required.
+
+        :param name: Name of the image
+        :return: Local path
+        """
+        with self._lock:
+            if name in self.files:
+                return self.files[name]
+
+            if name not in self._members:
+                err = f"Image {name} not found in {self.names}"
+                logger.error(err)
+                raise KeyError(err)
+
+            output_path = self.extract_dir.joinpath(name)
+            if not output_path.resolve().is_relative_to(self.extract_dir.resolve()):
+                err = f"Image {name} would be extracted outside {self.extract_dir}"
+                logger.error(err)
+                raise ValueError(err)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            with zipfile.ZipFile(self.zip_path) as archive:
+                with (
+                    archive.open(self._members[name]) as in_f,
+                    open(output_path, "wb") as out_f,
+                ):
+                    shutil.copyfileobj(in_f, out_f)
+
+            self.files[name] = output_path
+            return output_path
+
+    def __getitem__(self, name: str) -> Path:
+        return self.get_path(name)
+
+    @staticmethod
+    def is_memmappable(path: Path) -> bool:
+        """
+        Check whether an image is stored uncompressed, and can be memory-mapped.
+
+        :param path: Local path of the image
+        :return: boolean
+        """
+        return path.suffix.lower() not in COMPRESSED_SUFFIXES
+
+    def open(self, name: str) -> fits.HDUList:
+        """
+        Open an image lazily, memory-mapping it where possible.
+
+        :param name: Name of the image
+        :return: HDUList
+        """
+        path = self.get_path(name)
+        return fits.open(path, memmap=self.is_memmappable(path), lazy_load_hdus=True)
+
+    def get_header(self, name: str, ext: int | str = 0) -> fits.Header:
+        """
+        Read only the header of an image.
+
+        Images which have not been extracted are read directly from the zip,
+        without extracting them.
+
+        :param name: Name of the image
+        :param ext: Extension to read
+        :return: Header
+        """
+        with self._lock:
+            path = self.files.get(name)
+            member = self._members.get(name)
+
+        if path is not None or member is None:
+            return fits.getheader(self.get_path(name), ext)
+
+        with (
+            zipfile.ZipFile(self.zip_path) as archive,
+            archive.open(member) as in_f,
+            fits.open(in_f, lazy_load_hdus=True) as hdul,
+        ):
+            return hdul[ext].header.copy()
+
+    def get_headers(self, ext: int | str = 0) -> dict[str, fits.Header]:
+        """
+        Read only the headers of all images.
+
+        :param ext: Extension to read
+        :return: Dictionary of image name to header
+        """
+        return {x: self.get_header(x, ext=ext) for x in self.names}
+
+    def get_data(
+        self, name: str, ext: int | str = 0, memmap: bool | None = None
+    ) -> np.ndarray:
+        """
+        Get the data of an image, memory-mapped if stored uncompressed.
+
+        Data scaled with BZERO/BSCALE (or with BLANK values) cannot be
+        memory-mapped, since it must be scaled, so it is read into memory.
+
+        :param name: Name of the image
+        :param ext: Extension to read
+        :param memmap: Whether to memory-map the data, or None to do so
+            wherever possible
+        :return: Data array
+        """
+        path = self.get_path(name)
+        if memmap is None or memmap:
+            memmap = self.is_memmappable(path)
+
+        if memmap:
+            header = fits.getheader(path, ext)
+            scaling = [x for x in SCALING_KEYWORDS if x in header]
+            if len(scaling) > 0:
+                logger.info(
+                    f"Data of {name} is scaled with {scaling}, "
+                    f"reading it into memory rather than memory-mapping it"
+                )
+                memmap = False
+
+        return fits.getdata(path, ext, memmap=memmap)
@@ -2,18 +2,159 @@
 Module for storing the endpoints for the API.
 """
 
+import logging
 import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 run_local = os.getenv("WINTER_API_LOCAL", "0") in ["True", "true", "1"]
 BASE_URL = "http://127.0.0.1:7000" if run_local else "http://winter.caltech.edu:82"
-PING_URL = BASE_URL + "/ping"
-VERSION_URL = BASE_URL + "/validation/version"
-USER_URL = BASE_URL + "/validation/user"
-PROGRAM_URL = BASE_URL + "/validation/program"
-WINTER_TOO_URL = BASE_URL + "/too/winter"
-SUMMER_TOO_URL = BASE_URL + "/too/summer"
-SCHEDULE_SUMMARY_URL = BASE_URL + "/too/summary"
-SCHEDULE_DETAILS_URL = BASE_URL + "/too/details"
-SCHEDULE_DELETE_URL = BASE_URL + "/too/delete"
-IMAGE_QUERY_URL = BASE_URL + "/images/query"
-DOWNLOAD_LIST_URL = BASE_URL + "/images/download_list"
+
+PING_PATH = "/ping"
+VERSION_PATH = "/validation/version"
+USER_PATH = "/validation/user"
+PROGRAM_PATH = "/validation/program"
+WINTER_TOO_PATH = "/too/winter"
+SUMMER_TOO_PATH = "/too/summer"
+SCHEDULE_SUMMARY_PATH = "/too/summary"
+SCHEDULE_DETAILS_PATH = "/too/details"
+SCHEDULE_DELETE_PATH = "/too/delete"
+IMAGE_QUERY_PATH = "/images/query"
+DOWNLOAD_LIST_PATH = "/images/download_list"
+
+PING_URL = BASE_URL + PING_PATH
+VERSION_URL = BASE_URL + VERSION_PATH
+USER_URL = BASE_URL + USER_PATH
+PROGRAM_URL = BASE_URL + PROGRAM_PATH
+WINTER_TOO_URL = BASE_URL + WINTER_TOO_PATH
+SUMMER_TOO_URL = BASE_URL + SUMMER_TOO_PATH
+SCHEDULE_SUMMARY_URL = BASE_URL + SCHEDULE_SUMMARY_PATH
+SCHEDULE_DETAILS_URL = BASE_URL + SCHEDULE_DETAILS_PATH
+SCHEDULE_DELETE_URL = BASE_URL + SCHEDULE_DELETE_PATH
+IMAGE_QUERY_URL = BASE_URL + IMAGE_QUERY_PATH
+DOWNLOAD_LIST_URL = BASE_URL + DOWNLOAD_LIST_PATH
+
+DEFAULT_HOST_COOLDOWN = 60.0
+
+
+class HostPool:
+    """
+    Class to track an ordered list of API hosts, and their health.
+
+    A host marked unhealthy is readmitted once its cooldown has passed, and is
+    marked unhealthy again if it still cannot be reached.
+
+    :param base_urls: Base URLs of the hosts, in order of preference
+    :param prefer_fastest: Whether to order hosts for reads by latency
+    :param cooldown: Time after which an unhealthy host is tried again, in seconds
+    """
+
+    def __init__(
+        self,
+        base_urls: list[str] | str | None = None,
+        prefer_fastest: bool = False,
+        cooldown: float = DEFAULT_HOST_COOLDOWN,
+    ):
+        if base_urls is None:
+            base_urls = [BASE_URL]
+        elif isinstance(base_urls, str):
+            base_urls = [base_urls]
+
+        if len(base_urls) == 0:
+            err = "At least one base URL is required"
+            logger.error(err)
+            raise ValueError(err)
+
+        self.base_urls = [x.rstrip("/") for x in base_urls]
+        self.prefer_fastest = prefer_fastest
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._unhealthy_since = {x: None for x in self.base_urls}
+        self._latency = {x: None for x in self.base_urls}
+
+    def _is_healthy(self, base_url: str) -> bool:
+        """
+        Check whether a host is healthy, or has finished its cooldown.
+        Must be called with the lock held.
+
+        :param base_url: Base URL of the host
+        :return: boolean
+        """
+        since = self._unhealthy_since[base_url]
+        if since is None:
+            return True
+        if time.monotonic() - since >= self.cooldown:
+            logger.info(f"Host {base_url} cooldown has passed, trying it again")
+            self._unhealthy_since[base_url] = None
+            return True
+        return False
+
+    def mark_healthy(self, base_url: str, latency: float | None = None):
+        """
+        Mark a host as healthy.
+
+        :param base_url: Base URL of the host
+        :param latency: Measured latency of the host in seconds
+        :return: None
+        """
+        with self._lock:
+            self._unhealthy_since[base_url] = None
+            if latency is not None:
+                self._latency[base_url] = latency
+
+    def mark_unhealthy(self, base_url: str):
+        """
+        Mark a host as unhealthy.
+
+        :param base_url: Base URL of the host
+        :return: None
+        """
+        with self._lock:
+            if self._unhealthy_since[base_url] is None:
+                logger.warning(f"Host {base_url} is unhealthy, failing over")
+            self._unhealthy_since[base_url] = time.monotonic()
+
+    def is_healthy(self, base_url: str) -> bool:
+        """
+        Check whether a host is healthy.
+
+        :param base_url: Base URL of the host
+        :return: boolean
+        """
+        with self._lock:
+            return self._is_healthy(base_url)
+
+    def get_candidates(self, read: bool = False) -> list[str]:
+        """
+        Get the hosts to try for a request, in order of preference.
+
+        Healthy hosts are tried first, in the configured order, or by latency for
+        reads if prefer_fastest is set. Unhealthy hosts are only tried last,
+        until their cooldown has passed.
+
+        :param read: Whether the request is a read
+        :return: List of base URLs
+        """
+        with self._lock:
+            healthy = [x for x in self.base_urls if self._is_healthy(x)]
+            unhealthy = [x for x in self.base_urls if x not in healthy]
+
+            if read & self.prefer_fastest:
+                healthy = sorted(
+                    healthy,
+                    key=lambda x: (
+                        self._latency[x] if self._latency[x] is not None else 1.0e9
+                    ),
+                )
+
+        return healthy + unhealthy
+
+    def get_primary(self) -> str:
+        """
+        Get the preferred host for writes.
+
+        :return: Base URL
+        """
+        return self.get_candidates(read=False)[0]
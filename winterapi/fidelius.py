@@ -3,6 +3,8 @@ Fidelius is the keeper of secrets. It is the class that handles the secrets.
 """
 
 import logging
+import threading
+from contextlib import contextmanager
 
 import numpy as np
 from filelock import FileLock
@@ -23,21 +25,35 @@ logger = logging.getLogger(__name__)
 class Fidelius:
     """
     Class to handle the secrets.
+
+    The credentials are a snapshot which is never modified once published.
+    Updates are made to a copy, which then replaces the snapshot, so that
+    other threads always see a consistent set of credentials.
     """
 
     def __init__(self):
         self.credentials = self.load_secrets()
+        self._write_lock = threading.RLock()
+        self._working = None
 
     @staticmethod
-    def load_secrets() -> WinterAPICredentials:
+    def read_secrets() -> WinterAPICredentials:
         """
-        Load the secrets from the keyring.
+        Read the secrets from the secrets file.
 
-        :return:
+        :return: Credentials
         """
         secret_dict = get_secrets()
         return WinterAPICredentials(**secret_dict)
 
+    def load_secrets(self) -> WinterAPICredentials:
+        """
+        Load the secrets from the keyring.
+
+        :return: Credentials
+        """
+        return self.read_secrets()
+
     def reload_secrets(self):
         """
         Reload the secrets from the keyring.
@@ -54,6 +70,37 @@ class Fidelius:
         """
         write_secrets(secrets_dict=self.credentials.dict())
 
+    @contextmanager
+    def batch(self):
+        """
+        Context manager to make several updates to the secrets in one transaction.
+
+        The secrets file is locked and read once, and the updates are made to
+        a copy of it. Only once all updates have succeeded is the copy published and
+        written. If any update fails, no changes are made. Nested batches in
+        the same thread join the outer batch.
+
+        :return: Copy of the credentials to update
+        """
+        with self._write_lock:
+            if self._working is not None:
+                yield self._working
+                return
+
+            with FileLock(secrets_lock_path, timeout=TIMEOUT):
+                # Read the file itself, in case a cached copy is out of date
+                self._working = self.read_secrets()
+                try:
+                    yield self._working
+                    previous, self.credentials = self.credentials, self._working
+                    try:
+                        self.export_secrets()
+                    except BaseException:
+                        self.credentials = previous
+                        raise
+                finally:
+                    self._working = None
+
     def set_user(self, user: str, password: str, overwrite=False):
         """
         Function to set the user and password.
@@ -63,16 +110,14 @@ class Fidelius:
         :param overwrite: bool, whether to overwrite existing user/password.
         :return: None
         """
-        self.reload_secrets()
-        with FileLock(secrets_lock_path, timeout=TIMEOUT):
-            if np.logical_and(self.credentials.user is None, not overwrite):
+        with self.batch() as credentials:
+            if np.logical_and(credentials.user is None, not overwrite):
                 err = f"User/password already set, and overwrite is set to {overwrite}."
                 logger.error(err)
                 raise ValueError(err)
 
-            self.credentials.user = user
-            self.credentials.password = password
-            self.export_secrets()
+            credentials.user = user
+            credentials.password = password
 
     def get_user(self) -> str:
         """
@@ -80,12 +125,13 @@ class Fidelius:
 
         :return: user name
         """
-        if self.credentials.user is None:
+        user = self.credentials.user
+        if user is None:
             err = "No user has been set"
             logger.error(err)
             raise KeyError(err)
 
-        return self.credentials.user
+        return user
 
     def get_password(self) -> str:
         """
@@ -93,11 +139,25 @@ class Fidelius:
 
         :return: Password
         """
-        if self.credentials.password is None:
+        password = self.credentials.password
+        if password is None:
             err = "No password has been set"
             logger.error(err)
             raise KeyError(err)
-        return self.credentials.password
+        return password
+
+    def get_auth(self) -> tuple[str, str]:
+        """
+        Get the user name and password, from the same snapshot of credentials.
+
+        :return: user name, password
+        """
+        credentials = self.credentials
+        if credentials.user is None or credentials.password is None:
+            err = "No user/password has been set"
+            logger.error(err)
+            raise KeyError(err)
+        return credentials.user, credentials.password
 
     def add_program(self, program_details: dict, overwrite=False):
         """
@@ -107,25 +167,37 @@ class Fidelius:
         :param overwrite: Bool, whether to overwrite existing program.
         :return: None
         """
-        self.reload_secrets()
-
-        program_details.pop("puid")
+        self.add_programs([program_details], overwrite=overwrite)
 
-        program_details = Program(**program_details)
+    def add_programs(self, programs: list[dict], overwrite=False):
+        """
+        Function to add several programs to the credentials, with a single write.
 
-        with FileLock(secrets_lock_path, timeout=TIMEOUT):
-            if np.logical_and(
-                program_details.progname in self.credentials.programs, not overwrite
-            ):
-                err = (
-                    f"Program {program_details.progname} already set, "
-                    f"and overwrite is set to {overwrite}."
-                )
-                logger.error(err)
-                raise ValueError(err)
+        Either all programs are added, or none are.
 
-            self.credentials.programs[program_details.progname] = program_details
-            self.export_secrets()
+        :param programs: List of program details.
+        :param overwrite: Bool, whether to overwrite existing programs.
+        :return: None
+        """
+        new_programs = []
+        for program_details in programs:
+            program_details.pop("puid", None)
+            new_programs.append(Program(**program_details))
+
+        with self.batch() as credentials:
+            for program_details in new_programs:
+                if np.logical_and(
+                    program_details.progname in credentials.programs,
+                    not overwrite,
+                ):
+                    err = (
+                        f"Program {program_details.progname} already set, "
+                        f"and overwrite is set to {overwrite}."
+                    )
+                    logger.error(err)
+                    raise ValueError(err)
+
+                credentials.programs[program_details.progname] = program_details
 
     def get_programs(self) -> list[Program]:
         """
@@ -150,14 +222,12 @@ class Fidelius:
         :param program_name: Name of the program.
         :return: Program details.
         """
-        if program_name not in self.credentials.programs:
-            err = (
-                f"Program {program_name} not found in"
-                f" {list(self.credentials.programs)}"
-            )
+        programs = self.credentials.programs
+        if program_name not in programs:
+            err = f"Program {program_name} not found in {list(programs)}"
             logger.error(err)
             raise KeyError(err)
-        return self.credentials.programs[program_name]
+        return programs[program_name]
 
     def delete_program(self, program_name: str):
         """
@@ -166,11 +236,14 @@ class Fidelius:
         :param program_name: Name of the program.
         :return: None
         """
-        self.reload_secrets()
-        with FileLock(secrets_lock_path, timeout=TIMEOUT):
-            assert self.get_program_details(program_name) is not None
-            del self.credentials.programs[program_name]
-            self.export_secrets()
+        with self.batch() as credentials:
+            if program_name not in credentials.programs:
+                err = (
+                    f"Program {program_name} not found in {list(credentials.programs)}"
+                )
+                logger.error(err)
+                raise KeyError(err)
+            del credentials.programs[program_name]
 
     @staticmethod
     def clear_cache():
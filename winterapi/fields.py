@@ -0,0 +1,393 @@
+"""
+Module for a precomputed spatial index over the WINTER/SUMMER field grids.
+
+Fields are bucketed into cells, in bands of declination with RA bins whose
+width depends on the band. The best field for many positions can then be
+found at once, by only checking the fields in the 3x3 neighbouring cells of
+each position. The index is cached on disk, keyed by a hash of the grid.
+
+The best field matches wintertoo.fields.get_best_field: the field whose
+centre is closest to the position, out of those overlapping it.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from wintertoo.data import get_default_value
+from wintertoo.errors import WinterValidationError
+from wintertoo.fields import get_base_width, get_best_field, get_fields
+from wintertoo.models import Program
+from wintertoo.models.too import (
+    AllTooClasses,
+    FullTooRequest,
+    Spring,
+    SpringRaDecToO,
+    SummerFieldToO,
+    SummerRaDecToO,
+    WinterFieldToO,
+    WinterRaDecToO,
+    is_summer,
+)
+from wintertoo.schedule import make_schedule
+
+from winterapi.sky import angular_separation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path.home().joinpath(".cache", "winterapi")
+INDEX_VERSION = 1
+CELL_FACTOR = 1.5
+# Beyond this declination the neighbouring cells may not contain every
+# overlapping field, so positions are matched one at a time instead
+MAX_INDEX_DEC = 70.0
+MAX_CELL_DEC = 89.9
+CHUNK_SIZE = 50000
+
+
+class FieldGridIndex:  # pylint: disable=too-many-instance-attributes
+    """
+    Spatial index over a field grid, for vectorised best-field lookups
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, summer: bool = False, cache_dir: str | Path | None = None):
+        self.summer = summer
+        self.fields = get_fields(summer=summer)
+        self.base_width = get_base_width(summer=summer)
+        self.cell_size = CELL_FACTOR * self.base_width
+
+        self.field_ids = self.fields["ID"].to_numpy(dtype=int)
+        self.field_ras = self.fields["RA"].to_numpy(dtype=float)
+        self.field_decs = self.fields["Dec"].to_numpy(dtype=float)
+        self._rows_by_id = pd.Index(self.field_ids)
+
+        self.n_bands = int(np.ceil(180.0 / self.cell_size))
+        self.band_bins, self.band_offsets, self.members = self.load_or_build(
+            cache_dir=cache_dir
+        )
+
+    @classmethod
+    def get_index(cls, summer: bool = False) -> "FieldGridIndex":
+        """
+        Get a shared index for a field grid, building it on first use.
+
+        :param summer: boolean whether to use summer field grid
+        :return: Field grid index
+        """
+        with cls._instances_lock:
+            if summer not in cls._instances:
+                cls._instances[summer] = cls(summer=summer, cache_dir=DEFAULT_CACHE_DIR)
+            return cls._instances[summer]
+
+    def get_grid_hash(self) -> str:
+        """
+        Get a hash of the field grid and index parameters, to key the cache.
+
+        :return: Hex digest
+        """
+        digest = hashlib.sha256()
+        digest.update(
+            f"{INDEX_VERSION}:{self.cell_size}:{MAX_INDEX_DEC}:{MAX_CELL_DEC}".encode()
+        )
+        for array in [self.field_ids, self.field_ras, self.field_decs]:
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()[:16]
+
+    def get_band(self, decs: np.ndarray) -> np.ndarray:
+        """
+        Get the declination band of positions.
+
+        :param decs: Declinations (degrees)
+        :return: Band indices
+        """
+        bands = np.floor((decs + 90.0) / self.cell_size).astype(int)
+        return np.clip(bands, 0, self.n_bands - 1)
+
+    @staticmethod
+    def get_ra_bin(ras: np.ndarray, n_bins: np.ndarray) -> np.ndarray:
+        """
+        Get the RA bin of positions, within their band.
+
+        :param ras: Right ascensions (degrees)
+        :param n_bins: Number of RA bins in the band of each position
+        :return: RA bin indices
+        """
+        ra_bins = np.floor(ras / 360.0 * n_bins).astype(int)
+        return np.clip(ra_bins, 0, n_bins - 1)
+
+    def build(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Build the index.
+
+        Each RA bin is at least as wide as the largest field overlap half-width
+        of any position in the band or its neighbours.
+
+        :return: Number of RA bins per band, cell offset of each band, and
+            padded table of field rows per cell
+        """
+        band_low = -90.0 + self.cell_size * np.arange(self.n_bands)
+        band_high = band_low + self.cell_size
+        max_dec = np.minimum(
+            np.maximum(np.abs(band_low), np.abs(band_high)) + self.cell_size,
+            MAX_CELL_DEC,
+        )
+        ra_width = np.maximum(
+            self.cell_size, 0.5 * self.base_width / np.cos(np.radians(max_dec))
+        )
+        band_bins = np.maximum(np.floor(360.0 / ra_width), 1).astype(int)
+        band_offsets = np.concatenate([[0], np.cumsum(band_bins)])
+
+        rows = np.nonzero(np.abs(self.field_decs) <= MAX_INDEX_DEC + self.cell_size)[0]
+        bands = self.get_band(self.field_decs[rows])
+        cells = band_offsets[bands] + self.get_ra_bin(
+            self.field_ras[rows], band_bins[bands]
+        )
+
+        order = np.argsort(cells, kind="stable")
+        rows, cells = rows[order], cells[order]
+        counts = np.bincount(cells, minlength=band_offsets[-1])
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        ranks = np.arange(len(cells)) - starts[cells]
+
+        members = np.full((band_offsets[-1], max(counts.max(), 1)), -1, dtype=np.int64)
+        members[cells, ranks] = rows
+
+        return band_bins, band_offsets, members
+
+    def load_or_build(
+        self, cache_dir: str | Path | None = None
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Load the index from the cache, or build and cache it.
+
+        :param cache_dir: Cache directory, or None to not use a cache
+        :return: Index arrays
+        """
+        cache_path = None
+        if cache_dir is not None:
+            grid = "summer" if self.summer else "winter"
+            cache_path = Path(cache_dir).joinpath(
+                f"field_grid_{grid}_{self.get_grid_hash()}.npz"
+            )
+            if cache_path.exists():
+                try:
+                    with np.load(cache_path) as cached:
+                        return (
+                            cached["band_bins"],
+                            cached["band_offsets"],
+                            cached["members"],
+                        )
+                except (OSError, KeyError, ValueError):
+                    logger.warning(f"Could not read field index cache {cache_path}")
+
+        band_bins, band_offsets, members = self.build()
+
+        if cache_path is not None:
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(dir=cache_path.parent, suffix=".tmp")
+                with os.fdopen(fd, "wb") as out_f:
+                    np.savez(
+                        out_f,
+                        band_bins=band_bins,
+                        band_offsets=band_offsets,
+                        members=members,
+                    )
+                os.replace(temp_path, cache_path)
+                logger.debug(f"Saved field index to {cache_path}")
+            except OSError:
+                logger.warning(f"Could not save field index cache to {cache_path}")
+
+        return band_bins, band_offsets, members
+
+    def _get_candidates(self, ras: np.ndarray, decs: np.ndarray) -> np.ndarray:
+        """
+        Get the fields in the 3x3 neighbouring cells of positions.
+
+        :param ras: Right ascensions (degrees)
+        :param decs: Declinations (degrees)
+        :return: Array of field rows for each position, padded with -1
+        """
+        bands = self.get_band(decs)
+        candidates = []
+        for d_band in [-1, 0, 1]:
+            neighbour_bands = bands + d_band
+            valid_band = (neighbour_bands >= 0) & (neighbour_bands < self.n_bands)
+            neighbour_bands = np.clip(neighbour_bands, 0, self.n_bands - 1)
+            n_bins = self.band_bins[neighbour_bands]
+            ra_bins = self.get_ra_bin(ras, n_bins)
+            for d_ra in [-1, 0, 1]:
+                neighbour_bins = ra_bins + d_ra
+                valid = valid_band & (neighbour_bins >= 0) & (neighbour_bins < n_bins)
+                cells = self.band_offsets[neighbour_bands] + np.clip(
+                    neighbour_bins, 0, n_bins - 1
+                )
+                cell_members = self.members[cells]
+                cell_members[~valid] = -1
+                candidates.append(cell_members)
+        return np.concatenate(candidates, axis=1)
+
+    def _get_best_rows(  # pylint: disable=too-many-locals
+        self, ras: np.ndarray, decs: np.ndarray
+    ) -> np.ndarray:
+        """
+        Get the best field row for positions within the indexed declinations.
+
+        :param ras: Right ascensions (degrees)
+        :param decs: Declinations (degrees)
+        :return: Field rows
+        """
+        candidates = self._get_candidates(ras, decs)
+        is_member = candidates >= 0
+        safe = np.where(is_member, candidates, 0)
+
+        cand_ras = self.field_ras[safe]
+        cand_decs = self.field_decs[safe]
+
+        width = self.base_width / np.cos(np.radians(decs))
+        ra_col, dec_col, width_col = ras[:, None], decs[:, None], width[:, None]
+        overlaps = (
+            is_member
+            & (cand_ras > ra_col - 0.5 * width_col)
+            & (cand_ras < ra_col + 0.5 * width_col)
+            & (cand_decs > dec_col - 0.5 * width_col)
+            & (cand_decs < dec_col + 0.5 * width_col)
+        )
+
+        if not np.all(np.any(overlaps, axis=1)):
+            missing = np.nonzero(~np.any(overlaps, axis=1))[0]
+            err = (
+                f"No field overlaps position(s) "
+                f"{list(zip(ras[missing], decs[missing]))[:10]}"
+            )
+            logger.error(err)
+            raise ValueError(err)
+
+        separations = np.where(
+            overlaps, angular_separation(ra_col, dec_col, cand_ras, cand_decs), np.inf
+        )
+        is_closest = separations == separations.min(axis=1, keepdims=True)
+        # Ties go to the first field in the grid, as with get_best_field
+        return np.where(is_closest, safe, len(self.fields)).min(axis=1)
+
+    def get_best_fields(
+        self, ras: np.ndarray | list[float], decs: np.ndarray | list[float]
+    ) -> pd.DataFrame:
+        """
+        Get the best field for each of many positions.
+
+        :param ras: Right ascensions (degrees)
+        :param decs: Declinations (degrees)
+        :return: Field table rows, one per position
+        """
+        ras = np.asarray(ras, dtype=float)
+        decs = np.asarray(decs, dtype=float)
+        best_rows = np.zeros(len(ras), dtype=int)
+
+        indexed = np.abs(decs) <= MAX_INDEX_DEC
+        indexed_positions = np.nonzero(indexed)[0]
+        for start in range(0, len(indexed_positions), CHUNK_SIZE):
+            chunk = indexed_positions[start : start + CHUNK_SIZE]
+            best_rows[chunk] = self._get_best_rows(ras[chunk], decs[chunk])
+
+        for i in np.nonzero(~indexed)[0]:
+            best_field = get_best_field(ras[i], decs[i], summer=self.summer)
+            best_rows[i] = self.fields.index.get_loc(best_field.name)
+
+        return self.fields.iloc[best_rows].reset_index(drop=True)
+
+    def get_fields_by_id(self, field_ids: np.ndarray | list[int]) -> pd.DataFrame:
+        """
+        Get the field table rows for many field IDs.
+
+        :param field_ids: Field IDs
+        :return: Field table rows, one per ID
+        """
+        rows = self._rows_by_id.get_indexer(np.asarray(field_ids, dtype=int))
+        if np.any(rows < 0):
+            err = f"Could not find fields {np.asarray(field_ids)[rows < 0].tolist()}"
+            logger.error(err)
+            raise KeyError(err)
+        return self.fields.iloc[rows].reset_index(drop=True)
+
+
+def build_schedule(  # pylint: disable=too-many-locals
+    toos: list[AllTooClasses], program: Program
+) -> pd.DataFrame:
+    """
+    Build a schedule for many ToO requests at once, equivalent to
+    wintertoo.schedule.concat_toos.
+
+    Field lookups are vectorised with a FieldGridIndex, and the schedule is
+    built and validated once rather than once per request.
+
+    :param toos: List of ToO requests
+    :param program: Program details
+    :return: Schedule dataframe
+    """
+    positions = {}
+    for i, too in enumerate(toos):
+        if isinstance(too, (SummerFieldToO, WinterFieldToO)):
+            positions[i] = None
+        elif isinstance(too, (SummerRaDecToO, WinterRaDecToO, SpringRaDecToO)):
+            if isinstance(too, Spring) and too.use_field_grid:
+                raise ValueError(
+                    "Spring ToO requests cannot use the field grid option."
+                )
+            positions[i] = (too.ra_deg, too.dec_deg, get_default_value("fieldID"))
+        else:
+            err = f"Unrecognised type {type(too)} for {too}"
+            logger.error(err)
+            raise WinterValidationError(err)
+
+    for summer in [False, True]:
+        index = None
+
+        field_toos = [
+            i
+            for i, too in enumerate(toos)
+            if positions[i] is None and is_summer(too) == summer
+        ]
+        if len(field_toos) > 0:
+            index = FieldGridIndex.get_index(summer=summer)
+            fields = index.get_fields_by_id([toos[i].field_id for i in field_toos])
+            for i, (_, field) in zip(field_toos, fields.iterrows()):
+                positions[i] = (float(field["RA"]), float(field["Dec"]), None)
+
+        grid_toos = [
+            i
+            for i, too in enumerate(toos)
+            if isinstance(too, (SummerRaDecToO, WinterRaDecToO))
+            and too.use_field_grid
+            and is_summer(too) == summer
+        ]
+        if len(grid_toos) > 0:
+            index = index or FieldGridIndex.get_index(summer=summer)
+            fields = index.get_best_fields(
+                [toos[i].ra_deg for i in grid_toos],
+                [toos[i].dec_deg for i in grid_toos],
+            )
+            for i, (_, field) in zip(grid_toos, fields.iterrows()):
+                positions[i] = (field["RA"], field["Dec"], field["ID"])
+
+    full_requests = []
+    for i, too in enumerate(toos):
+        too_dict = too.model_dump(exclude=set(too.__class__.model_computed_fields))
+        ra_deg, dec_deg, field_id = positions[i]
+        too_dict["ra_deg"] = ra_deg
+        too_dict["dec_deg"] = dec_deg
+        if field_id is not None:
+            too_dict["field_id"] = field_id
+        full_requests.append(FullTooRequest(**too_dict))
+
+    schedule = make_schedule(toos=full_requests, program=program)
+    schedule["fieldID"] = schedule["fieldID"].astype(int)
+    return schedule
@@ -0,0 +1,283 @@
+"""
+Module for a local catalog of image footprints, built from previous query results.
+
+The catalog remembers which sky regions and date ranges have already been
+queried for each program and image type. Cone, rectangle and program queries
+which are fully covered can then be answered locally, and only the missing date
+ranges need to be queried from the server.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from astropy.time import Time
+from wintertoo.models import ConeImageQuery, ProgramImageQuery, RectangleImageQuery
+from wintertoo.utils import get_date
+
+from winterapi.sky import angular_separation, get_cone_ra_half_width
+from winterapi.utils import get_nightdates
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = "%Y%m%d"
+
+SpatialQuery = ConeImageQuery | RectangleImageQuery | ProgramImageQuery
+
+
+def is_full_sky(query: SpatialQuery) -> bool:
+    """
+    Check whether a query covers the full sky, i.e. is a plain program query.
+
+    :param query: Image query
+    :return: boolean
+    """
+    return type(query) is ProgramImageQuery  # pylint: disable=unidiomatic-typecheck
+
+
+def is_supported(query) -> bool:
+    """
+    Check whether a query can be answered by a footprint catalog.
+
+    :param query: Image query
+    :return: boolean
+    """
+    return isinstance(query, (ConeImageQuery, RectangleImageQuery)) or is_full_sky(
+        query
+    )
+
+
+def get_corners(query: RectangleImageQuery) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Get the corners of a rectangle query.
+
+    :param query: Rectangle query
+    :return: RA and Dec of the corners
+    """
+    ras = np.array([query.ra_min, query.ra_min, query.ra_max, query.ra_max])
+    decs = np.array([query.dec_min, query.dec_max, query.dec_min, query.dec_max])
+    return ras, decs
+
+
+def region_contains(  # pylint: disable=too-many-return-statements
+    outer: SpatialQuery, inner: SpatialQuery
+) -> bool:
+    """
+    Check whether the sky region of one query contains that of another.
+
+    Rectangles are bounded by lines of constant RA and Dec, so the distance
+    from a point to any rectangle edge is greatest at its corners.
+
+    :param outer: Query with the covering region
+    :param inner: Query with the region to check
+    :return: boolean
+    """
+    if is_full_sky(outer):
+        return True
+    if is_full_sky(inner):
+        return False
+
+    if isinstance(outer, ConeImageQuery):
+        if isinstance(inner, ConeImageQuery):
+            separation = angular_separation(outer.ra, outer.dec, inner.ra, inner.dec)
+            return separation + inner.radius_deg <= outer.radius_deg
+        ras, decs = get_corners(inner)
+        return bool(
+            np.all(
+                angular_separation(outer.ra, outer.dec, ras, decs) <= outer.radius_deg
+            )
+        )
+
+    if isinstance(inner, RectangleImageQuery):
+        return (
+            outer.ra_min <= inner.ra_min
+            and inner.ra_max <= outer.ra_max
+            and outer.dec_min <= inner.dec_min
+            and inner.dec_max <= outer.dec_max
+        )
+
+    half_width = get_cone_ra_half_width(inner.dec, inner.radius_deg)
+    if half_width is None:
+        return False
+    return (
+        outer.ra_min <= inner.ra - half_width
+        and inner.ra + half_width <= outer.ra_max
+        and outer.dec_min <= inner.dec - inner.radius_deg
+        and inner.dec + inner.radius_deg <= outer.dec_max
+    )
+
+
+def shift_date(date: int, days: int) -> int:
+    """
+    Shift a date in YYYYMMDD format by a number of days.
+
+    :param date: Date
+    :param days: Number of days
+    :return: Shifted date
+    """
+    shifted = datetime.strptime(str(date), DATE_FORMAT) + timedelta(days=days)
+    return int(shifted.strftime(DATE_FORMAT))
+
+
+class FootprintCatalog:
+    """
+    Local catalog of images from previous queries, indexed by position.
+
+    Images are stored sorted by declination, per program and image type, so
+    that spatial searches only need to filter a narrow band of images. Newly
+    added images are buffered, and merged into the sorted images once, at the
+    next search.
+
+    The current night is never considered covered, since new images may still
+    be added to it.
+    """
+
+    def __init__(self):
+        self._images = {}
+        self._decs = {}
+        self._pending = {}
+        self._coverage = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(query: SpatialQuery) -> tuple[str, str]:
+        """
+        Get the catalog key for a query.
+
+        :param query: Image query
+        :return: Program name and image type
+        """
+        return query.program_name, str(query.image_type)
+
+    def add(self, query: SpatialQuery, images: pd.DataFrame):
+        """
+        Add the results of a query to the catalog.
+
+        :param query: Image query which was sent to the server
+        :param images: Images returned for the query
+        :return: None
+        """
+        key = self.get_key(query)
+
+        # Nights which are not yet over may still gain images
+        latest_complete = shift_date(get_date(Time.now()), -1)
+        end_date = min(int(query.end_date), latest_complete)
+
+        with self._lock:
+            if int(query.start_date) <= end_date:
+                covered = query.model_copy(update={"end_date": end_date})
+                self._coverage.setdefault(key, []).append(covered)
+
+            if len(images) > 0:
+                self._pending.setdefault(key, []).append(images)
+
+    def _merge(self, key: tuple[str, str]):
+        """
+        Merge buffered images into the sorted images of a key.
+        Must be called with the lock held.
+
+        :param key: Program name and image type
+        :return: None
+        """
+        pending = self._pending.pop(key, [])
+        if len(pending) == 0:
+            return
+
+        all_images = pd.concat(
+            [x for x in [self._images.get(key)] if x is not None] + pending,
+            ignore_index=True,
+        )
+        subset = "savepath" if "savepath" in all_images.columns else None
+        all_images = all_images.drop_duplicates(subset=subset)
+        all_images = all_images.sort_values("dec", ignore_index=True, kind="stable")
+        self._images[key] = all_images
+        self._decs[key] = all_images["dec"].to_numpy(dtype=float)
+
+    def get_missing_dates(self, query: SpatialQuery) -> list[tuple[int, int]]:
+        """
+        Get the date ranges of a query which are not covered by the catalog.
+
+        :param query: Image query
+        :return: List of (start date, end date) ranges, inclusive
+        """
+        with self._lock:
+            coverage = [
+                x
+                for x in self._coverage.get(self.get_key(query), [])
+                if region_contains(x, query)
+            ]
+
+        intervals = sorted((int(x.start_date), int(x.end_date)) for x in coverage)
+
+        missing = []
+        start, end = int(query.start_date), int(query.end_date)
+        for covered_start, covered_end in intervals:
+            if covered_end < start:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > start:
+                missing.append((start, shift_date(covered_start, -1)))
+            start = max(start, shift_date(covered_end, 1))
+            if start > end:
+                break
+
+        if start <= end:
+            missing.append((start, end))
+
+        return missing
+
+    def covers(self, query: SpatialQuery) -> bool:
+        """
+        Check whether a query is fully covered by the catalog.
+
+        :param query: Image query
+        :return: boolean
+        """
+        return len(self.get_missing_dates(query)) == 0
+
+    def search(self, query: SpatialQuery) -> pd.DataFrame:
+        """
+        Find the images in the catalog matching a query.
+
+        :param query: Image query
+        :return: Matching images
+        """
+        key = self.get_key(query)
+        with self._lock:
+            self._merge(key)
+            images = self._images.get(key)
+            decs = self._decs.get(key)
+
+        if images is None:
+            return pd.DataFrame()
+
+        if isinstance(query, ConeImageQuery):
+            dec_min = query.dec - query.radius_deg
+            dec_max = query.dec + query.radius_deg
+        elif isinstance(query, RectangleImageQuery):
+            dec_min, dec_max = query.dec_min, query.dec_max
+        else:
+            dec_min, dec_max = -90.0, 90.0
+
+        lower = np.searchsorted(decs, dec_min, side="left")
+        upper = np.searchsorted(decs, dec_max, side="right")
+        candidates = images.iloc[lower:upper]
+
+        nightdates = get_nightdates(candidates["nightdate"])
+        mask = (nightdates >= int(query.start_date)) & (
+            nightdates <= int(query.end_date)
+        )
+
+        ras = candidates["ra"].to_numpy(dtype=float)
+        if isinstance(query, ConeImageQuery):
+            separations = angular_separation(
+                query.ra, query.dec, ras, decs[lower:upper]
+            )
+            mask &= separations <= query.radius_deg
+        elif isinstance(query, RectangleImageQuery):
+            mask &= (ras >= query.ra_min) & (ras <= query.ra_max)
+
+        return candidates[mask].reset_index(drop=True)
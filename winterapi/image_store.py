@@ -0,0 +1,330 @@
+"""
+Module for a local, content-addressed store of downloaded images.
+
+Images are indexed by their server path and image type, and saved under their
+checksum, so that repeated downloads of the same image are never needed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import BinaryIO
+
+from astropy.io import fits
+from filelock import FileLock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = Path.home().joinpath("winterapi_images")
+INDEX_NAME = "index.json"
+HASH_CHUNK_SIZE = 2**20
+LOCK_TIMEOUT = 300.0
+
+
+def get_file_checksum(path: str | Path) -> str:
+    """
+    Get the sha256 checksum of a file.
+
+    :param path: Path to the file
+    :return: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as in_f:
+        for chunk in iter(lambda: in_f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_with_checksum(in_f: BinaryIO, out_f: BinaryIO) -> str:
+    """
+    Copy a file, computing its sha256 checksum as it is written.
+
+    :param in_f: File to read
+    :param out_f: File to write
+    :return: Hex digest
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: in_f.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+        out_f.write(chunk)
+    return digest.hexdigest()
+
+
+def match_members(members: list[str], paths: list[str]) -> dict[str, str]:
+    """
+    Match the members of a zip file to the server paths which were requested.
+
+    A member matches a path if the member's relative path is the path itself
+    or a trailing part of it, so members named only by file name still match
+    when their file names are unique. Members which could match several
+    paths are ambiguous, and are left unmatched rather than being guessed,
+    so that their paths are still missing from the store and can be
+    requested again.
+
+    :param members: Names of the zip members
+    :param paths: Server paths which were requested
+    :return: Dictionary of member name to server path, for matched members
+    """
+    by_name = {}
+    for path in paths:
+        by_name.setdefault(Path(path).name, []).append(path)
+
+    matches = {}
+    for member in members:
+        relative = member.strip("/")
+        candidates = [
+            x
+            for x in by_name.get(Path(relative).name, [])
+            if x.strip("/") == relative or x.endswith("/" + relative)
+        ]
+        if len(set(candidates)) > 1:
+            logger.warning(
+                f"Skipping zip member {member}, which matches several requested "
+                f"paths {sorted(set(candidates))}"
+            )
+            continue
+        if len(candidates) == 1 and candidates[0] not in matches.values():
+            matches[member] = candidates[0]
+
+    return matches
+
+
+def verify_image(path: str | Path) -> bool:
+    """
+    Verify the FITS checksums (CHECKSUM/DATASUM keywords) of an image.
+
+    Files which are not FITS, or HDUs without checksums, are assumed valid.
+
+    :param path: Path of the image
+    :return: boolean for whether the image is valid
+    """
+    path = Path(path)
+    if ".fits" not in path.suffixes and ".fit" not in path.suffixes:
+        return True
+
+    try:
+        with fits.open(path, memmap=True) as hdul:
+            for hdu in hdul:
+                if "CHECKSUM" in hdu.header and hdu.verify_checksum() == 0:
+                    return False
+                if "DATASUM" in hdu.header and hdu.verify_datasum() == 0:
+                    return False
+    except OSError:
+        return False
+    return True
+
+
+class ImageStore:
+    """
+    Class for a local store of images, indexed by server path and checksum
+    """
+
+    def __init__(self, root: str | Path | None = None):
+        if root is None:
+            root = DEFAULT_STORE_DIR
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root.joinpath(INDEX_NAME)
+        self._file_lock = FileLock(
+            self.index_path.with_suffix(".json.lock"), timeout=LOCK_TIMEOUT
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(path: str, image_type: str) -> str:
+        """
+        Get the index key for an image.
+
+        :param path: Server path of the image
+        :param image_type: Type of image
+        :return: Key
+        """
+        return f"{image_type}:{path}"
+
+    def load_index(self) -> dict:
+        """
+        Load the index of the store.
+
+        :return: Index dictionary
+        """
+        if not self.index_path.exists():
+            return {}
+        with open(self.index_path, "r", encoding="utf-8") as in_f:
+            return json.load(in_f)
+
+    def _write_index(self, index: dict):
+        temp_path = self.index_path.with_suffix(".json.tmp")
+        with open(temp_path, "w", encoding="utf-8") as out_f:
+            json.dump(index, out_f)
+        os.replace(temp_path, self.index_path)
+
+    def get_local_path(self, path: str, image_type: str) -> Path | None:
+        """
+        Get the local path of an image, if it is in the store.
+
+        :param path: Server path of the image
+        :param image_type: Type of image
+        :return: Local path, or None if missing
+        """
+        return self.get_local_paths([path], image_type=image_type)[0]
+
+    def get_local_paths(self, paths: list[str], image_type: str) -> list[Path | None]:
+        """
+        Get the local paths of images, with None for those not in the store.
+
+        :param paths: Server paths of the images
+        :param image_type: Type of image
+        :return: List of local paths
+        """
+        index = self.load_index()
+        local_paths = []
+        for path in paths:
+            entry = index.get(self.get_key(path, image_type))
+            local_path = None
+            if entry is not None:
+                local_path = self.root.joinpath(entry["file"])
+                if not local_path.exists():
+                    local_path = None
+            local_paths.append(local_path)
+        return local_paths
+
+    def get_size(self) -> int:
+        """
+        Get the total size of the images in the store.
+
+        :return: Size in bytes
+        """
+        objects_dir = self.root.joinpath("objects")
+        if not objects_dir.exists():
+            return 0
+        return sum(x.stat().st_size for x in objects_dir.rglob("*") if x.is_file())
+
+    def get_missing(self, paths: list[str], image_type: str) -> list[str]:
+        """
+        Get the server paths of images which are not in the store.
+
+        :param paths: Server paths of the images
+        :param image_type: Type of image
+        :return: List of missing server paths
+        """
+        local_paths = self.get_local_paths(paths, image_type=image_type)
+        missing = [x for x, y in zip(paths, local_paths) if y is None]
+        return list(dict.fromkeys(missing))
+
+    def add_files(
+        self,
+        files: dict[str, Path],
+        image_type: str,
+        checksums: dict[str, str] | None = None,
+    ) -> dict[str, Path]:
+        """
+        Move files into the store, and index them by server path.
+
+        :param files: Dictionary of server path to local file to move
+        :param image_type: Type of image
+        :param checksums: Precomputed sha256 checksums, by server path
+        :return: Dictionary of server path to stored local path
+        """
+        if checksums is None:
+            checksums = {}
+
+        entries = {}
+        for path, source in files.items():
+            checksum = checksums.get(path)
+            if checksum is None:
+                checksum = get_file_checksum(source)
+            relative_path = Path("objects", checksum[:2], checksum, Path(path).name)
+            output_path = self.root.joinpath(relative_path)
+            if output_path.exists():
+                Path(source).unlink()
+            else:
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(source, output_path)
+            entries[self.get_key(path, image_type)] = {
+                "sha256": checksum,
+                "file": relative_path.as_posix(),
+            }
+
+        with self._lock, self._file_lock:
+            index = self.load_index()
+            index.update(entries)
+            self._write_index(index)
+
+        return {
+            path: self.root.joinpath(entries[self.get_key(path, image_type)]["file"])
+            for path in files
+        }
+
+    def ingest_zip(  # pylint: disable=too-many-arguments,too-many-locals
+        self,
+        zip_path: str | Path,
+        paths: list[str],
+        image_type: str,
+        verify: bool = False,
+        executor: Executor | None = None,
+    ) -> dict[str, Path]:
+        """
+        Add the images from a downloaded zip file to the store.
+
+        Zip members are matched to the requested server paths by their
+        relative path (see match_members).
+        The CRC of each member is checked as it is extracted, and its checksum
+        is computed at the same time. If verify is set, the FITS checksums of
+        each member are also checked, in parallel if an executor is provided.
+        Corrupted members are not added to the store.
+
+        :param zip_path: Path of the zip file
+        :param paths: Server paths which were requested
+        :param image_type: Type of image
+        :param verify: Whether to verify the FITS checksums of each member
+        :param executor: Executor to run verification with
+        :return: Dictionary of server path to stored local path
+        """
+        files = {}
+        checksums = {}
+        corrupted = []
+        with tempfile.TemporaryDirectory(dir=self.root) as temp_dir:
+            with zipfile.ZipFile(zip_path) as archive:
+                members = [x for x in archive.infolist() if not x.is_dir()]
+                matches = match_members([x.filename for x in members], paths)
+                for i, member in enumerate(members):
+                    if member.filename not in matches:
+                        continue
+                    path = matches[member.filename]
+                    # Requested paths may share a file name
+                    name = f"{i:06d}_{Path(member.filename).name}"
+                    temp_path = Path(temp_dir).joinpath(name)
+                    try:
+                        with (
+                            archive.open(member) as in_f,
+                            open(temp_path, "wb") as out_f,
+                        ):
+                            checksums[path] = copy_with_checksum(in_f, out_f)
+                    except zipfile.BadZipFile:
+                        corrupted.append(path)
+                        continue
+                    files[path] = temp_path
+
+            if verify:
+                mapper = map if executor is None else executor.map
+                valid = dict(zip(files, mapper(verify_image, files.values())))
+                corrupted += [x for x, is_valid in valid.items() if not is_valid]
+
+            if len(corrupted) > 0:
+                logger.error(
+                    f"{len(corrupted)} corrupted images not added to store: "
+                    f"{corrupted}"
+                )
+                files = {x: y for x, y in files.items() if x not in corrupted}
+
+            added = self.add_files(files, image_type=image_type, checksums=checksums)
+
+        logger.info(f"Added {len(added)} images to store at {self.root}")
+        return added
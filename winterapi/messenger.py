@@ -2,18 +2,28 @@
 This module contains the messenger, which is used to communicate with the API
 """
 
+# pylint: disable=too-many-lines
+
 import getpass
+import itertools
+import json
 import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from importlib import metadata
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Iterator, Optional
 
+import numpy as np
 import pandas as pd
 import requests
 from astropy import units as u
 from astropy.time import Time
 from packaging import version
-from wintertoo.data import DEFAULT_IMAGE_TYPE, WinterImageTypes
+from wintertoo.data import DEFAULT_IMAGE_TYPE, WinterImageTypes, get_overhead
+from wintertoo.errors import WinterValidationError
 from wintertoo.models import (
     ConeImageQuery,
     ImagePath,
@@ -31,67 +41,156 @@ from wintertoo.models.too import (
     WinterFieldToO,
     WinterRaDecToO,
 )
-from wintertoo.schedule import concat_toos
 from wintertoo.utils import get_date
+from wintertoo.validate import validate_schedule_with_program
 
-from winterapi.base_api import MAX_TIMEOUT, BaseAPI
+from winterapi.agent import get_fidelius
+from winterapi.base_api import BaseAPI
+from winterapi.cassette import Cassette, CassetteMissError, build_response
+from winterapi.coalesce import DEFAULT_MAX_EXTENT_DEG, coalesce_cones, split_by_cones
+from winterapi.download import DownloadResult
 from winterapi.endpoints import (
-    DOWNLOAD_LIST_URL,
-    IMAGE_QUERY_URL,
-    PING_URL,
-    PROGRAM_URL,
-    SCHEDULE_DELETE_URL,
-    SCHEDULE_DETAILS_URL,
-    SCHEDULE_SUMMARY_URL,
-    SUMMER_TOO_URL,
-    USER_URL,
-    VERSION_URL,
-    WINTER_TOO_URL,
+    DOWNLOAD_LIST_PATH,
+    IMAGE_QUERY_PATH,
+    PING_PATH,
+    PROGRAM_PATH,
+    SCHEDULE_DELETE_PATH,
+    SCHEDULE_DETAILS_PATH,
+    SCHEDULE_SUMMARY_PATH,
+    SUMMER_TOO_PATH,
+    USER_PATH,
+    VERSION_PATH,
+    WINTER_TOO_PATH,
 )
 from winterapi.fidelius import Fidelius
+from winterapi.fields import build_schedule
+from winterapi.footprint import FootprintCatalog, is_supported
+from winterapi.image_store import ImageStore
+from winterapi.queue_cache import QueueCache
+from winterapi.rate_limit import RateLimiter
+from winterapi.spill import SpilledResult, get_memory_usage
+from winterapi.timeouts import AdaptiveTimeouts, ContextThreadPoolExecutor
+from winterapi.too_table import build_schedule_table, get_too_payload, get_too_table
+from winterapi.transfer import Transfer
+from winterapi.utils import get_batches
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_PAGE_SIZE = 10000
+VERSION_CHECK_INTERVAL = 3600.0
+# Fraction of the program allocation kept free before trusting a local dry run
+LOCAL_HOURS_MARGIN = 0.1
+
+
+def get_body_table(res: requests.Response) -> pd.DataFrame:
+    """
+    Parse the body of an API response as a table.
+
+    :param res: API response
+    :return: Table
+    """
+    return pd.DataFrame(res.json()["body"])
+
 
-class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
+# pylint: disable-next=too-many-public-methods,too-many-instance-attributes
+class WinterAPI(BaseAPI):
     """
-    Class to communicate with the Winter API
+    Class to communicate with the Winter API.
+
+    A single instance can be shared between threads. All requests share one
+    pool of connections, and credentials are read from an immutable snapshot.
     """
 
-    def __init__(self):
-        self.fidelius = Fidelius()
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        base_urls: list[str] | str | None = None,
+        prefer_fastest: bool = False,
+        cassette: Cassette | None = None,
+        credential_agent: str | Path | None = None,
+        footprint_catalog: FootprintCatalog | None = None,
+        rate_limiter: RateLimiter | None = None,
+        timeouts: AdaptiveTimeouts | None = None,
+        queue_cache: QueueCache | None = None,
+    ):
+        super().__init__(
+            cassette=cassette,
+            base_urls=base_urls,
+            prefer_fastest=prefer_fastest,
+            rate_limiter=rate_limiter,
+            timeouts=timeouts,
+        )
+        self.fidelius = get_fidelius(socket_path=credential_agent)
+        self.footprint_catalog = footprint_catalog
+        self.queue_cache = queue_cache
         ping = self.ping()
         if not ping:
             logger.warning("Could not successfully ping server")
         logger.info(f"API ping success is {ping}")
         self.auth = (None, None)
+        self._auth_lock = threading.Lock()
+        self.server_version = None
+        self._version_checked = 0.0
+        self._version_lock = threading.Lock()
         self.check_version()
 
-    @staticmethod
-    def ping():
+    def ping(self) -> bool:
         """
         Ping the API.
 
+        Every configured host is pinged, and its health and latency are updated
+        so that subsequent requests fail over to a reachable host.
+
         :return: boolean for success
         """
-        try:
-            res = requests.get(PING_URL, timeout=MAX_TIMEOUT)
-            res.raise_for_status()
-            return res.status_code == 200
-        except requests.exceptions.ConnectionError:
-            return False
-
-    @staticmethod
-    def check_version():
+        if self.cassette is not None and self.cassette.is_replay:
+            try:
+                return self._send("GET", PING_PATH).status_code == 200
+            except CassetteMissError:
+                return False
+
+        success = False
+
+        for base_url in self.hosts.base_urls:
+            timeout = self.get_timeout(PING_PATH)
+            start = time.perf_counter()
+            try:
+                res = self.session.get(base_url + PING_PATH, timeout=timeout)
+                res.raise_for_status()
+            except requests.exceptions.RequestException:
+                self.hosts.mark_unhealthy(base_url)
+                continue
+
+            latency = time.perf_counter() - start
+            logger.debug(f"Pinged {base_url} in {latency:.3f} s")
+            self.hosts.mark_healthy(base_url, latency=latency)
+            if self.timeouts is not None:
+                self.timeouts.record(PING_PATH, latency)
+
+            if self.cassette is not None and not success:
+                self.cassette.record("GET", PING_PATH, res)
+
+            success = True
+
+        return success
+
+    def check_version(self):
         """
         Check the version of the API.
 
         :return: API response
         """
-        res = requests.get(VERSION_URL, timeout=MAX_TIMEOUT)
+        try:
+            res = self._send("GET", VERSION_PATH)
+        except (requests.exceptions.ConnectionError, CassetteMissError):
+            logger.warning("Could not reach server to check minimum winterapi version")
+            return
+
         if res.status_code == 200:
             server_version = version.parse(res.json()["body"])
             local_version = version.parse(metadata.version("winterapi"))
+            self.server_version = server_version
+            self._version_checked = time.time()
             logger.info(f"Server requires minimum winterapi version: {server_version}")
             logger.info(f"Local winterapi version: {local_version}")
             if server_version > local_version:
@@ -103,6 +202,33 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         else:
             logger.warning("Could not check minimum version of winterapi for server")
 
+    def can_validate_locally(self) -> bool:
+        """
+        Check whether dry runs can be validated locally.
+
+        The minimum version required by the server is rechecked periodically.
+        Local validation is only trusted if the server version is known, has not
+        changed since the last check, and is not newer than the local version.
+
+        :return: boolean whether to validate locally
+        """
+        with self._version_lock:
+            previous_version = self.server_version
+            if time.time() - self._version_checked > VERSION_CHECK_INTERVAL:
+                self.check_version()
+
+            if self.server_version is None:
+                return False
+
+            if self.server_version != previous_version:
+                logger.info(
+                    f"Server version changed from {previous_version} to "
+                    f"{self.server_version}, validating with server"
+                )
+                return False
+
+            return self.server_version <= version.parse(metadata.version("winterapi"))
+
     @staticmethod
     def clear_cache():
         """
@@ -118,9 +244,14 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
 
         :return: user, password
         """
-        if self.auth == (None, None):
-            self.auth = (self.fidelius.get_user(), self.fidelius.get_password())
-        return self.auth
+        with self._auth_lock:
+            if self.auth == (None, None):
+                try:
+                    self.auth = self.fidelius.get_auth()
+                except KeyError:
+                    if self.cassette is None or not self.cassette.is_replay:
+                        raise
+            return self.auth
 
     def add_user_details(
         self,
@@ -153,7 +284,7 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         :param password: Password
         :return: API response
         """
-        return self.get(url=USER_URL, auth=(user, password))
+        return self.get(url=USER_PATH, auth=(user, password))
 
     def get_user(self) -> str:
         """
@@ -194,6 +325,42 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
 
         self.fidelius.add_program(program_details=program_dict, overwrite=overwrite)
 
+    def add_programs(
+        self,
+        programs: dict[str, str],
+        overwrite: bool = False,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        """
+        Add several programs for the API.
+
+        The programs are validated concurrently, and then saved in a single
+        write. If any program fails validation, none are saved.
+
+        :param programs: Dictionary of program name to program API key
+        :param overwrite: bool to overwrite existing details
+        :param max_workers: Maximum number of concurrent validation requests
+        :return: None
+        """
+
+        def check(program_name):
+            return self.check_program_details(
+                program_name=program_name,
+                program_api_key=programs[program_name],
+            )
+
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = list(executor.map(check, programs))
+
+        program_dicts = []
+        for program_name, res in zip(programs, responses):
+            program_dict = res.json()["body"]
+            program_dict["prog_key"] = programs[program_name]
+            program_dicts.append(program_dict)
+
+        self.fidelius.add_programs(programs=program_dicts, overwrite=overwrite)
+        logger.info(f"Added {len(program_dicts)} programs")
+
     def check_program_details(
         self, program_name: str, program_api_key: str
     ) -> requests.Response:
@@ -205,7 +372,7 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         :return: API response
         """
         return self.get(
-            PROGRAM_URL, program_name=program_name, program_api_key=program_api_key
+            PROGRAM_PATH, program_name=program_name, program_api_key=program_api_key
         )
 
     def get_programs(self):
@@ -223,33 +390,104 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         :param program_name: Name of the program
         :return:
         """
-        return self.fidelius.get_program_details(program_name=program_name)
+        if self.cassette is not None and self.cassette.is_replay:
+            if program_name not in self.fidelius.get_programs():
+                return self.cassette.get_program(program_name=program_name)
+
+        program = self.fidelius.get_program_details(program_name=program_name)
+
+        if self.cassette is not None:
+            self.cassette.record_program(program)
+
+        return program
+
+    @staticmethod
+    def validate_locally(
+        data: list[AllTooClasses] | pd.DataFrame, program: Program
+    ) -> pd.DataFrame | None:
+        """
+        Build and validate a ToO schedule locally, as the server would.
 
-    def _submit_too(
+        The result is uncertain, and None is returned, if any check fails or if
+        the request would bring the program close to its allocated hours, since
+        the hours used by the program are only known as of when it was added.
+
+        :param data: List of TOO requests, or validated table of TOO requests
+        :param program: Program details
+        :return: Schedule dataframe, or None if the server should be asked
+        """
+        try:
+            if isinstance(data, pd.DataFrame):
+                schedule = build_schedule_table(data, program=program)
+            else:
+                schedule = build_schedule(data, program=program)
+            validate_schedule_with_program(schedule, program)
+        except (WinterValidationError, ValueError, KeyError, AssertionError) as exc:
+            logger.info(f"Local validation failed ({exc}), validating with server")
+            return None
+
+        overhead = get_overhead(schedule["camera"].iloc[0])
+        new_hours = overhead * schedule["visitExpTime"].sum() / 3600.0
+        max_hours = (1.0 - LOCAL_HOURS_MARGIN) * program.hours_allocated
+        if program.hours_used + new_hours > max_hours:
+            logger.info("Request is close to the program allocation, using server")
+            return None
+
+        return schedule
+
+    def _submit_too(  # pylint: disable=too-many-arguments
         self,
         program_name: str,
         url: str,
-        data: list[AllTooClasses],
+        data: list[AllTooClasses] | pd.DataFrame,
         submit_trigger: bool = False,
+        local_dry_run: bool = False,
     ) -> tuple[requests.Response, pd.DataFrame]:
         """
         Protected method to submit TOO requests
 
         :param program_name: Name of the program under which to submit the TOO
         :param url: URL to submit to
-        :param data: List of TOO requests
+        :param data: List of TOO requests, or validated table of TOO requests
         :param submit_trigger: Boolean whether to really submit the TOO
+        :param local_dry_run: Boolean whether to validate dry runs locally,
+            only contacting the server if the local result is uncertain
         :return: API response and TOO schedule
         """
         program = self.get_program_details(program_name=program_name)
 
-        res = self.post(
-            url=url,
-            data=data,
-            program_name=program_name,
-            program_api_key=program.prog_key,
-            submit_trigger=submit_trigger,
-        )
+        if local_dry_run and not submit_trigger and self.can_validate_locally():
+            schedule = self.validate_locally(data, program=program)
+            if schedule is not None:
+                res = build_response(
+                    status_code=200,
+                    content=json.dumps(
+                        {
+                            "msg": "Schedule validated locally, not submitted",
+                            "body": json.loads(schedule.to_json(orient="records")),
+                        }
+                    ).encode(),
+                    headers={"Content-Type": "application/json"},
+                    url=url,
+                )
+                logger.info(res.json()["msg"])
+                return res, schedule
+
+        if isinstance(data, pd.DataFrame):
+            data = get_too_payload(data)
+
+        try:
+            res = self.post(
+                url=url,
+                data=data,
+                program_name=program_name,
+                program_api_key=program.prog_key,
+                submit_trigger=submit_trigger,
+            )
+        finally:
+            # Even a failed submission may have reached the queue
+            if submit_trigger:
+                self.invalidate_queue_cache(program_name=program_name)
 
         logger.info(res.json()["msg"])
 
@@ -262,6 +500,7 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         program_name: str,
         data: list[WinterFieldToO | WinterRaDecToO] | WinterFieldToO | WinterRaDecToO,
         submit_trigger: bool = False,
+        local_dry_run: bool = False,
     ) -> tuple[requests.Response, pd.DataFrame]:
         """
         Function to submit TOO requests for WINTER
@@ -269,6 +508,7 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         :param program_name: Name of the program under which to submit the TOO
         :param data: List of WINTER TOO requests
         :param submit_trigger: Boolean whether to really submit the TOO
+        :param local_dry_run: Boolean whether to validate dry runs locally
         :return: API response and TOO schedule
         """
         if not isinstance(data, list):
@@ -277,9 +517,10 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
             assert isinstance(entry, Winter), f"Entry {entry} is not a Winter ToO"
         return self._submit_too(
             program_name=program_name,
-            url=WINTER_TOO_URL,
+            url=WINTER_TOO_PATH,
             data=data,
             submit_trigger=submit_trigger,
+            local_dry_run=local_dry_run,
         )
 
     def submit_too_summer(
@@ -287,6 +528,7 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         program_name: str,
         data: list[SummerFieldToO | SummerRaDecToO] | SummerFieldToO | SummerRaDecToO,
         submit_trigger: bool = False,
+        local_dry_run: bool = False,
     ) -> tuple[requests.Response, pd.DataFrame]:
         """
         Function to submit TOO requests for SUMMER
@@ -294,6 +536,7 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         :param program_name: Name of the program under which to submit the TOO
         :param data: List of SUMMER TOO requests
         :param submit_trigger: boolean whether to really submit the TOO
+        :param local_dry_run: boolean whether to validate dry runs locally
         :return: API response and TOO schedule
         """
         if not isinstance(data, list):
@@ -302,11 +545,58 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
             assert isinstance(entry, Summer)
         return self._submit_too(
             program_name=program_name,
-            url=SUMMER_TOO_URL,
+            url=SUMMER_TOO_PATH,
             data=data,
             submit_trigger=submit_trigger,
+            local_dry_run=local_dry_run,
+        )
+
+    def submit_too_table(  # pylint: disable=too-many-arguments
+        self,
+        program_name: str,
+        table: pd.DataFrame | np.ndarray,
+        camera: str = "winter",
+        submit_trigger: bool = False,
+        local_dry_run: bool = False,
+    ) -> tuple[requests.Response, pd.DataFrame]:
+        """
+        Function to submit TOO requests given as a table, with one request per
+        row, without building a model for each request.
+
+        :param program_name: Name of the program under which to submit the TOO
+        :param table: Table of TOO requests, as a dataframe or record array
+        :param camera: Camera, either 'winter' or 'summer'
+        :param submit_trigger: Boolean whether to really submit the TOO
+        :param local_dry_run: Boolean whether to validate dry runs locally
+        :return: API response and TOO schedule
+        """
+        df = get_too_table(table, camera=camera)
+        return self._submit_too(
+            program_name=program_name,
+            url=SUMMER_TOO_PATH if camera == "summer" else WINTER_TOO_PATH,
+            data=df,
+            submit_trigger=submit_trigger,
+            local_dry_run=local_dry_run,
         )
 
+    def build_schedule_locally_table(
+        self,
+        table: pd.DataFrame | np.ndarray,
+        program_name: str,
+        camera: str = "winter",
+    ) -> pd.DataFrame:
+        """
+        Build a ToO Schedule locally, from a table of TOO requests
+
+        :param table: Table of TOO requests, as a dataframe or record array
+        :param program_name: Name of the program under which to submit the TOO
+        :param camera: Camera, either 'winter' or 'summer'
+        :return: Schedule dataframe
+        """
+        program = self.get_program_details(program_name=program_name)
+        df = get_too_table(table, camera=camera)
+        return build_schedule_table(df, program=program)
+
     def build_schedule_locally(
         self, data: list[AllTooClasses], program_name: str
     ) -> pd.DataFrame:
@@ -318,7 +608,44 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         :return: Schedule dataframe
         """
         program = self.get_program_details(program_name=program_name)
-        return concat_toos(data, program=program)
+        return build_schedule(data, program=program)
+
+    def invalidate_queue_cache(self, program_name: str | None = None):
+        """
+        Remove cached queue reads, after the queue is changed
+
+        :param program_name: Name of the program, or None for all programs
+        :return: None
+        """
+        if self.queue_cache is not None:
+            self.queue_cache.invalidate(program_name=program_name)
+
+    def _read_queue(
+        self,
+        program_name: str,
+        key: tuple,
+        read: Callable[[], tuple[requests.Response, pd.DataFrame]],
+    ) -> tuple[requests.Response, pd.DataFrame]:
+        """
+        Read from the queue, using the queue cache if there is one
+
+        :param program_name: Name of the program
+        :param key: Key of the read within the program
+        :param read: Function making the read
+        :return: API response and dataframe, which the caller may modify
+        """
+        if self.queue_cache is None:
+            return read()
+
+        cached = self.queue_cache.get(program_name, key)
+        if cached is not None:
+            res, df = cached
+            return res, df.copy()
+
+        generation = self.queue_cache.get_generation(program_name)
+        res, df = read()
+        self.queue_cache.put(program_name, key, (res, df.copy()), generation)
+        return res, df
 
     def get_observatory_queue(
         self,
@@ -333,14 +660,15 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
 
         program = self.get_program_details(program_name=program_name)
 
-        res = self.get(
-            SCHEDULE_SUMMARY_URL,
-            program_name=program_name,
-            program_api_key=program.prog_key,
-        )
+        def read():
+            return self.get_parsed(
+                SCHEDULE_SUMMARY_PATH,
+                get_body_table,
+                program_name=program_name,
+                program_api_key=program.prog_key,
+            )
 
-        observatory_queue = pd.DataFrame(res.json()["body"])
-        return res, observatory_queue
+        return self._read_queue(program_name, (SCHEDULE_SUMMARY_PATH,), read)
 
     def get_too_details(
         self,
@@ -356,16 +684,33 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         """
 
         program = self.get_program_details(program_name=program_name)
-
-        res = self.get(
-            SCHEDULE_DETAILS_URL,
-            program_name=program_name,
-            program_api_key=program.prog_key,
-            schedule_name=too_schedule_name,
+        return self._get_too_details(
+            program=program, too_schedule_name=too_schedule_name
         )
 
-        too_schedule = pd.DataFrame(res.json()["body"])
-        return res, too_schedule
+    def _get_too_details(
+        self, program: Program, too_schedule_name: str
+    ) -> tuple[requests.Response, pd.DataFrame]:
+        """
+        Get the details of a queued TOO schedule, for a program already looked up
+
+        :param program: Program under which TOO was submitted
+        :param too_schedule_name: Name of the TOO schedule
+        :return: API response and TOO schedule
+        """
+
+        def read():
+            return self.get_parsed(
+                SCHEDULE_DETAILS_PATH,
+                get_body_table,
+                program_name=program.progname,
+                program_api_key=program.prog_key,
+                schedule_name=too_schedule_name,
+            )
+
+        return self._read_queue(
+            program.progname, (SCHEDULE_DETAILS_PATH, too_schedule_name), read
+        )
 
     def delete_too_request(
         self,
@@ -381,41 +726,344 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         """
 
         program = self.get_program_details(program_name=program_name)
-
-        res = self.delete(
-            SCHEDULE_DELETE_URL,
-            program_name=program_name,
-            program_api_key=program.prog_key,
-            schedule_name=too_schedule_name,
+        return self._delete_too_request(
+            program=program, too_schedule_name=too_schedule_name
         )
 
+    def _delete_too_request(
+        self, program: Program, too_schedule_name: str
+    ) -> requests.Response:
+        """
+        Delete a queued TOO schedule, for a program already looked up
+
+        :param program: Program under which TOO was submitted
+        :param too_schedule_name: Name of the TOO schedule
+        :return: API response
+        """
+        try:
+            res = self.delete(
+                SCHEDULE_DELETE_PATH,
+                program_name=program.progname,
+                program_api_key=program.prog_key,
+                schedule_name=too_schedule_name,
+            )
+        finally:
+            self.invalidate_queue_cache(program_name=program.progname)
+
         return res
 
+    def get_schedule_names(
+        self,
+        program_name: str,
+        schedule_filter: Callable[[pd.DataFrame], pd.Series] | None = None,
+    ) -> list[str]:
+        """
+        Get the names of the queued TOO schedules of a program, optionally
+        filtered on the queue summary.
+
+        :param program_name: Name of the program
+        :param schedule_filter: Function returning a boolean mask for the queue
+            summary, e.g. lambda x: x["too_schedule_name"].str.startswith("test")
+        :return: List of schedule names
+        """
+        _, queue = self.get_observatory_queue(program_name=program_name)
+        if len(queue) == 0:
+            return []
+        if schedule_filter is not None:
+            queue = queue[schedule_filter(queue)]
+        return queue["too_schedule_name"].drop_duplicates().tolist()
+
+    def get_too_details_bulk(
+        self,
+        program_name: str,
+        too_schedule_names: list[str] | None = None,
+        schedule_filter: Callable[[pd.DataFrame], pd.Series] | None = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> pd.DataFrame:
+        """
+        Get the details of many queued TOO schedules concurrently.
+
+        If no schedule names are given, all schedules in the queue matching
+        schedule_filter are used.
+
+        :param program_name: Name of the program under which TOOs were submitted
+        :param too_schedule_names: Names of the TOO schedules
+        :param schedule_filter: Filter for the queue summary, if no names are given
+        :param max_workers: Maximum number of concurrent requests
+        :return: Combined details, with a 'too_schedule_name' column
+        """
+        program = self.get_program_details(program_name=program_name)
+        if too_schedule_names is None:
+            too_schedule_names = self.get_schedule_names(
+                program_name=program_name, schedule_filter=schedule_filter
+            )
+
+        def get_details(too_schedule_name):
+            _, details = self._get_too_details(
+                program=program, too_schedule_name=too_schedule_name
+            )
+            details["too_schedule_name"] = too_schedule_name
+            return details
+
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            all_details = list(executor.map(get_details, too_schedule_names))
+
+        if len(all_details) == 0:
+            return pd.DataFrame(columns=["too_schedule_name"])
+
+        return pd.concat(all_details, ignore_index=True)
+
+    def delete_too_requests(
+        self,
+        program_name: str,
+        too_schedule_names: list[str] | None = None,
+        schedule_filter: Callable[[pd.DataFrame], pd.Series] | None = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> pd.DataFrame:
+        """
+        Delete many queued TOO schedules concurrently.
+
+        If no schedule names are given, all schedules in the queue matching
+        schedule_filter are deleted.
+
+        :param program_name: Name of the program under which TOOs were submitted
+        :param too_schedule_names: Names of the TOO schedules
+        :param schedule_filter: Filter for the queue summary, if no names are given
+        :param max_workers: Maximum number of concurrent requests
+        :return: Table with 'too_schedule_name', 'deleted' and 'msg' columns
+        """
+        program = self.get_program_details(program_name=program_name)
+        if too_schedule_names is None:
+            too_schedule_names = self.get_schedule_names(
+                program_name=program_name, schedule_filter=schedule_filter
+            )
+
+        def delete(too_schedule_name):
+            try:
+                res = self._delete_too_request(
+                    program=program, too_schedule_name=too_schedule_name
+                )
+                return True, res.json().get("msg")
+            except (ValueError, requests.exceptions.RequestException) as exc:
+                return False, str(exc)
+
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(delete, too_schedule_names))
+
+        summary = pd.DataFrame(
+            {
+                "too_schedule_name": too_schedule_names,
+                "deleted": [x[0] for x in results],
+                "msg": [x[1] for x in results],
+            }
+        )
+        logger.info(
+            f"Deleted {summary['deleted'].sum()} of {len(summary)} TOO schedules"
+        )
+        return summary
+
     def query_images(
         self,
         query: (
             TargetImageQuery | RectangleImageQuery | ConeImageQuery | ProgramImageQuery
         ),
-    ) -> tuple[requests.Response, pd.DataFrame]:
+        limit: int | None = None,
+        offset: int | None = None,
+        memory_budget: int | None = None,
+    ) -> tuple[requests.Response, pd.DataFrame | SpilledResult]:
         """
         Function to get the observatory queue
 
         :param query: Query Request
+        :param limit: Maximum number of images to return
+        :param offset: Number of images to skip
+        :param memory_budget: Maximum size of the result to hold in memory, in
+            bytes, above which it is spilled to disk (see query_images_with_budget)
         :return: API response and TOO schedule
         """
 
+        if memory_budget is not None and limit is None and offset is None:
+            return self.query_images_with_budget(
+                query=query, memory_budget=memory_budget
+            )
+
+        if (
+            self.footprint_catalog is not None
+            and is_supported(query)
+            and limit is None
+            and offset is None
+        ):
+            return self._query_images_with_catalog(query=query)
+
+        return self._query_images_from_server(query=query, limit=limit, offset=offset)
+
+    def _query_images_from_server(
+        self,
+        query: (
+            TargetImageQuery | RectangleImageQuery | ConeImageQuery | ProgramImageQuery
+        ),
+        limit: int | None = None,
+        offset: int | None = None,
+    ) -> tuple[requests.Response, pd.DataFrame]:
+        """
+        Send an image query to the server
+
+        :param query: Query Request
+        :param limit: Maximum number of images to return
+        :param offset: Number of images to skip
+        :return: API response and image summary
+        """
         program = self.get_program_details(program_name=query.program_name)
 
-        res = self.get(
-            IMAGE_QUERY_URL,
+        page_kwargs = {}
+        if limit is not None:
+            page_kwargs["limit"] = limit
+        if offset is not None:
+            page_kwargs["offset"] = offset
+
+        return self.get_parsed(
+            IMAGE_QUERY_PATH,
+            get_body_table,
             program_name=query.program_name,
             program_api_key=program.prog_key,
             data=[query],
+            **page_kwargs,
         )
 
-        image_summary = pd.DataFrame(res.json()["body"])
+    def _query_images_with_catalog(
+        self, query: ConeImageQuery | RectangleImageQuery | ProgramImageQuery
+    ) -> tuple[requests.Response, pd.DataFrame]:
+        """
+        Answer an image query from the footprint catalog, only querying the
+        server for the date ranges which are not yet covered.
+
+        :param query: Query Request
+        :return: API response and image summary
+        """
+        for start_date, end_date in self.footprint_catalog.get_missing_dates(query):
+            sub_query = query.model_copy(
+                update={"start_date": start_date, "end_date": end_date}
+            )
+            _, images = self._query_images_from_server(query=sub_query)
+            self.footprint_catalog.add(sub_query, images)
+
+        image_summary = self.footprint_catalog.search(query)
+        res = build_response(
+            status_code=200,
+            content=json.dumps(
+                {
+                    "msg": "Images from local footprint catalog",
+                    "body": image_summary.to_dict(orient="records"),
+                },
+                default=str,
+            ).encode(),
+            headers={"Content-Type": "application/json"},
+            url=IMAGE_QUERY_PATH,
+        )
         return res, image_summary
 
+    def query_images_with_budget(
+        self,
+        query: (
+            TargetImageQuery | RectangleImageQuery | ConeImageQuery | ProgramImageQuery
+        ),
+        memory_budget: int,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        spill_dir: str | Path | None = None,
+    ) -> tuple[requests.Response, pd.DataFrame | SpilledResult]:
+        """
+        Query images page by page, keeping the result in memory only while it
+        fits in a memory budget.
+
+        Once the budget is exceeded, the result is spilled to disk in chunks,
+        and returned as a SpilledResult which loads one chunk at a time.
+        The response only contains a summary message, not the images.
+
+        :param query: Query Request
+        :param memory_budget: Maximum size of the result to hold in memory, in bytes
+        :param page_size: Number of images per page, and per spilled chunk
+        :param spill_dir: Directory to spill to, defaulting to a temporary one
+        :return: API response and image summary (in memory or spilled)
+        """
+        pages = []
+        in_memory = 0
+        spilled = None
+
+        for page in self.iter_query_images(query=query, page_size=page_size):
+            if spilled is None:
+                pages.append(page)
+                in_memory += get_memory_usage(page)
+                if in_memory <= memory_budget:
+                    continue
+                spilled = SpilledResult(directory=spill_dir)
+                logger.warning(
+                    f"Query result exceeds memory budget of {memory_budget} bytes, "
+                    f"spilling to {spilled.directory}"
+                )
+                to_spill, pages = pages, []
+            else:
+                to_spill = [page]
+
+            for chunk in to_spill:
+                for start in range(0, len(chunk), page_size):
+                    spilled.append(chunk.iloc[start : start + page_size])
+
+        if spilled is None:
+            image_summary = pd.concat(pages, ignore_index=True)
+        else:
+            image_summary = spilled
+
+        res = build_response(
+            status_code=200,
+            content=json.dumps(
+                {"msg": f"Found {len(image_summary)} images", "body": None}
+            ).encode(),
+            headers={"Content-Type": "application/json"},
+            url=IMAGE_QUERY_PATH,
+        )
+        return res, image_summary
+
+    def iter_query_images(
+        self,
+        query: (
+            TargetImageQuery | RectangleImageQuery | ConeImageQuery | ProgramImageQuery
+        ),
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Iterate over the results of an image query, one page at a time.
+
+        The first page is always yielded, even if empty. If the server does
+        not support paging and returns the full result, it is yielded as a
+        single page.
+
+        :param query: Query Request
+        :param page_size: Number of images per page
+        :return: Iterator of image summaries
+        """
+        offset = 0
+        previous = None
+        while True:
+            _, page = self.query_images(query=query, limit=page_size, offset=offset)
+
+            if len(page) > page_size:
+                logger.debug("Server returned all results in one page")
+                yield page
+                return
+
+            if previous is not None and len(page) > 0 and page.equals(previous):
+                logger.warning("Server ignored the query offset, stopping paging")
+                return
+
+            if offset == 0 or len(page) > 0:
+                yield page
+
+            if len(page) < page_size:
+                return
+
+            offset += page_size
+            previous = page
+
     @staticmethod
     def check_query_dates(
         start_date: str | None = None,
@@ -436,13 +1084,14 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
 
         return start_date, end_date
 
-    def query_images_by_program(
+    def query_images_by_program(  # pylint: disable=too-many-arguments
         self,
         program_name: str,
         start_date: str | None = None,
         end_date: str | None = None,
         image_type: WinterImageTypes = DEFAULT_IMAGE_TYPE,
-    ) -> tuple[requests.Response, pd.DataFrame]:
+        memory_budget: int | None = None,
+    ) -> tuple[requests.Response, pd.DataFrame | SpilledResult]:
         """
         Function to get the observatory queue
 
@@ -450,6 +1099,7 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         :param start_date: Start date for images
         :param end_date: End date for images
         :param image_type: Type of image to query
+        :param memory_budget: Maximum size of the result to hold in memory, in bytes
         :return: API response and TOO schedule
         """
 
@@ -469,7 +1119,7 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
             kind=image_type,
         )
 
-        return self.query_images(query=query)
+        return self.query_images(query=query, memory_budget=memory_budget)
 
     def query_images_by_target_name(  # pylint: disable=too-many-arguments
         self,
@@ -555,6 +1205,94 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
 
         return self.query_images(query=query)
 
+    def query_images_by_cones(
+        self,
+        queries: list[ConeImageQuery],
+        max_extent_deg: float = DEFAULT_MAX_EXTENT_DEG,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> list[pd.DataFrame]:
+        """
+        Run many cone queries, coalescing nearby cones with the same program,
+        dates and image type into a single enclosing rectangle query.
+
+        :param queries: Cone queries
+        :param max_extent_deg: Approximate maximum size of each rectangle on the sky
+        :param max_workers: Maximum number of concurrent requests
+        :return: Image summary for each cone query, in the same order
+        """
+        coalesced = coalesce_cones(queries, max_extent_deg=max_extent_deg)
+
+        def run(group):
+            query, indices = group
+            _, images = self.query_images(query=query)
+            if isinstance(query, ConeImageQuery):
+                return [images]
+            return split_by_cones(images, [queries[i] for i in indices])
+
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            group_results = list(executor.map(run, coalesced))
+
+        results = [None] * len(queries)
+        for (_, indices), images in zip(coalesced, group_results):
+            for i, cone_images in zip(indices, images):
+                results[i] = cone_images
+
+        logger.info(
+            f"Ran {len(queries)} cone queries with {len(coalesced)} server queries"
+        )
+        return results
+
+    def query_images_for_programs(
+        self,
+        query: (
+            TargetImageQuery | RectangleImageQuery | ConeImageQuery | ProgramImageQuery
+        ),
+        program_names: list[str] | None = None,
+        image_types: list[WinterImageTypes] | None = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> pd.DataFrame:
+        """
+        Run the same query for several programs and image types concurrently.
+
+        :param query: Query Request, used as a template for each program and type
+        :param program_names: Names of the programs to query, defaulting to all
+            local programs
+        :param image_types: Types of image to query, defaulting to that of the query
+        :param max_workers: Maximum number of concurrent requests
+        :return: Combined image summary, with program_name and query_image_type
+            columns giving the query each image was found by
+        """
+        if program_names is None:
+            program_names = self.get_programs()
+
+        if image_types is None:
+            image_types = [query.image_type]
+
+        pairs = list(itertools.product(program_names, image_types))
+
+        def run(pair):
+            program_name, image_type = pair
+            sub_query = query.model_copy(
+                update={"program_name": program_name, "image_type": image_type}
+            )
+            _, images = self.query_images(query=sub_query)
+            return images.assign(
+                program_name=program_name, query_image_type=str(image_type)
+            )
+
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(run, pairs))
+
+        if len(results) == 0:
+            return pd.DataFrame(columns=["program_name", "query_image_type"])
+
+        images = pd.concat(results, ignore_index=True)
+        logger.info(
+            f"Found {len(images)} images for {len(program_names)} programs "
+            f"and {len(image_types)} image types"
+        )
+        return images
+
     def query_images_by_rectangle(  # pylint: disable=too-many-arguments
         self,
         program_name: str,
@@ -604,12 +1342,13 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
 
         return self.query_images(query=query)
 
-    def download_image_list(
+    def download_image_list(  # pylint: disable=too-many-arguments
         self,
         program_name: str,
         paths: list[str] | str,
         image_type: WinterImageTypes,
         output_dir: str | None | Path = None,
+        transfer: Transfer | None = None,
     ) -> tuple[requests.Response, Path]:
         """
         Download images as a zip file.
@@ -618,6 +1357,7 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         :param image_type: Type of image to query
         :param output_dir: Directory to save the zip to
         :param paths: List of paths to download
+        :param transfer: Transfer settings (chunking, progress, stall detection)
         :return: API response
         """
 
@@ -627,8 +1367,9 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         program = self.get_program_details(program_name=program_name)
 
         res, output_path = self.get_stream(
-            DOWNLOAD_LIST_URL,
+            DOWNLOAD_LIST_PATH,
             output_dir=output_dir,
+            transfer=transfer,
             program_name=program_name,
             program_api_key=program.prog_key,
             data=[ImagePath(path=x) for x in paths],
@@ -636,3 +1377,221 @@ class WinterAPI(BaseAPI):  # pylint: disable=too-many-public-methods
         )
 
         return res, output_path
+
+    def download_images_to_store(  # pylint: disable=too-many-arguments,too-many-locals
+        self,
+        program_name: str,
+        paths: list[str] | str,
+        image_type: WinterImageTypes,
+        store: ImageStore | None = None,
+        transfer: Transfer | None = None,
+        batch_size: int | None = None,
+        verify: bool = False,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> list[Path | None]:
+        """
+        Download images into a local image store, skipping any already stored.
+
+        Missing images can be downloaded in batches, in which case each batch
+        is extracted and verified in the background while the next batch
+        downloads.
+
+        :param program_name: Name of the program under which to check ToOs
+        :param paths: List of paths to download
+        :param image_type: Type of image to query
+        :param store: Image store to use, defaulting to one in the home directory
+        :param transfer: Transfer settings (chunking, progress, stall detection)
+        :param batch_size: Number of images to download per request
+        :param verify: Whether to verify the FITS checksums of each image
+        :param max_workers: Number of threads to verify images with
+        :return: Local path for each requested path, or None if unavailable
+        """
+        if not isinstance(paths, list):
+            paths = [paths]
+
+        if store is None:
+            store = ImageStore()
+
+        missing = store.get_missing(paths, image_type=image_type)
+
+        logger.info(
+            f"{len(paths) - len(missing)} of {len(paths)} images already in store, "
+            f"downloading {len(missing)}"
+        )
+
+        with (
+            tempfile.TemporaryDirectory(dir=store.root) as temp_dir,
+            ThreadPoolExecutor(max_workers=1) as ingest_executor,
+            ThreadPoolExecutor(max_workers=max_workers) as verify_executor,
+        ):
+            futures = []
+            for i, batch in enumerate(get_batches(missing, batch_size)):
+                batch_dir = Path(temp_dir).joinpath(f"batch_{i}")
+                batch_dir.mkdir()
+                _, output_path = self.download_image_list(
+                    program_name=program_name,
+                    paths=batch,
+                    image_type=image_type,
+                    output_dir=batch_dir,
+                    transfer=transfer,
+                )
+                futures.append(
+                    ingest_executor.submit(
+                        store.ingest_zip,
+                        output_path,
+                        paths=batch,
+                        image_type=image_type,
+                        verify=verify,
+                        executor=verify_executor,
+                    )
+                )
+
+            for future in futures:
+                future.result()
+
+        local_paths = store.get_local_paths(paths, image_type=image_type)
+
+        n_unavailable = len([x for x in local_paths if x is None])
+        if n_unavailable > 0:
+            logger.warning(f"{n_unavailable} images could not be downloaded")
+
+        return local_paths
+
+    def download_images(  # pylint: disable=too-many-arguments
+        self,
+        program_name: str,
+        paths: list[str] | str,
+        image_type: WinterImageTypes,
+        output_dir: str | None | Path = None,
+        store: ImageStore | None = None,
+        transfer: Transfer | None = None,
+    ) -> DownloadResult:
+        """
+        Download images, returning a result with lazy access to each image.
+
+        Images downloaded into a store are named by their server path, and
+        images in a zip file by their path within the zip.
+
+        :param program_name: Name of the program under which to check ToOs
+        :param paths: List of paths to download
+        :param image_type: Type of image to query
+        :param output_dir: Directory to save the zip to, if not using a store
+        :param store: Image store to download into, instead of a zip file
+        :param transfer: Transfer settings (chunking, progress, stall detection)
+        :return: Download result
+        """
+        if store is not None:
+            local_paths = self.download_images_to_store(
+                program_name=program_name,
+                paths=paths,
+                image_type=image_type,
+                store=store,
+                transfer=transfer,
+            )
+            if not isinstance(paths, list):
+                paths = [paths]
+            return DownloadResult.from_paths(local_paths, names=paths)
+
+        _, output_path = self.download_image_list(
+            program_name=program_name,
+            paths=paths,
+            image_type=image_type,
+            output_dir=output_dir,
+            transfer=transfer,
+        )
+        return DownloadResult.from_zip(output_path)
+
+    def query_and_download_images(  # pylint: disable=too-many-arguments,too-many-locals
+        self,
+        queries: (
+            list[
+                TargetImageQuery
+                | RectangleImageQuery
+                | ConeImageQuery
+                | ProgramImageQuery
+            ]
+            | TargetImageQuery
+            | RectangleImageQuery
+            | ConeImageQuery
+            | ProgramImageQuery
+        ),
+        store: ImageStore | None = None,
+        image_filters: list[Callable[[pd.DataFrame], pd.Series]] | None = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        batch_size: int | None = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        transfer: Transfer | None = None,
+    ) -> pd.DataFrame:
+        """
+        Query images and download them into a local image store, overlapping
+        the two: each page of results is filtered and queued for download as
+        soon as it arrives, while the next page is queried.
+
+        :param queries: Query requests
+        :param store: Image store to use, defaulting to one in the home directory
+        :param image_filters: Functions returning a boolean mask of the images
+            in a page to download
+        :param page_size: Number of images per query page
+        :param batch_size: Number of images to download per request
+        :param max_workers: Number of concurrent downloads
+        :param transfer: Transfer settings (chunking, progress, stall detection),
+            copied for each download
+        :return: Image summary of the downloaded images, with program_name,
+            query_image_type and local_path columns
+        """
+        if not isinstance(queries, list):
+            queries = [queries]
+
+        if store is None:
+            store = ImageStore()
+
+        if image_filters is None:
+            image_filters = []
+
+        pages = []
+        local_paths = {}
+
+        with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            for query in queries:
+                key = (query.program_name, str(query.image_type))
+                for page in self.iter_query_images(query=query, page_size=page_size):
+                    if len(page) == 0:
+                        continue
+
+                    for image_filter in image_filters:
+                        page = page[image_filter(page)]
+
+                    is_new = [(*key, x) not in local_paths for x in page["savepath"]]
+                    page = page[is_new].drop_duplicates(subset="savepath")
+                    paths = page["savepath"].tolist()
+
+                    for batch in get_batches(paths, batch_size):
+                        future = executor.submit(
+                            self.download_images_to_store,
+                            program_name=query.program_name,
+                            paths=batch,
+                            image_type=query.image_type,
+                            store=store,
+                            transfer=transfer.copy() if transfer is not None else None,
+                        )
+                        for i, path in enumerate(batch):
+                            local_paths[(*key, path)] = (future, i)
+
+                    page = page.assign(program_name=key[0], query_image_type=key[1])
+                    pages.append(page)
+
+            if len(pages) == 0:
+                return pd.DataFrame(columns=["savepath", "local_path"])
+
+            images = pd.concat(pages, ignore_index=True)
+            columns = ["program_name", "query_image_type", "savepath"]
+            results = []
+            for row in images[columns].itertuples(index=False):
+                future, i = local_paths[tuple(row)]
+                results.append(future.result()[i])
+            images["local_path"] = results
+
+        logger.info(
+            f"Downloaded {images['local_path'].notna().sum()} of {len(images)} images"
+        )
+        return images
@@ -0,0 +1,99 @@
+"""
+Module for caching the observatory queue for a short time.
+
+The queue summary and schedule details of a program only change when a ToO
+is submitted or deleted. Repeated reads within a short time are served from
+memory, and writes made through the same client invalidate the cache of
+their program, so that reads are consistent with the client's own writes.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Hashable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_CACHE_TTL = 10.0
+
+
+class QueueCache:
+    """
+    Thread-safe cache of queue reads, per program, with a time to live.
+
+    Each program has a generation, incremented on every invalidation. A read
+    which started before an invalidation is not cached when it finishes,
+    since it may predate the write which caused the invalidation.
+
+    :param ttl: Time to live of each entry, in seconds
+    """
+
+    def __init__(self, ttl: float = DEFAULT_QUEUE_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._generations = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get_generation(self, program_name: str) -> int:
+        """
+        Get the current generation of a program, to pass to put.
+
+        :param program_name: Name of the program
+        :return: Generation
+        """
+        with self._lock:
+            return self._generations[program_name]
+
+    def get(self, program_name: str, key: Hashable) -> Any | None:
+        """
+        Get a cached value, if it has not expired.
+
+        :param program_name: Name of the program
+        :param key: Key of the read within the program
+        :return: Cached value, or None
+        """
+        with self._lock:
+            entry = self._entries.get((program_name, key))
+            if entry is None:
+                return None
+            expiry, value = entry
+            if time.monotonic() > expiry:
+                del self._entries[(program_name, key)]
+                return None
+        logger.debug(f"Using cached queue read {key} for {program_name}")
+        return value
+
+    def put(self, program_name: str, key: Hashable, value: Any, generation: int):
+        """
+        Cache a value, unless the program was invalidated since the read began.
+
+        :param program_name: Name of the program
+        :param key: Key of the read within the program
+        :param value: Value to cache
+        :param generation: Generation of the program when the read began
+        :return: None
+        """
+        with self._lock:
+            if self._generations[program_name] != generation:
+                return
+            self._entries[(program_name, key)] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, program_name: str | None = None):
+        """
+        Remove the cached reads of a program, or of all programs.
+
+        :param program_name: Name of the program, or None for all programs
+        :return: None
+        """
+        with self._lock:
+            programs = (
+                set(self._generations) | {x[0] for x in self._entries}
+                if program_name is None
+                else {program_name}
+            )
+            for program in programs:
+                self._generations[program] += 1
+            self._entries = {
+                k: v for k, v in self._entries.items() if k[0] not in programs
+            }
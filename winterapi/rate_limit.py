@@ -0,0 +1,274 @@
+"""
+Module for client-side rate limiting of requests to the API.
+
+Each endpoint has a token bucket, whose rate adapts to the server: it is
+halved whenever the server throttles a request (HTTP 429/503), and increased
+slowly after each success. The buckets can optionally be shared between
+processes, with their state kept in a locked file.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlparse
+
+from filelock import FileLock
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUS_CODES = [429, 503]
+
+DEFAULT_RATE = 10.0
+DEFAULT_MIN_RATE = 0.1
+RATE_INCREASE = 0.1
+RATE_DECREASE = 0.5
+LOCK_TIMEOUT = 60.0
+
+
+def get_endpoint(url: str) -> str:
+    """
+    Get the endpoint path of a URL, used to select its rate limit.
+
+    :param url: URL or endpoint path
+    :return: Endpoint path
+    """
+    return urlparse(url).path
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse a Retry-After header given in seconds.
+
+    :param value: Header value
+    :return: Delay in seconds, or None
+    """
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+class TokenBucket:  # pylint: disable=too-many-instance-attributes
+    """
+    Token bucket with an adaptive rate (additive increase, multiplicative decrease)
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        rate: float,
+        burst: float | None = None,
+        min_rate: float = DEFAULT_MIN_RATE,
+        max_rate: float | None = None,
+    ):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.tokens = self.burst
+        self.last = time.time()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        """
+        Context manager giving exclusive access to the bucket state.
+
+        :return: None
+        """
+        with self._lock:
+            yield
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        """
+        Wait until a request is allowed, and take a token for it.
+
+        :param timeout: Maximum time to wait, in seconds, or None to wait
+            for as long as needed, including any Retry-After delay
+        :return: boolean whether a token was taken before the timeout
+        """
+        end = None if timeout is None else time.time() + timeout
+        while True:
+            with self._state():
+                now = time.time()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return True
+                wait = max(
+                    self.blocked_until - now, (1.0 - self.tokens) / self.rate, 0.0
+                )
+            if end is not None:
+                if now >= end:
+                    return False
+                wait = min(wait, end - now)
+            time.sleep(wait)
+
+    def on_success(self):
+        """
+        Increase the rate after a successful request.
+
+        :return: None
+        """
+        with self._state():
+            self.rate = min(self.rate + RATE_INCREASE, self.max_rate)
+
+    def on_throttle(self, retry_after: float | None = None):
+        """
+        Decrease the rate after the server throttled a request.
+
+        :param retry_after: Delay requested by the server, in seconds
+        :return: None
+        """
+        with self._state():
+            self.rate = max(self.rate * RATE_DECREASE, self.min_rate)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, time.time() + retry_after)
+        logger.warning(
+            f"Request throttled by server, reducing rate to {self.rate:.2f} requests/s"
+        )
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket whose state is shared between processes through a file.
+
+    The file is only rewritten when the state changes, and is replaced
+    atomically rather than synced to disk, since losing the latest state in a
+    crash only costs a little accuracy.
+    """
+
+    def __init__(self, state_path: str | Path, key: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.state_path = Path(state_path)
+        self.key = key
+        self._file_lock = FileLock(
+            self.state_path.with_suffix(self.state_path.suffix + ".lock"),
+            timeout=LOCK_TIMEOUT,
+        )
+
+    @contextmanager
+    def _state(self):
+        with self._lock, self._file_lock:
+            state = {}
+            if self.state_path.exists():
+                with open(self.state_path, "r", encoding="utf-8") as in_f:
+                    state = json.load(in_f)
+
+            if self.key in state:
+                for attr, value in state[self.key].items():
+                    setattr(self, attr, value)
+
+            yield
+
+            entry = {
+                "rate": self.rate,
+                "tokens": self.tokens,
+                "last": self.last,
+                "blocked_until": self.blocked_until,
+            }
+            if state.get(self.key) == entry:
+                return
+            state[self.key] = entry
+
+            # Written atomically, so other processes never read a partial file
+            fd, temp_path = tempfile.mkstemp(
+                dir=self.state_path.parent,
+                prefix=self.state_path.name,
+                suffix=".tmp",
+            )
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as out_f:
+                    json.dump(state, out_f)
+                os.replace(temp_path, self.state_path)
+            except BaseException:
+                Path(temp_path).unlink(missing_ok=True)
+                raise
+
+
+class RateLimiter:
+    """
+    Rate limiter with a separate, adaptive budget for each endpoint.
+
+    :param rate: Initial rate (requests/s) for endpoints without their own budget
+    :param endpoint_rates: Initial rates for specific endpoint paths
+    :param max_rate_factor: Factor by which the rate may grow above its initial value
+    :param min_rate: Minimum rate, however often the server throttles requests
+    :param state_path: File to share the limiter state between processes
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        rate: float = DEFAULT_RATE,
+        endpoint_rates: dict[str, float] | None = None,
+        max_rate_factor: float = 2.0,
+        min_rate: float = DEFAULT_MIN_RATE,
+        state_path: str | Path | None = None,
+    ):
+        self.rate = rate
+        self.endpoint_rates = endpoint_rates if endpoint_rates is not None else {}
+        self.max_rate_factor = max_rate_factor
+        self.min_rate = min_rate
+        self.state_path = None if state_path is None else Path(state_path)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get_bucket(self, url: str) -> TokenBucket:
+        """
+        Get the token bucket for an endpoint.
+
+        :param url: URL or endpoint path
+        :return: Token bucket
+        """
+        endpoint = get_endpoint(url)
+        with self._lock:
+            if endpoint not in self._buckets:
+                rate = self.endpoint_rates.get(endpoint, self.rate)
+                kwargs = {
+                    "rate": rate,
+                    "min_rate": min(self.min_rate, rate),
+                    "max_rate": rate * self.max_rate_factor,
+                }
+                if self.state_path is None:
+                    bucket = TokenBucket(**kwargs)
+                else:
+                    bucket = SharedTokenBucket(self.state_path, endpoint, **kwargs)
+                self._buckets[endpoint] = bucket
+            return self._buckets[endpoint]
+
+    def acquire(self, url: str, timeout: float | None = None) -> bool:
+        """
+        Wait until a request to an endpoint is allowed.
+
+        :param url: URL or endpoint path
+        :param timeout: Maximum time to wait, in seconds, or None for no limit
+        :return: boolean whether the request is allowed before the timeout
+        """
+        return self.get_bucket(url).acquire(timeout=timeout)
+
+    def update(self, url: str, status_code: int, retry_after: str | None = None):
+        """
+        Update the rate of an endpoint after a response.
+
+        :param url: URL or endpoint path
+        :param status_code: HTTP status code of the response
+        :param retry_after: Retry-After header of the response
+        :return: None
+        """
+        bucket = self.get_bucket(url)
+        if status_code in THROTTLE_STATUS_CODES:
+            bucket.on_throttle(retry_after=parse_retry_after(retry_after))
+        elif status_code < 400:
+            bucket.on_success()
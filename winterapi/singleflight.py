@@ -0,0 +1,121 @@
+"""
+Module for de-duplicating identical requests which are in flight at once.
+
+If several threads make the same call concurrently, only the first actually
+runs it, and the others wait for and share its result (or its error). The
+result can include the parsed response, so that it is also only parsed once.
+Waiting callers give up when their own deadline passes.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Callable
+
+from winterapi.timeouts import DeadlineExceededError, get_remaining_time
+
+logger = logging.getLogger(__name__)
+
+
+def get_flight_key(  # pylint: disable=too-many-arguments
+    method: str,
+    url: str,
+    params=None,
+    data=None,
+    auth=None,
+    deadline=None,
+    parser: str | None = None,
+) -> str:
+    """
+    Get a key identifying a request, including its authentication and deadline.
+
+    Calls with different deadlines are kept apart, so that a call cut short by
+    its deadline does not fail callers with a later deadline, or none.
+
+    :param method: HTTP method
+    :param url: URL or endpoint path
+    :param params: Request parameters
+    :param data: Serialised request body
+    :param auth: Authentication details
+    :param deadline: Deadline of the caller, if any
+    :param parser: Name of the function parsing the response, if any
+    :return: Key
+    """
+    canonical = json.dumps(
+        [method.upper(), url, params, data, auth, deadline, parser],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class _Flight:  # pylint: disable=too-few-public-methods
+    """
+    A call which is in flight
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.n_waiting = 0
+
+
+class SingleFlight:  # pylint: disable=too-few-public-methods
+    """
+    Class to share the result of a call between concurrent identical calls
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(
+        self,
+        key: str,
+        func: Callable[[], Any],
+        copy: Callable[[Any], Any] | None = None,
+    ) -> Any:
+        """
+        Run a call, or wait for an identical call already in flight.
+
+        :param key: Key identifying the call
+        :param func: Function to run the call
+        :param copy: Function to copy the result for each waiting caller, so
+            that callers can modify their own result
+        :return: Result of the call
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight()
+                self._flights[key] = flight
+            else:
+                flight.n_waiting += 1
+
+        if not is_leader:
+            while not flight.done.wait(timeout=get_remaining_time()):
+                remaining = get_remaining_time()
+                if remaining is not None and remaining <= 0.0:
+                    err = "Deadline exceeded waiting for a shared call"
+                    logger.error(err)
+                    raise DeadlineExceededError(err)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result if copy is None else copy(flight.result)
+
+        try:
+            flight.result = func()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            if flight.n_waiting > 0:
+                logger.debug(f"Shared one call between {flight.n_waiting + 1} callers")
+            flight.done.set()
+
+        return flight.result
@@ -0,0 +1,51 @@
+"""
+Module with vectorised functions for positions on the sky
+"""
+
+import numpy as np
+
+
+def angular_separation(
+    ra_1: np.ndarray | float,
+    dec_1: np.ndarray | float,
+    ra_2: np.ndarray | float,
+    dec_2: np.ndarray | float,
+) -> np.ndarray | float:
+    """
+    Get the angular separation between positions, using the Vincenty formula,
+    which is accurate at all separations.
+
+    :param ra_1: Right ascension of the first positions (degrees)
+    :param dec_1: Declination of the first positions (degrees)
+    :param ra_2: Right ascension of the second positions (degrees)
+    :param dec_2: Declination of the second positions (degrees)
+    :return: Separation (degrees)
+    """
+    d_ra = np.radians(np.asarray(ra_2) - np.asarray(ra_1))
+    dec_1 = np.radians(dec_1)
+    dec_2 = np.radians(dec_2)
+
+    sin_d_ra, cos_d_ra = np.sin(d_ra), np.cos(d_ra)
+    sin_dec_1, cos_dec_1 = np.sin(dec_1), np.cos(dec_1)
+    sin_dec_2, cos_dec_2 = np.sin(dec_2), np.cos(dec_2)
+
+    num_1 = cos_dec_2 * sin_d_ra
+    num_2 = cos_dec_1 * sin_dec_2 - sin_dec_1 * cos_dec_2 * cos_d_ra
+    denominator = sin_dec_1 * sin_dec_2 + cos_dec_1 * cos_dec_2 * cos_d_ra
+
+    return np.degrees(np.arctan2(np.hypot(num_1, num_2), denominator))
+
+
+def get_cone_ra_half_width(dec: float, radius: float) -> float | None:
+    """
+    Get the half-width in RA of a cone.
+
+    :param dec: Declination of the cone centre (degrees)
+    :param radius: Radius of the cone (degrees)
+    :return: Half-width in RA (degrees), or None if the cone contains a pole
+    """
+    if abs(dec) + radius >= 90.0:
+        return None
+    return float(
+        np.degrees(np.arcsin(np.sin(np.radians(radius)) / np.cos(np.radians(dec))))
+    )
@@ -0,0 +1,154 @@
+"""
+Module for query results which are too large to hold in memory.
+
+Results are spilled to disk in chunks, as parquet files if pyarrow is
+installed and as pickles otherwise, and are only loaded one chunk at a time.
+"""
+
+import importlib.util
+import logging
+import tempfile
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PARQUET_FORMAT = "parquet"
+PICKLE_FORMAT = "pkl"
+
+
+def get_memory_usage(df: pd.DataFrame) -> int:
+    """
+    Get the memory used by a dataframe, including object columns.
+
+    :param df: Dataframe
+    :return: Size in bytes
+    """
+    return int(df.memory_usage(deep=True).sum())
+
+
+def get_default_format() -> str:
+    """
+    Get the format to spill chunks in, depending on the installed packages.
+
+    :return: File suffix of the format
+    """
+    if importlib.util.find_spec("pyarrow") is not None:
+        return PARQUET_FORMAT
+    return PICKLE_FORMAT
+
+
+class SpilledResult:
+    """
+    Class for a query result spilled to disk, and loaded lazily in chunks.
+
+    :param directory: Directory to save chunks in, defaulting to a temporary
+        directory which is removed on cleanup
+    :param chunk_format: Format of the chunks, 'parquet' or 'pkl'
+    """
+
+    def __init__(
+        self, directory: str | Path | None = None, chunk_format: str | None = None
+    ):
+        self._temp_dir = None
+        if directory is None:
+            # Removed on cleanup, not on leaving a with block
+            # pylint: disable-next=consider-using-with
+            self._temp_dir = tempfile.TemporaryDirectory(prefix="winterapi_spill_")
+            directory = self._temp_dir.name
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.chunk_format = (
+            chunk_format if chunk_format is not None else get_default_format()
+        )
+        self.paths = []
+        self.n_rows = 0
+        self.columns = None
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        return self.iter_chunks()
+
+    def append(self, chunk: pd.DataFrame):
+        """
+        Write a chunk of the result to disk.
+
+        :param chunk: Chunk of the result
+        :return: None
+        """
+        if len(chunk) == 0:
+            return
+
+        path = self.directory.joinpath(
+            f"chunk_{len(self.paths):06d}.{self.chunk_format}"
+        )
+        chunk = chunk.reset_index(drop=True)
+        if self.chunk_format == PARQUET_FORMAT:
+            chunk.to_parquet(path, index=False)
+        else:
+            chunk.to_pickle(path)
+
+        self.paths.append(path)
+        self.n_rows += len(chunk)
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+
+    def read_chunk(self, i: int, columns: list[str] | None = None) -> pd.DataFrame:
+        """
+        Read a single chunk of the result.
+
+        :param i: Index of the chunk
+        :param columns: Columns to read, or None for all
+        :return: Chunk of the result
+        """
+        path = self.paths[i]
+        if self.chunk_format == PARQUET_FORMAT:
+            return pd.read_parquet(path, columns=columns)
+        chunk = pd.read_pickle(path)
+        return chunk if columns is None else chunk[columns]
+
+    def iter_chunks(self, columns: list[str] | None = None) -> Iterator[pd.DataFrame]:
+        """
+        Iterate over the chunks of the result, loading one at a time.
+
+        :param columns: Columns to read, or None for all
+        :return: Iterator of chunks
+        """
+        for i in range(len(self.paths)):
+            yield self.read_chunk(i, columns=columns)
+
+    def to_pandas(self, columns: list[str] | None = None) -> pd.DataFrame:
+        """
+        Load the full result into memory.
+
+        :param columns: Columns to read, or None for all
+        :return: Dataframe
+        """
+        chunks = list(self.iter_chunks(columns=columns))
+        if len(chunks) == 0:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(chunks, ignore_index=True)
+
+    def cleanup(self):
+        """
+        Delete the chunks from disk.
+
+        :return: None
+        """
+        for path in self.paths:
+            path.unlink(missing_ok=True)
+        self.paths = []
+        self.n_rows = 0
+        if self._temp_dir is not None:
+            self._temp_dir.cleanup()
+            self._temp_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cleanup()
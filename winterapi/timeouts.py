@@ -0,0 +1,192 @@
+"""
+Module for request timeouts and deadlines.
+
+Timeouts can adapt to each endpoint, based on a percentile of its recently
+observed latencies. A caller can also set an overall deadline, with the
+deadline context manager, which is shared by every request and retry made
+within it, including those made from worker threads started inside it.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator
+
+import numpy as np
+import requests
+
+from winterapi.rate_limit import get_endpoint
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_TIMEOUT = 2.0
+DEFAULT_MAX_TIMEOUT = 120.0
+DEFAULT_PERCENTILE = 99.0
+DEFAULT_TIMEOUT_FACTOR = 3.0
+MIN_SAMPLES = 10
+LATENCY_WINDOW = 200
+
+_deadline = contextvars.ContextVar("winterapi_deadline", default=None)
+
+
+class DeadlineExceededError(requests.exceptions.Timeout):
+    """Error raised when a request cannot be made before the caller's deadline"""
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """
+    Context manager setting an overall deadline for all requests within it.
+
+    Nested deadlines can only shorten, never extend, an outer deadline.
+
+    :param seconds: Time allowed, in seconds
+    :return: None
+    """
+    end = time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None:
+        end = min(end, outer)
+    token = _deadline.set(end)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def get_deadline() -> float | None:
+    """
+    Get the current deadline.
+
+    :return: Deadline, as a time.monotonic value, or None if there is no deadline
+    """
+    return _deadline.get()
+
+
+def get_remaining_time() -> float | None:
+    """
+    Get the time remaining before the current deadline.
+
+    :return: Time remaining in seconds, or None if there is no deadline
+    """
+    end = _deadline.get()
+    if end is None:
+        return None
+    return end - time.monotonic()
+
+
+def check_deadline(url: str) -> float | None:
+    """
+    Check that the current deadline has not passed.
+
+    :param url: URL or endpoint path of the request, for the error message
+    :return: Time remaining in seconds, or None if there is no deadline
+    """
+    remaining = get_remaining_time()
+    if remaining is not None and remaining <= 0.0:
+        err = f"Deadline exceeded before request to {url}"
+        logger.error(err)
+        raise DeadlineExceededError(err)
+    return remaining
+
+
+def get_max_time(max_time: float) -> float:
+    """
+    Get the maximum time to spend retrying a request, within the deadline.
+
+    Intended as a callable max_time for backoff, evaluated on each call.
+
+    :param max_time: Maximum time without a deadline
+    :return: Maximum time in seconds
+    """
+    remaining = get_remaining_time()
+    if remaining is None:
+        return max_time
+    return max(min(max_time, remaining), 0.0)
+
+
+def is_deadline_exceeded(exc: Exception) -> bool:
+    """
+    Check whether an error was caused by the deadline, so should not be retried.
+
+    :param exc: Error
+    :return: boolean
+    """
+    return isinstance(exc, DeadlineExceededError)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    Thread pool which runs each task in a copy of the caller's context,
+    so that tasks share the caller's deadline
+    """
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
+
+
+class AdaptiveTimeouts:
+    """
+    Per-endpoint timeouts, derived from a percentile of observed latencies.
+
+    Until an endpoint has enough samples, the default timeout of the request
+    is used. Requests which time out are counted as taking the full timeout,
+    so that the timeout of a slow endpoint grows towards the ceiling.
+
+    :param min_timeout: Floor for any timeout, in seconds
+    :param max_timeout: Ceiling for any timeout, in seconds
+    :param percentile: Percentile of latency to base the timeout on
+    :param factor: Factor by which the timeout exceeds the percentile
+    :param min_samples: Number of samples needed before adapting
+    :param window: Number of recent samples kept per endpoint
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        min_timeout: float = DEFAULT_MIN_TIMEOUT,
+        max_timeout: float = DEFAULT_MAX_TIMEOUT,
+        percentile: float = DEFAULT_PERCENTILE,
+        factor: float = DEFAULT_TIMEOUT_FACTOR,
+        min_samples: int = MIN_SAMPLES,
+        window: int = LATENCY_WINDOW,
+    ):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.percentile = percentile
+        self.factor = factor
+        self.min_samples = min_samples
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, url: str, latency: float):
+        """
+        Record the latency of a request.
+
+        :param url: URL or endpoint path
+        :param latency: Latency in seconds
+        :return: None
+        """
+        with self._lock:
+            self._latencies[get_endpoint(url)].append(latency)
+
+    def get_timeout(self, url: str, default: float) -> float:
+        """
+        Get the timeout for a request to an endpoint.
+
+        :param url: URL or endpoint path
+        :param default: Timeout to use before enough latencies are observed
+        :return: Timeout in seconds
+        """
+        with self._lock:
+            latencies = list(self._latencies.get(get_endpoint(url), []))
+
+        if len(latencies) < self.min_samples:
+            return default
+
+        timeout = self.factor * float(np.percentile(latencies, self.percentile))
+        return min(max(timeout, self.min_timeout), self.max_timeout)
@@ -0,0 +1,370 @@
+"""
+Module for ToO requests given as a table, with one request per row.
+
+Tables are validated column by column, with the same defaults and checks as
+the wintertoo ToO models, and serialised straight to the request payload, so
+large survey plans never need one model instance per row.
+"""
+
+import json
+import logging
+from typing import get_args
+
+import numpy as np
+import pandas as pd
+from astropy.time import Time
+from wintertoo.data import (
+    MAX_TARGNAME_LEN,
+    SUMMER_FILTERS,
+    WINTER_SCIENCE_FILTERS,
+    SummerFilters,
+    WinterFilters,
+    get_default_value,
+)
+from wintertoo.errors import WinterValidationError
+from wintertoo.models import Program
+from wintertoo.models.too import MAX_EXPOSURE_TIME, MIN_EXPOSURE_TIME
+from wintertoo.validate import validate_schedule_df
+
+from winterapi.fields import FieldGridIndex
+
+logger = logging.getLogger(__name__)
+
+CAMERAS = ["winter", "summer"]
+
+COLUMN_ALIASES = {"t_exp": "total_exposure_time", "n_exp": "n_repetitions"}
+
+BASE_COLUMNS = [
+    "filters",
+    "target_priority",
+    "target_name",
+    "total_exposure_time",
+    "n_dither",
+    "n_repetitions",
+    "dither_distance",
+    "start_time_mjd",
+    "end_time_mjd",
+    "max_airmass",
+    "use_best_detector",
+    "camera",
+]
+RADEC_COLUMNS = ["ra_deg", "dec_deg", "use_field_grid"]
+FIELD_COLUMNS = ["field_id"]
+
+INT_COLUMNS = ["n_dither", "n_repetitions"]
+BOOL_COLUMNS = ["use_best_detector", "use_field_grid"]
+FLOAT_COLUMNS = [
+    "target_priority",
+    "total_exposure_time",
+    "dither_distance",
+    "start_time_mjd",
+    "end_time_mjd",
+    "max_airmass",
+    "ra_deg",
+    "dec_deg",
+]
+
+
+def get_defaults(camera: str) -> dict:
+    """
+    Get the default value of each column, as in the wintertoo ToO models.
+
+    :param camera: Camera, either 'winter' or 'summer'
+    :return: Dictionary of column to default value
+    """
+    return {
+        "target_priority": 50.0,
+        "total_exposure_time": get_default_value("visitExpTime"),
+        "n_dither": get_default_value("ditherNumber"),
+        "n_repetitions": 1,
+        "dither_distance": get_default_value("ditherStepSize"),
+        "max_airmass": get_default_value("maxAirmass"),
+        "use_best_detector": get_default_value("bestDetector"),
+        "use_field_grid": False,
+        "camera": camera,
+    }
+
+
+def check_rows(mask: pd.Series | np.ndarray, message: str):
+    """
+    Raise an error if any row of a table fails a check.
+
+    :param mask: Boolean mask of the rows failing the check
+    :param message: Description of the check
+    :return: None
+    """
+    mask = np.asarray(mask, dtype=bool)
+    if np.any(mask):
+        rows = np.nonzero(mask)[0]
+        err = f"{message} (rows {rows[:10].tolist()}, {len(rows)} in total)"
+        logger.error(err)
+        raise WinterValidationError(err)
+
+
+def parse_filters(filters: pd.Series, camera: str) -> pd.Series:
+    """
+    Parse and validate the filters column of a table.
+
+    Filters can be given as lists, or as comma-separated strings.
+
+    :param filters: Filters column
+    :param camera: Camera, either 'winter' or 'summer'
+    :return: Filters column, as lists
+    """
+    if camera == "summer":
+        default, allowed = SUMMER_FILTERS, get_args(SummerFilters)
+    else:
+        default, allowed = WINTER_SCIENCE_FILTERS, get_args(WinterFilters)
+
+    filters = filters.map(
+        lambda x: (
+            [y.strip() for y in x.split(",")]
+            if isinstance(x, str)
+            else (list(default) if not isinstance(x, (list, np.ndarray)) else list(x))
+        )
+    )
+
+    check_rows(filters.map(len) == 0, "At least one filter is required")
+    exploded = filters.explode()
+    invalid = ~exploded.isin(allowed)
+    check_rows(
+        invalid.groupby(level=0).any().reindex(filters.index, fill_value=False),
+        f"Filters must be in {allowed}",
+    )
+    return filters
+
+
+def check_too_values(df: pd.DataFrame, now: float):
+    """
+    Check the values of a table of ToO requests, after defaults are filled in.
+
+    :param df: Table of ToO requests
+    :param now: Current time (MJD)
+    :return: None
+    """
+    is_field = df["field_id"].notna().to_numpy()
+    is_radec = ~is_field
+
+    check_rows(df["target_priority"] < 0.0, "target_priority must be >= 0")
+    check_rows(df["total_exposure_time"] < 1.0, "total_exposure_time must be >= 1")
+    check_rows(df["n_dither"] < 1, "n_dither must be >= 1")
+    check_rows(df["n_repetitions"] < 1, "n_repetitions must be >= 1")
+    check_rows(df["dither_distance"] < 0.0, "dither_distance must be >= 0")
+    check_rows(
+        (df["max_airmass"] < 1.0) | (df["max_airmass"] > 5.0),
+        "max_airmass must be between 1 and 5",
+    )
+    check_rows(is_field & (df["field_id"] < 1).to_numpy(), "field_id must be >= 1")
+    check_rows(
+        is_radec & ((df["ra_deg"] < 0.0) | (df["ra_deg"] > 360.0)).to_numpy(),
+        "ra_deg must be between 0 and 360",
+    )
+    check_rows(
+        is_radec & ((df["dec_deg"] < -90.0) | (df["dec_deg"] > 90.0)).to_numpy(),
+        "dec_deg must be between -90 and 90",
+    )
+    check_rows(
+        is_radec & (df["use_best_detector"] & df["use_field_grid"]).to_numpy(),
+        "Cannot use both use_best_detector and use_field_grid",
+    )
+
+    check_rows(
+        df["start_time_mjd"] >= df["end_time_mjd"],
+        "end_time_mjd must be greater than start_time_mjd",
+    )
+    check_rows(df["end_time_mjd"] < now, f"end_time_mjd is in the past (now is {now})")
+
+    t_per_dither = df["total_exposure_time"] / df["n_dither"]
+    check_rows(
+        t_per_dither > MAX_EXPOSURE_TIME,
+        f"Max exposure time per dither is {MAX_EXPOSURE_TIME} s",
+    )
+    check_rows(
+        t_per_dither < MIN_EXPOSURE_TIME,
+        f"Min exposure time per dither is {MIN_EXPOSURE_TIME} s",
+    )
+
+
+def get_too_table(  # pylint: disable=too-many-locals
+    table: pd.DataFrame | np.ndarray, camera: str = "winter"
+) -> pd.DataFrame:
+    """
+    Validate a table of ToO requests, and fill in default values.
+
+    Rows with a field_id are field requests, and the others are Ra/Dec
+    requests. The checks are those of the wintertoo ToO models.
+
+    :param table: Table of ToO requests, as a dataframe or record array
+    :param camera: Camera, either 'winter' or 'summer'
+    :return: Validated table, with every column filled
+    """
+    if camera not in CAMERAS:
+        err = f"Unrecognised camera {camera}, must be one of {CAMERAS}"
+        logger.error(err)
+        raise ValueError(err)
+
+    if isinstance(table, np.ndarray):
+        table = pd.DataFrame.from_records(table)
+
+    df = table.rename(columns=COLUMN_ALIASES).reset_index(drop=True)
+
+    unknown = set(df.columns) - set(BASE_COLUMNS + RADEC_COLUMNS + FIELD_COLUMNS)
+    if len(unknown) > 0:
+        err = f"Unrecognised columns {sorted(unknown)}"
+        logger.error(err)
+        raise WinterValidationError(err)
+
+    duplicated = df.columns[df.columns.duplicated()]
+    if len(duplicated) > 0:
+        err = f"Duplicated columns {sorted(set(duplicated))}, including aliases"
+        logger.error(err)
+        raise WinterValidationError(err)
+
+    if "target_name" not in df.columns:
+        err = "Column target_name is required"
+        logger.error(err)
+        raise WinterValidationError(err)
+
+    for column in BASE_COLUMNS + RADEC_COLUMNS + FIELD_COLUMNS:
+        if column not in df.columns:
+            df[column] = None if column == "filters" else np.nan
+
+    for column, default in get_defaults(camera).items():
+        df[column] = df[column].where(df[column].notna(), default)
+
+    now = Time.now().mjd
+    df["start_time_mjd"] = df["start_time_mjd"].where(df["start_time_mjd"].notna(), now)
+    df["end_time_mjd"] = df["end_time_mjd"].where(df["end_time_mjd"].notna(), now + 7.0)
+
+    check_rows(df["camera"] != camera, f"Camera must be '{camera}'")
+    df["filters"] = parse_filters(df["filters"], camera=camera)
+
+    is_field = df["field_id"].notna().to_numpy()
+    is_radec = ~is_field
+    check_rows(
+        is_radec & (df["ra_deg"].isna() | df["dec_deg"].isna()).to_numpy(),
+        "Either field_id, or both ra_deg and dec_deg, are required",
+    )
+
+    for column in FLOAT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype(float)
+    for column in INT_COLUMNS:
+        values = pd.to_numeric(df[column], errors="coerce")
+        check_rows(values.isna() | (values % 1 != 0), f"{column} must be an integer")
+        df[column] = values.astype(int)
+    for column in BOOL_COLUMNS:
+        df[column] = df[column].astype(bool)
+    field_ids = pd.to_numeric(df["field_id"], errors="coerce")
+    check_rows(
+        is_field & (field_ids % 1 != 0).to_numpy(), "field_id must be an integer"
+    )
+    df["field_id"] = field_ids.astype("Int64")
+
+    names = df["target_name"].astype(str)
+    check_rows(
+        df["target_name"].isna() | (names.str.len() < 1),
+        "target_name must not be empty",
+    )
+    check_rows(
+        names.str.len() > MAX_TARGNAME_LEN,
+        f"target_name must have at most {MAX_TARGNAME_LEN} characters",
+    )
+    df["target_name"] = names
+
+    check_too_values(df, now=now)
+
+    return df
+
+
+def get_too_payload(df: pd.DataFrame) -> str:
+    """
+    Serialise a validated table of ToO requests to the request payload,
+    as the ToO models would be serialised.
+
+    :param df: Validated table of ToO requests
+    :return: JSON payload
+    """
+    is_field = df["field_id"].notna().to_numpy()
+    records = [None] * len(df)
+
+    for mask, columns in [
+        (is_field, FIELD_COLUMNS + BASE_COLUMNS),
+        (~is_field, RADEC_COLUMNS + BASE_COLUMNS),
+    ]:
+        subset = df.loc[mask, columns]
+        if "field_id" in columns:
+            subset = subset.astype({"field_id": int})
+        for i, record in zip(np.nonzero(mask)[0], subset.to_dict(orient="records")):
+            records[i] = record
+
+    return json.dumps(records)
+
+
+def build_schedule_table(df: pd.DataFrame, program: Program) -> pd.DataFrame:
+    """
+    Build a schedule from a validated table of ToO requests, equivalent to
+    winterapi.fields.build_schedule for the same requests as models.
+
+    :param df: Validated table of ToO requests
+    :param program: Program details
+    :return: Schedule dataframe
+    """
+    summer = bool((df["camera"] == "summer").all()) if len(df) > 0 else False
+
+    ra_deg = df["ra_deg"].to_numpy(dtype=float, copy=True)
+    dec_deg = df["dec_deg"].to_numpy(dtype=float, copy=True)
+    field_id = np.full(len(df), get_default_value("fieldID"), dtype=np.int64)
+
+    is_field = df["field_id"].notna().to_numpy()
+    is_grid = ~is_field & df["use_field_grid"].to_numpy(dtype=bool)
+
+    if np.any(is_field) or np.any(is_grid):
+        index = FieldGridIndex.get_index(summer=summer)
+
+        if np.any(is_field):
+            fields = index.get_fields_by_id(df.loc[is_field, "field_id"].astype(int))
+            ra_deg[is_field] = fields["RA"].to_numpy(dtype=float)
+            dec_deg[is_field] = fields["Dec"].to_numpy(dtype=float)
+            field_id[is_field] = df.loc[is_field, "field_id"].astype(int)
+
+        if np.any(is_grid):
+            fields = index.get_best_fields(ra_deg[is_grid], dec_deg[is_grid])
+            ra_deg[is_grid] = fields["RA"].to_numpy(dtype=float)
+            dec_deg[is_grid] = fields["Dec"].to_numpy(dtype=float)
+            field_id[is_grid] = fields["ID"].to_numpy(dtype=np.int64)
+
+    entries = pd.DataFrame(
+        {
+            "targName": df["target_name"],
+            "raDeg": ra_deg,
+            "decDeg": dec_deg,
+            "fieldID": field_id,
+            "filter": df["filters"],
+            "visitExpTime": df["total_exposure_time"],
+            "singleExpTime": df["total_exposure_time"] / df["n_dither"],
+            "priority": df["target_priority"],
+            "progPI": program.pi_name,
+            "progName": program.progname,
+            "progID": program.progid,
+            "validStart": df["start_time_mjd"],
+            "validStop": df["end_time_mjd"],
+            "observed": False,
+            "maxAirmass": df["max_airmass"],
+            "ditherNumber": df["n_dither"],
+            "ditherStepSize": df["dither_distance"],
+            "bestDetector": df["use_best_detector"],
+            "camera": df["camera"],
+        }
+    )
+
+    # One entry per filter, each repeated n_repetitions times, as in make_schedule
+    entries = entries.explode("filter")
+    repeats = df["n_repetitions"].to_numpy()[entries.index.to_numpy()]
+    positions = np.repeat(np.arange(len(entries)), repeats)
+    schedule = entries.iloc[positions].reset_index(drop=True)
+
+    schedule = schedule.astype({"observed": bool, "fieldID": int})
+    schedule["obsHistID"] = range(len(schedule))
+
+    validate_schedule_df(schedule)
+    return schedule
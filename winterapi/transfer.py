@@ -0,0 +1,284 @@
+"""
+Module for streaming downloads, with progress reporting, stall detection and
+integrity checks
+"""
+
+import base64
+import hashlib
+import logging
+import time
+from collections import deque
+from typing import BinaryIO, Callable, Iterator, Optional
+
+import requests
+from pydantic import BaseModel, Field
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError, SSLError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 2**16
+MIN_CHUNK_SIZE = 2**13
+MAX_CHUNK_SIZE = 2**23
+TARGET_CHUNK_TIME = 0.1
+DEFAULT_STALL_WINDOW = 10.0
+DEFAULT_PROGRESS_INTERVAL = 0.5
+
+
+class StalledTransferError(requests.exceptions.RequestException):
+    """Error raised when a transfer is slower than the minimum allowed rate"""
+
+
+class IntegrityError(requests.exceptions.RequestException):
+    """Error raised when a transfer does not match its expected checksum"""
+
+
+def get_expected_digest(headers: dict, hash_name: str = "sha256") -> str | None:
+    """
+    Get the expected hex digest of a response from its headers, if provided.
+
+    Both the standard 'Digest' header (e.g. 'sha-256=<base64>') and an
+    'X-Checksum-<algorithm>' header with a hex digest are supported.
+
+    :param headers: Response headers
+    :param hash_name: Name of the hash algorithm
+    :return: Expected hex digest, or None
+    """
+    hex_header = f"X-Checksum-{hash_name.capitalize()}"
+    if hex_header in headers:
+        return headers[hex_header].strip().lower()
+
+    if "Digest" in headers:
+        for entry in headers["Digest"].split(","):
+            algorithm, _, value = entry.strip().partition("=")
+            if algorithm.lower().replace("-", "") == hash_name.lower():
+                return base64.b64decode(value).hex()
+
+    return None
+
+
+class TransferProgress(BaseModel):
+    """
+    Progress of a transfer
+    """
+
+    bytes_received: int = Field(default=0, ge=0)
+    total_bytes: Optional[int] = Field(default=None)
+    elapsed: float = Field(default=0.0, ge=0.0, title="Elapsed time (s)")
+    instantaneous_rate: float = Field(default=0.0, title="Recent rate (bytes/s)")
+    average_rate: float = Field(default=0.0, title="Average rate (bytes/s)")
+    chunk_size: int = Field(default=DEFAULT_CHUNK_SIZE)
+    finished: bool = Field(default=False)
+
+
+class Transfer:  # pylint: disable=too-many-instance-attributes
+    """
+    Class to stream a response to a file, with progress reporting.
+
+    If chunk_size is None, the chunk size adapts so that each read takes
+    roughly TARGET_CHUNK_TIME. If min_rate is set, a transfer whose rate over
+    the last stall_window seconds drops below min_rate (bytes/s) is aborted
+    with a StalledTransferError, so that it can be retried. Each read then
+    waits at most stall_window seconds, so that a transfer which receives
+    nothing at all is also aborted.
+
+    Errors while reading are raised as the same requests exceptions as
+    Response.iter_content would raise.
+
+    The checksum of the content is computed as it is written, and compared to
+    any checksum provided by the server.
+
+    A transfer holds the state of one write at a time, so concurrent downloads
+    should each use their own copy.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        chunk_size: int | None = None,
+        progress_callback: Callable[[TransferProgress], None] | None = None,
+        min_rate: float | None = None,
+        stall_window: float = DEFAULT_STALL_WINDOW,
+        progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+        hash_name: str | None = "sha256",
+    ):
+        self.chunk_size = chunk_size
+        self.progress_callback = progress_callback
+        self.min_rate = min_rate
+        self.stall_window = stall_window
+        self.progress_interval = progress_interval
+        self.hash_name = hash_name
+        self.hexdigest = None
+        self.progress = TransferProgress()
+        self._start = None
+        self._history = deque()
+
+    def copy(self) -> "Transfer":
+        """
+        Get a new transfer with the same settings, and no state.
+
+        :return: Transfer
+        """
+        return Transfer(
+            chunk_size=self.chunk_size,
+            progress_callback=self.progress_callback,
+            min_rate=self.min_rate,
+            stall_window=self.stall_window,
+            progress_interval=self.progress_interval,
+            hash_name=self.hash_name,
+        )
+
+    def iter_chunks(self, resp: requests.Response) -> Iterator[bytes]:
+        """
+        Iterate over the content of a response.
+
+        :param resp: Streamed response
+        :return: Iterator of chunks
+        """
+        chunk_size = (
+            self.chunk_size if self.chunk_size is not None else DEFAULT_CHUNK_SIZE
+        )
+
+        # Responses which are already in memory (e.g. replayed) have no raw stream
+        if resp.raw is None or getattr(resp, "_content_consumed", False):
+            yield from resp.iter_content(chunk_size=chunk_size)
+            return
+
+        self._limit_read_time(resp)
+
+        while True:
+            start = time.perf_counter()
+            chunk = self._read(resp, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+            if self.chunk_size is None:
+                duration = time.perf_counter() - start
+                if duration < 0.5 * TARGET_CHUNK_TIME:
+                    chunk_size = min(2 * chunk_size, MAX_CHUNK_SIZE)
+                elif duration > 2.0 * TARGET_CHUNK_TIME:
+                    chunk_size = max(chunk_size // 2, MIN_CHUNK_SIZE)
+                self.progress.chunk_size = chunk_size
+
+    def _limit_read_time(self, resp: requests.Response):
+        """
+        Limit the time each read of a response waits to the stall window,
+        if stalls are detected and the response is read from a socket.
+
+        :param resp: Streamed response
+        :return: None
+        """
+        sock = getattr(getattr(resp.raw, "connection", None), "sock", None)
+        if self.min_rate is None or sock is None:
+            return
+        timeout = sock.gettimeout()
+        sock.settimeout(
+            self.stall_window if timeout is None else min(timeout, self.stall_window)
+        )
+
+    def _read(self, resp: requests.Response, chunk_size: int) -> bytes:
+        """
+        Read a chunk of a response, raising errors as requests exceptions.
+
+        :param resp: Streamed response
+        :param chunk_size: Maximum number of bytes to read
+        :return: Chunk, empty at the end of the content
+        """
+        try:
+            return resp.raw.read(chunk_size, decode_content=True)
+        except ProtocolError as exc:
+            raise requests.exceptions.ChunkedEncodingError(exc) from exc
+        except DecodeError as exc:
+            raise requests.exceptions.ContentDecodingError(exc) from exc
+        except ReadTimeoutError as exc:
+            if self.min_rate is not None:
+                err = f"Transfer stalled: no data received for {self.stall_window} s"
+                logger.warning(err)
+                raise StalledTransferError(err) from exc
+            raise requests.exceptions.ConnectionError(exc) from exc
+        except SSLError as exc:
+            raise requests.exceptions.SSLError(exc) from exc
+
+    def _update(self, n_bytes: int):
+        """
+        Update the progress of the transfer, checking for a stall.
+
+        :param n_bytes: Number of new bytes received
+        :return: None
+        """
+        now = time.perf_counter()
+        self._history.append((now, n_bytes))
+        while now - self._history[0][0] > self.stall_window:
+            self._history.popleft()
+
+        window = max(min(now - self._start, self.stall_window), 1.0e-6)
+        recent_bytes = sum(x[1] for x in self._history)
+
+        self.progress.bytes_received += n_bytes
+        self.progress.elapsed = now - self._start
+        self.progress.instantaneous_rate = recent_bytes / window
+        self.progress.average_rate = self.progress.bytes_received / max(
+            self.progress.elapsed, 1.0e-6
+        )
+
+        if self.min_rate is not None and self.progress.elapsed > self.stall_window:
+            if self.progress.instantaneous_rate < self.min_rate:
+                err = (
+                    f"Transfer stalled: {self.progress.instantaneous_rate:.0f} B/s "
+                    f"over the last {self.stall_window:.0f} s is below the "
+                    f"minimum of {self.min_rate:.0f} B/s"
+                )
+                logger.warning(err)
+                raise StalledTransferError(err)
+
+    def _report(self):
+        if self.progress_callback is not None:
+            self.progress_callback(self.progress.model_copy())
+
+    def write(self, resp: requests.Response, output_f: BinaryIO):
+        """
+        Write the content of a streamed response to a file.
+
+        :param resp: Streamed response
+        :param output_f: File to write to
+        :return: None
+        """
+        total_bytes = resp.headers.get("Content-Length")
+        self.progress = TransferProgress(
+            total_bytes=int(total_bytes) if total_bytes is not None else None,
+            chunk_size=(
+                self.chunk_size if self.chunk_size is not None else DEFAULT_CHUNK_SIZE
+            ),
+        )
+        self._start = time.perf_counter()
+        self._history = deque()
+        last_report = self._start
+        digest = hashlib.new(self.hash_name) if self.hash_name is not None else None
+
+        for chunk in self.iter_chunks(resp):
+            output_f.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            self._update(len(chunk))
+            if time.perf_counter() - last_report > self.progress_interval:
+                last_report = time.perf_counter()
+                self._report()
+
+        self.progress.finished = True
+        self._report()
+
+        if digest is not None:
+            self.hexdigest = digest.hexdigest()
+            expected = get_expected_digest(resp.headers, hash_name=self.hash_name)
+            if expected is not None and expected != self.hexdigest:
+                err = (
+                    f"Checksum mismatch for transfer: expected {self.hash_name} "
+                    f"{expected}, but received {self.hexdigest}"
+                )
+                logger.error(err)
+                raise IntegrityError(err)
+
+        logger.debug(
+            f"Transferred {self.progress.bytes_received} bytes in "
+            f"{self.progress.elapsed:.2f} s "
+            f"({self.progress.average_rate / 2**20:.2f} MiB/s)"
+        )
@@ -0,0 +1,33 @@
+"""
+Module with general utility functions
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def get_batches(entries: list, batch_size: int | None) -> list[list]:
+    """
+    Split a list into batches.
+
+    :param entries: List to split
+    :param batch_size: Maximum size of each batch, or None for a single batch
+    :return: List of batches
+    """
+    if batch_size is None:
+        return [entries] if len(entries) > 0 else []
+    return [entries[i : i + batch_size] for i in range(0, len(entries), batch_size)]
+
+
+def get_nightdates(nightdates: pd.Series) -> np.ndarray:
+    """
+    Convert a column of night dates to integers of the form YYYYMMDD.
+
+    The server returns night dates as ISO strings (e.g. "2024-02-25"), while
+    queries use YYYYMMDD, so both forms are accepted.
+
+    :param nightdates: Night dates
+    :return: Night dates as integers
+    """
+    dates = pd.to_datetime(nightdates.astype(str), format="mixed")
+    return dates.dt.strftime("%Y%m%d").astype(int).to_numpy()
@@ -0,0 +1,308 @@
+"""
+Module for watching for new images, and downloading them as they arrive.
+
+A watcher polls a set of image queries, each time only asking for the nights
+since the latest image it has already seen. New images are downloaded into an
+image store by a pool of background workers, and callbacks are run as soon as
+each image is available locally.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+import requests
+from astropy.time import Time
+from wintertoo.models import (
+    ConeImageQuery,
+    ProgramImageQuery,
+    RectangleImageQuery,
+    TargetImageQuery,
+)
+from wintertoo.utils import get_date
+
+from winterapi.image_store import ImageStore
+from winterapi.messenger import WinterAPI
+from winterapi.transfer import Transfer
+from winterapi.utils import get_batches, get_nightdates
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 60.0
+DEFAULT_DOWNLOAD_WORKERS = 2
+DEFAULT_MAX_RETRIES = 3
+
+ImageQuery = TargetImageQuery | RectangleImageQuery | ConeImageQuery | ProgramImageQuery
+ImageCallback = Callable[[dict, Path], None]
+
+
+class ImageWatcher:  # pylint: disable=too-many-instance-attributes
+    """
+    Class to watch image queries, and download new images in the background.
+
+    :param winter: WinterAPI instance
+    :param queries: Image queries to watch, e.g. for targets or programs
+    :param store: Image store to download into
+    :param callbacks: Functions called with the image summary row and local
+        path of each image, once it has been downloaded
+    :param poll_interval: Time between polls of the server, in seconds
+    :param max_workers: Number of concurrent downloads
+    :param max_store_bytes: Maximum size of the store, above which downloads
+        are deferred until space is freed
+    :param batch_size: Number of images to download per request
+    :param transfer: Transfer settings (chunking, progress, stall detection),
+        copied for each download
+    :param max_retries: Number of times a failed download is retried on later
+        polls, before the image is given up on and added to failed
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        winter: WinterAPI,
+        queries: list[ImageQuery] | ImageQuery,
+        store: ImageStore | None = None,
+        callbacks: list[ImageCallback] | None = None,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        max_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+        max_store_bytes: int | None = None,
+        batch_size: int | None = None,
+        transfer: Transfer | None = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ):
+        if not isinstance(queries, list):
+            queries = [queries]
+
+        self.winter = winter
+        self.queries = queries
+        self.store = store if store is not None else ImageStore()
+        self.callbacks = list(callbacks) if callbacks is not None else []
+        self.poll_interval = poll_interval
+        self.max_store_bytes = max_store_bytes
+        self.batch_size = batch_size
+        self.transfer = transfer
+        self.max_retries = max_retries
+
+        self.last_dates = [None] * len(queries)
+        self.seen = set()
+        self.pending = {}
+        self.failures = {}
+        self.failed = {}
+        self._lock = threading.Lock()
+        self._futures = []
+        self._max_workers = max_workers
+        self._executor = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_callback(self, callback: ImageCallback):
+        """
+        Add a function to call for each downloaded image.
+
+        :param callback: Function called with the image summary row and local path
+        :return: None
+        """
+        self.callbacks.append(callback)
+
+    def get_incremental_query(self, i: int) -> ImageQuery:
+        """
+        Get a query for the nights since the latest image seen for a query.
+
+        :param i: Index of the query
+        :return: Query, ending today
+        """
+        query = self.queries[i]
+        today = get_date(Time.now())
+        start_date = query.start_date
+        if self.last_dates[i] is not None:
+            start_date = max(start_date, self.last_dates[i])
+        return query.model_copy(
+            update={"start_date": min(start_date, today), "end_date": today}
+        )
+
+    def is_over_budget(self) -> bool:
+        """
+        Check whether the store has reached its disk budget.
+
+        :return: boolean
+        """
+        if self.max_store_bytes is None:
+            return False
+        return self.store.get_size() >= self.max_store_bytes
+
+    def poll(self) -> list[Future]:
+        """
+        Query the server once for new images, and queue them for download.
+
+        :return: Futures for the downloads queued by this poll
+        """
+        for i in range(len(self.queries)):
+            query = self.get_incremental_query(i)
+            try:
+                _, images = self.winter.query_images(query=query)
+            except (requests.exceptions.RequestException, ValueError) as exc:
+                logger.error(f"Could not query images for {query}: {exc}")
+                continue
+
+            if len(images) == 0:
+                continue
+
+            last_date = int(get_nightdates(images["nightdate"]).max())
+            if self.last_dates[i] is None or last_date > self.last_dates[i]:
+                self.last_dates[i] = last_date
+
+            with self._lock:
+                for image in images.to_dict(orient="records"):
+                    key = (query.program_name, query.image_type, image["savepath"])
+                    if key not in self.seen:
+                        self.seen.add(key)
+                        self.pending[key] = image
+
+        if self.is_over_budget():
+            logger.warning(
+                f"Image store is over its budget of {self.max_store_bytes} bytes, "
+                f"deferring {len(self.pending)} downloads"
+            )
+            return []
+
+        with self._lock:
+            groups = {}
+            for key, image in self.pending.items():
+                groups.setdefault(key[:2], []).append(image)
+            self.pending = {}
+
+        futures = []
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+            for (program_name, image_type), group in groups.items():
+                logger.info(f"Queueing {len(group)} new images for {program_name}")
+                for batch in get_batches(group, self.batch_size):
+                    futures.append(
+                        self._executor.submit(
+                            self._download, program_name, image_type, batch
+                        )
+                    )
+            self._futures = [x for x in self._futures if not x.done()] + futures
+
+        return futures
+
+    def _download(
+        self, program_name: str, image_type: str, images: list[dict]
+    ) -> dict[str, Path]:
+        """
+        Download a batch of images, and run the callbacks for each one.
+
+        Images which could not be downloaded are retried on the next poll, up
+        to max_retries times.
+
+        :param program_name: Name of the program
+        :param image_type: Type of image
+        :param images: Image summary rows
+        :return: Dictionary of server path to local path
+        """
+        paths = [x["savepath"] for x in images]
+        try:
+            local_paths = self.winter.download_images_to_store(
+                program_name=program_name,
+                paths=paths,
+                image_type=image_type,
+                store=self.store,
+                transfer=self.transfer.copy() if self.transfer is not None else None,
+            )
+        except (requests.exceptions.RequestException, ValueError, OSError) as exc:
+            logger.error(f"Could not download {len(paths)} images: {exc}")
+            local_paths = [None] * len(paths)
+
+        downloaded = {}
+        for image, local_path in zip(images, local_paths):
+            key = (program_name, image_type, image["savepath"])
+            if local_path is None:
+                self._retry(key, image)
+                continue
+
+            with self._lock:
+                self.failures.pop(key, None)
+            downloaded[image["savepath"]] = local_path
+            for callback in self.callbacks:
+                try:
+                    callback(image, local_path)
+                except Exception:  # pylint: disable=broad-exception-caught
+                    logger.exception(f"Callback failed for {image['savepath']}")
+
+        return downloaded
+
+    def _retry(self, key: tuple, image: dict):
+        """
+        Queue a failed download to be retried, unless it has failed too often.
+
+        :param key: Key of the image
+        :param image: Image summary row
+        :return: None
+        """
+        with self._lock:
+            self.failures[key] = self.failures.get(key, 0) + 1
+            if self.failures[key] > self.max_retries:
+                logger.error(
+                    f"Giving up on {image['savepath']} after "
+                    f"{self.failures.pop(key)} failed downloads"
+                )
+                self.failed[key] = image
+            else:
+                self.pending[key] = image
+
+    def wait(self):
+        """
+        Wait for all queued downloads to finish.
+
+        :return: None
+        """
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.result()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Image watcher poll failed")
+            self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """
+        Start polling in a background thread.
+
+        :return: None
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True):
+        """
+        Stop polling, and optionally wait for queued downloads to finish.
+        The watcher can be started again afterwards.
+
+        :param wait: Whether to wait for queued downloads
+        :return: None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()